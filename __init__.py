@@ -1,15 +1,38 @@
-from flask import Flask, render_template, request, jsonify
-from flasgger import Swagger
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 
+import functools
+import hmac
 import json
 import logging
+import os
+import queue
+from pathlib import Path
+from typing import Optional
 
 import util.avalon_game_state as ags
-from util.avalon import AvalonDB
-
-logging.basicConfig(level=logging.DEBUG)
+from util.avalon import (AvalonDB, AvalonDBConfig, DEFAULT_SEARCH_LIMIT, DEFAULT_WRITE_ATTEMPTS, GAME_FIELDS,
+                         VERSION_CONFLICT, retry_on_conflict, to_ndjson)
+from util.avalon_inference import RoleInference
+from util.avalon_metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, AvalonMetrics
+from util.avalon_profiling import ProfilerConfig, RequestProfiler
+from util.avalon_tracing import DEFAULT_SLOW_QUERY_MS
+from util.avalon_pubsub import format_sse
+
+# Production start-up (AVALON_PRODUCTION=1) is kept fast for pre-forked,
+# autoscaled workers: flasgger is not imported until /apidocs/ is first
+# visited and /apispec.json is served from APISPEC_PATH (built with
+# `python __init__.py --write-apispec`, or on the first request if missing),
+# logging is left to the server, and the database is opened and migrated on
+# first use rather than at import.
+PRODUCTION = os.environ.get('AVALON_PRODUCTION') == '1'
+APISPEC_PATH = Path(__file__).parent / 'static' / 'apispec.json'
+
+if not PRODUCTION:
+    logging.basicConfig(level=logging.DEBUG)
 app = Flask(__name__)
-APP_IS_DEBUG = True
+APP_IS_DEBUG = not PRODUCTION
+# Seconds between keep-alive comments on idle event streams
+STREAM_HEARTBEAT_SECONDS = 15
 
 swagger_config = {
     "headers": [],
@@ -38,10 +61,171 @@ swagger_template = {
     "schemes": ["http"]
 }
 
-swagger = Swagger(app, config=swagger_config, template=swagger_template)
 
+def build_apispec() -> dict:
+    """
+    The Swagger spec of every route, generated by flasgger
+
+    Works after the app has started serving: the routes are copied onto a
+    scratch app, so flasgger never has to register anything on this one.
+    """
+    from flasgger import Swagger
+
+    scratch = Flask(__name__)
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint not in ('static', 'apispec'):
+            scratch.add_url_rule(rule.rule, rule.endpoint, app.view_functions[rule.endpoint], methods=rule.methods)
+    spec_swagger = Swagger(scratch, config=swagger_config, template=swagger_template)
+    with scratch.test_request_context():
+        return spec_swagger.get_apispecs('apispec')
+
+
+if PRODUCTION:
+    _apispec = None
+
+    @app.route('/apispec.json')
+    def apispec():
+        global _apispec
+        if _apispec is None:
+            _apispec = APISPEC_PATH.read_bytes() if APISPEC_PATH.exists() else json.dumps(build_apispec()).encode()
+        return Response(_apispec, mimetype='application/json')
+
+    # The Swagger UI (/apidocs/ and its static files) is answered by a scratch
+    # flasgger app built on the first docs request; it reads /apispec.json above
+    _apidocs = None
+
+    def _with_apidocs(wsgi_app):
+        docs_paths = (swagger_config['specs_route'].rstrip('/'), swagger_config['static_url_path'])
+
+        def dispatch(environ, start_response):
+            global _apidocs
+            if not environ.get('PATH_INFO', '').startswith(docs_paths):
+                return wsgi_app(environ, start_response)
+            if _apidocs is None:
+                from flasgger import Swagger
+                docs = Flask(__name__)
+                Swagger(docs, config=swagger_config, template=swagger_template)
+                _apidocs = docs
+            return _apidocs.wsgi_app(environ, start_response)
+        return dispatch
+
+    app.wsgi_app = _with_apidocs(app.wsgi_app)
+else:
+    from flasgger import Swagger
+    swagger = Swagger(app, config=swagger_config, template=swagger_template)
+
+
+# Statement tracing (see /api/admin/queries) is on with AVALON_TRACE_QUERIES=1;
+# AVALON_SLOW_QUERY_MS sets the slow log threshold
+db = AvalonDB(AvalonDBConfig(  # Using default production config
+    defer_init=PRODUCTION,
+    trace_queries=os.environ.get('AVALON_TRACE_QUERIES') == '1',
+    slow_query_ms=float(os.environ.get('AVALON_SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS)),
+))
+if db.queries is not None:
+    db.queries.install(app)
+role_inference = RoleInference()
+# Per-request profiling (see /api/admin/profiles): AVALON_PROFILE_SAMPLE_RATE of
+# requests at random, and requests sending an X-Avalon-Profile header with the
+# AVALON_PROFILE_TOKEN value. The same token reads the profiles.
+profiler = RequestProfiler(ProfilerConfig(
+    sample_rate=float(os.environ.get('AVALON_PROFILE_SAMPLE_RATE', 0)),
+    header_token=os.environ.get('AVALON_PROFILE_TOKEN') or None,
+))
+profiler.install(app)
+# Prometheus metrics at /metrics, always on
+metrics = AvalonMetrics()
+metrics.install(app)
+metrics.instrument(db)
+# Bearer token of the /api/admin endpoints; they answer 404 while it is unset
+ADMIN_TOKEN = os.environ.get('AVALON_ADMIN_TOKEN') or None
+
+
+def _require_token(token: Optional[str]):
+    """Answer a route only for requests sending "Authorization: Bearer <token>"; 404 if token is unset"""
+    def decorator(view):
+        @functools.wraps(view)
+        def guarded(*args, **kwargs):
+            if not token:
+                return jsonify({'error': 'Not found'}), 404
+            if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+                return jsonify({'error': 'Unauthorized'}), 401
+            return view(*args, **kwargs)
+        return guarded
+    return decorator
+
+
+# A gzipped game body is another representation of the same version, so it
+# gets its own ETag: "<version>-gzip"
+GZIP_ETAG_SUFFIX = '-gzip'
+
+def _if_match_version():
+    """Game version the client pinned with an If-Match ETag, or None"""
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    for etag in request.if_match.as_set():
+        etag = etag.removesuffix(GZIP_ETAG_SUFFIX)
+        if etag.isdigit():
+            return int(etag)
+    return -1  # Not one of our ETags, so it can never match
+
+def _game_etag(version, compressed=False):
+    return f'{version}{GZIP_ETAG_SUFFIX}' if compressed else str(version)
+
+def _with_etag(response, version, compressed=False):
+    response.set_etag(_game_etag(version, compressed))
+    return response
+
+def _revalidate(response):
+    """Let clients cache a response but check its ETag before every reuse"""
+    response.cache_control.no_cache = True
+    return response
+
+def _update_game(game_id, change, expected_version=None):
+    """
+    Read-modify-write a game with a compare-and-swap on its version
+
+    change(game) returns (events, None) to append to the game's event log,
+    (new_state, None) to store a whole new state, or (None, error) to reject
+    the request. With an expected_version (from If-Match), a game that has
+    moved on is a 412; otherwise a lost race re-reads the game and retries.
 
-db = AvalonDB()  # Using default production config
+    Returns:
+        (new_version, None) on success, or (None, error_response)
+    """
+    outcome = {}
+
+    def write():
+        game = db.get_game_state(game_id)
+        if not game:
+            outcome['response'] = jsonify({'error': 'Game not found'}), 404
+            return False, None
+        version = game['version']
+        if expected_version is not None and version != expected_version:
+            return False, VERSION_CONFLICT
+
+        change_result, error = change(game)
+        if error:
+            outcome['response'] = jsonify({'error': error}), 400
+            return False, None
+        if isinstance(change_result, list):
+            success, error = db.append_game_events(game_id, change_result, version, game['state'])
+            outcome['version'] = version + len(change_result)
+        else:
+            success, error = db.update_game_state(game_id, change_result, version)
+            outcome['version'] = version + 1
+        if not success and error != VERSION_CONFLICT:
+            outcome['response'] = jsonify({'error': error or 'Invalid game state'}), 400
+        return success, error
+
+    attempts = 1 if expected_version is not None else DEFAULT_WRITE_ATTEMPTS
+    success, error = retry_on_conflict(write, attempts)
+    if success:
+        return outcome['version'], None
+    if error == VERSION_CONFLICT:
+        status = 412 if expected_version is not None else 409
+        return None, (jsonify({'error': 'Game was modified concurrently'}), status)
+    return None, outcome['response']
 
 @app.route('/')
 @app.route('/index')
@@ -156,7 +340,9 @@ def get_players():
                 type: object
     """
     players = db.get_all_players()
-    return jsonify({'players': players}), 200
+    response = _revalidate(jsonify({'players': players}))
+    response.add_etag()
+    return response.make_conditional(request)
 
 @app.route('/api/players/get_active', methods=['GET'])
 def get_active_players():
@@ -177,6 +363,47 @@ def get_active_players():
     players = db.get_active_players()
     return jsonify({'players': players}), 200
 
+@app.route('/api/players/<int:player_id>/stats', methods=['GET'])
+def get_player_stats(player_id):
+    """
+    Get a player's statistics over all ended games
+    ---
+    parameters:
+      - in: path
+        name: player_id
+        type: integer
+        required: true
+    responses:
+      200:
+        description: >
+          Counts of games, wins, votes, approvals, rejections, proposals and
+          quests, the matching rates (null when nothing was counted), and
+          win rate by role
+      404:
+        description: Player not found
+    """
+    if not db.get_player(player_id):
+        return jsonify({'error': 'Player not found'}), 404
+    return jsonify(db.get_player_stats(player_id)), 200
+
+@app.route('/api/stats/players', methods=['GET'])
+def get_all_player_stats():
+    """
+    Get statistics of every player over all ended games
+    ---
+    responses:
+      200:
+        description: Statistics of each player with at least one ended game
+        schema:
+          type: object
+          properties:
+            players:
+              type: array
+              items:
+                type: object
+    """
+    return jsonify({'players': db.get_player_stats()}), 200
+
 @app.route('/api/players/set_active', methods=['POST'])
 def set_player_active():
     """
@@ -231,11 +458,36 @@ def create_game():
 @app.route('/api/games/get', methods=['GET'])
 def get_games():
     """
-    Get all games
+    Get games, newest first
     ---
+    parameters:
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: Page size; all games if omitted
+      - in: query
+        name: cursor
+        type: string
+        required: false
+        description: next_cursor from the previous page
+      - in: query
+        name: active
+        type: integer
+        required: false
+        description: Only games with this active status (0 new, 1 started, 2 ended)
+      - in: query
+        name: fields
+        type: string
+        required: false
+        description: >
+          Comma-separated columns to return, from gameId, start_time, active,
+          version, player_ids, player_count, quests_succeeded, quests_failed
+          and state. Defaults to those of a single game (gameId, start_time,
+          active, version and state); leave out state for a cheap listing.
     responses:
       200:
-        description: List of all games
+        description: One page of games
         schema:
           type: object
           properties:
@@ -243,11 +495,21 @@ def get_games():
               type: array
               items:
                 type: object
+            next_cursor:
+              type: string
+      400:
+        description: Invalid limit, active status, cursor or fields
     """
-    games = db.get_games()
-    for game in games:
-        game['state'] = json.loads(game['state'])
-    return jsonify({'games': games}), 200
+    try:
+        limit = request.args.get('limit', type=int)
+        active = request.args.get('active', type=int)
+        fields = request.args['fields'].split(',') if 'fields' in request.args else GAME_FIELDS
+        if limit is not None and limit < 1:
+            raise ValueError('Limit must be positive')
+        games, next_cursor = db.list_games(limit, request.args.get('cursor'), active, fields)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'games': games, 'next_cursor': next_cursor}), 200
 
 @app.route('/api/games/<game_id>/get', methods=['GET'])
 def get_game_state(game_id):
@@ -259,16 +521,134 @@ def get_game_state(game_id):
         name: game_id
         type: string
         required: true
+      - in: header
+        name: If-None-Match
+        type: string
+        required: false
+        description: ETag of a previously fetched version
+    responses:
+      200:
+        description: >
+          Game state, with its version as the ETag. It is gzipped if the client
+          accepts it, and then tagged "<version>-gzip".
+      304:
+        description: Game unchanged since the If-None-Match version
+      404:
+        description: Game not found
+    """
+    # Check the version alone first so unchanged games skip loading the state
+    version = db.get_game_version(game_id)
+    if version is None:
+        return jsonify({'error': 'Game not found'}), 404
+    for compressed in (False, True):
+        if request.if_none_match.contains_weak(_game_etag(version, compressed)):
+            response = _with_etag(Response(status=304), version, compressed)
+            response.vary.add('Accept-Encoding')
+            return _revalidate(response)
+
+    # Serve the stored bytes of this version if an earlier request rendered them
+    accept_gzip = 'gzip' in request.accept_encodings
+    cached = db.responses.get(game_id, version, accept_gzip)
+    if cached is None:
+        game = db.get_game_state(game_id)
+        if not game:
+            return jsonify({'error': 'Game not found'}), 404
+        version = game['version']
+        body = jsonify(game).get_data()
+        cached = db.responses.put(game_id, version, body, accept_gzip)
+
+    body, compressed = cached
+    response = Response(body, mimetype=app.json.mimetype)
+    if compressed:
+        response.content_encoding = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return _revalidate(_with_etag(response, version, compressed)), 200
+
+@app.route('/api/games/<game_id>/inference', methods=['GET'])
+def get_role_inference(game_id):
+    """
+    Probability that each player in a game is evil, given the recorded fails
+    ---
+    parameters:
+      - in: path
+        name: game_id
+        type: string
+        required: true
+      - in: header
+        name: If-None-Match
+        type: string
+        required: false
+        description: ETag of a previously fetched version
     responses:
       200:
-        description: Game state
+        description: >
+          evil_count, the number of good/evil assignments consistent with the
+          rounds so far, and each player's evil_probability (null if none is)
+      304:
+        description: Game unchanged since the If-None-Match version
+      400:
+        description: Game doesn't have 5 to 10 players
       404:
         description: Game not found
     """
+    version = db.get_game_version(game_id)
+    if version is None:
+        return jsonify({'error': 'Game not found'}), 404
+    if request.if_none_match.contains_weak(str(version)):
+        return _revalidate(_with_etag(Response(status=304), version))
+
     game = db.get_game_state(game_id)
     if not game:
         return jsonify({'error': 'Game not found'}), 404
-    return jsonify(game), 200
+    try:
+        inference = role_inference.infer(game['state'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return _revalidate(_with_etag(jsonify(inference), game['version'])), 200
+
+@app.route('/api/games/<game_id>/stream', methods=['GET'])
+def stream_game(game_id):
+    """
+    Stream live changes to a game as Server-Sent Events
+    ---
+    parameters:
+      - in: path
+        name: game_id
+        type: string
+        required: true
+    produces:
+      - text/event-stream
+    responses:
+      200:
+        description: >
+          Event stream. `hello` carries the current version; `events` carries
+          logged mutations, `state` a whole new state, `status` the active
+          status and `note` a new note, each with the resulting version.
+          `resync` means updates were dropped and the game should be refetched.
+      404:
+        description: Game not found
+    """
+    version = db.get_game_version(game_id)
+    if version is None:
+        return jsonify({'error': 'Game not found'}), 404
+
+    subscription = db.broker.subscribe(game_id)
+
+    def frames():
+        try:
+            yield format_sse('hello', {'version': version})
+            while True:
+                try:
+                    yield subscription.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ': heartbeat\n\n'
+        finally:
+            db.broker.unsubscribe(game_id, subscription)
+
+    return Response(stream_with_context(frames()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Keep reverse proxies from buffering the stream
+    })
 
 @app.route('/api/games/<game_id>/players/add', methods=['POST'])
 def add_game_player(game_id):
@@ -289,6 +669,11 @@ def add_game_player(game_id):
           properties:
             player_id:
               type: integer
+      - in: header
+        name: If-Match
+        type: string
+        required: false
+        description: ETag of the game version this change was based on
     responses:
       200:
         description: Player added to game
@@ -296,6 +681,10 @@ def add_game_player(game_id):
         description: Missing required fields
       404:
         description: Game or player not found
+      409:
+        description: Game kept changing concurrently
+      412:
+        description: Game changed since the If-Match version
     """
     data = request.get_json()
     if not data or 'player_id' not in data:
@@ -303,24 +692,18 @@ def add_game_player(game_id):
 
     player_id = int(data['player_id'])
 
-    game = db.get_game_state(game_id)
-    if not game:
-        return jsonify({'error': 'Game not found'}), 404
-
     # Check if player exists
     player = db.get_player(player_id)
     if not player:
         return jsonify({'error': 'Player not found'}), 404
 
-    state = game['state']
-
     # Empty role; to be filled in at the end
-    state = ags.add_player(state, player_id, '')
+    version, error_response = _update_game(
+        game_id, lambda game: ([('add_player', {'player_id': player_id, 'role': ''})], None), _if_match_version())
+    if error_response:
+        return error_response
 
-    if not db.update_game_state(game_id, state):
-        return jsonify({'error': 'Invalid game state'}), 400
-
-    return jsonify({'message': 'Player added to game'}), 200
+    return _with_etag(jsonify({'message': 'Player added to game'}), version), 200
 
 @app.route('/api/games/<game_id>/players/addlatest', methods=['POST'])
 def add_latest_game_player(game_id):
@@ -329,17 +712,11 @@ def add_latest_game_player(game_id):
         return jsonify({'error': 'Player not found'}), 404
     player_id = player['player_id']
 
-    game = db.get_game_state(game_id)
-    if not game:
-        return jsonify({'error': 'Game not found'}), 404
-
-    state = game['state']
-
-    state = ags.add_player(state, player_id, '')
-
-    if not db.update_game_state(game_id, state):
-        return jsonify({'error', 'Invalid game state'}), 400
-    return jsonify({'message': 'Player added to game', 'player_id': player_id}), 200 
+    version, error_response = _update_game(
+        game_id, lambda game: ([('add_player', {'player_id': player_id, 'role': ''})], None), _if_match_version())
+    if error_response:
+        return error_response
+    return _with_etag(jsonify({'message': 'Player added to game', 'player_id': player_id}), version), 200
 
 @app.route('/api/games/<game_id>/players/remove', methods=['POST'])
 def remove_game_player(game_id):
@@ -360,6 +737,11 @@ def remove_game_player(game_id):
           properties:
             player_id:
               type: integer
+      - in: header
+        name: If-Match
+        type: string
+        required: false
+        description: ETag of the game version this change was based on
     responses:
       200:
         description: Player removed from game
@@ -367,6 +749,10 @@ def remove_game_player(game_id):
         description: Missing required fields or invalid game state
       404:
         description: Game not found
+      409:
+        description: Game kept changing concurrently
+      412:
+        description: Game changed since the If-Match version
     """
     data = request.get_json()
     if not data or 'player_id' not in data:
@@ -374,19 +760,17 @@ def remove_game_player(game_id):
 
     player_id = int(data['player_id'])
 
-    game = db.get_game_state(game_id)
-    if not game:
-        return jsonify({'error': 'Game not found'}), 404
-
-    state = game['state']
-    new_state = ags.remove_player(state, player_id)
-    if new_state is None:
-        return jsonify({'error': 'Player not in game'}), 400
+    def remove(game):
+        new_state = ags.remove_player(game['state'], player_id)
+        if new_state is None:
+            return None, 'Player not in game'
+        return new_state, None
 
-    if not db.update_game_state(game_id, new_state):
-        return jsonify({'error': 'Invalid game state'}), 400
+    version, error_response = _update_game(game_id, remove, _if_match_version())
+    if error_response:
+        return error_response
 
-    return jsonify({'message': 'Player removed from game'}), 200
+    return _with_etag(jsonify({'message': 'Player removed from game'}), version), 200
 
 @app.route('/api/games/<game_id>/quests/add', methods=['POST'])
 def add_quest(game_id):
@@ -398,6 +782,11 @@ def add_quest(game_id):
         name: game_id
         type: string
         required: true
+      - in: header
+        name: If-Match
+        type: string
+        required: false
+        description: ETag of the game version this change was based on
     responses:
       200:
         description: Quest added
@@ -405,18 +794,23 @@ def add_quest(game_id):
         description: Game not found
       400:
         description: Invalid game state
+      409:
+        description: Game kept changing concurrently
+      412:
+        description: Game changed since the If-Match version
     """
-    game = db.get_game_state(game_id)
-    if not game:
-        return jsonify({'error': 'Game not found'}), 404
+    quest_number = None
 
-    state = game['state']
-    state = ags.add_quest(state)
+    def add(game):
+        nonlocal quest_number
+        quest_number = len(game['state']['quests']) + 1
+        return [('add_quest', {})], None
 
-    if not db.update_game_state(game_id, state):
-        return jsonify({'error': 'Invalid game state'}), 400
+    version, error_response = _update_game(game_id, add, _if_match_version())
+    if error_response:
+        return error_response
 
-    return jsonify({'message': 'Quest added', 'questNumber': len(state['quests'])}), 200
+    return _with_etag(jsonify({'message': 'Quest added', 'questNumber': quest_number}), version), 200
 
 @app.route('/api/games/<game_id>/quests/<int:quest_number>/rounds/add', methods=['POST'])
 def add_round(game_id, quest_number):
@@ -454,6 +848,11 @@ def add_round(game_id, quest_number):
               type: array
               items:
                 type: string
+      - in: header
+        name: If-Match
+        type: string
+        required: false
+        description: ETag of the game version this change was based on
     responses:
       200:
         description: Round added
@@ -461,45 +860,51 @@ def add_round(game_id, quest_number):
         description: Missing required fields or invalid quest number/state
       404:
         description: Game not found
+      409:
+        description: Game kept changing concurrently
+      412:
+        description: Game changed since the If-Match version
     """
     data = request.get_json()
     if not data or 'team' not in data or 'king' not in data:
         return jsonify({'error': 'Missing required fields'}), 400
 
-    game = db.get_game_state(game_id)
-    if not game:
-        return jsonify({'error': 'Game not found'}), 404
-
     quest_index = ags.quest_number_to_index(quest_number)
-    state = game['state']
-
-    # Add the round with the proposed team
     team = [int(player_id) for player_id in data['team']]
     king = int(data['king'])
-    state = ags.add_round(state, quest_index, team, king)
-    if state is None:
-        return jsonify({'error': 'Invalid quest number'}), 400
+    round_index = None
 
-    round_index = len(state['quests'][quest_index]['rounds']) - 1
+    def add(game):
+        nonlocal round_index
+        state = game['state']
+        if quest_index < 0 or quest_index >= len(state['quests']):
+            return None, 'Invalid quest number'
 
-    # Update the round with approvals if provided and not empty
-    if 'approvals' in data:
-        # Filter out any empty strings from approvals list
-        approvals = [int(a) for a in data['approvals'] if a]
-        state = ags.update_approvals(state, quest_index, round_index, approvals)
+        round_index = len(state['quests'][quest_index]['rounds'])
 
-    # If failures were provided, update fails
-    if 'failures' in data:
-        state = ags.update_fails(state, quest_index, round_index, int(data['failures']))
+        # Add the round with the proposed team
+        events = [('add_round', {'quest_index': quest_index, 'team': team, 'king': king})]
 
-    if not db.update_game_state(game_id, state):
-        return jsonify({'error': 'Invalid game state'}), 400
+        # Update the round with approvals if provided and not empty
+        if 'approvals' in data:
+            # Filter out any empty strings from approvals list
+            approvals = [int(a) for a in data['approvals'] if a]
+            events.append(('update_approvals', {'quest_index': quest_index, 'round_index': round_index, 'approvals': approvals}))
 
-    return jsonify({
+        # If failures were provided, update fails
+        if 'failures' in data:
+            events.append(('update_fails', {'quest_index': quest_index, 'round_index': round_index, 'fails': int(data['failures'])}))
+        return events, None
+
+    version, error_response = _update_game(game_id, add, _if_match_version())
+    if error_response:
+        return error_response
+
+    return _with_etag(jsonify({
         'message': 'Round added',
         'questNumber': quest_number,
-        'roundNumber': len(state['quests'][quest_index]['rounds'])
-    }), 200
+        'roundNumber': round_index + 1
+    }), version), 200
 
 # Note-related endpoints
 @app.route('/api/games/<game_id>/notes/add', methods=['POST'])
@@ -568,6 +973,89 @@ def get_game_notes(game_id):
     notes = db.get_game_notes(game_id)
     return jsonify({'notes': notes}), 200
 
+@app.route('/api/notes/search', methods=['GET'])
+def search_notes():
+    """
+    Search the notes of every game, best matches first
+    ---
+    parameters:
+      - in: query
+        name: q
+        type: string
+        required: true
+        description: Words that must all appear in a note; end a word with * to match a prefix
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: Page size, 20 by default
+      - in: query
+        name: cursor
+        type: string
+        required: false
+        description: next_cursor from the previous page
+      - in: query
+        name: game_id
+        type: string
+        required: false
+        description: Only search this game's notes
+      - in: query
+        name: since
+        type: string
+        required: false
+        description: Only notes written at or after this ISO date or time
+      - in: query
+        name: until
+        type: string
+        required: false
+        description: Only notes written before this ISO date or time
+    responses:
+      200:
+        description: >
+          One page of notes with noteId, gameId, timestamp and a snippet of the
+          content with matches wrapped in <mark> (the note text is not escaped)
+        schema:
+          type: object
+          properties:
+            notes:
+              type: array
+              items:
+                type: object
+            next_cursor:
+              type: string
+      400:
+        description: Missing query, or invalid limit, date or cursor
+    """
+    try:
+        limit = request.args.get('limit', DEFAULT_SEARCH_LIMIT, type=int)
+        if limit < 1:
+            raise ValueError('Limit must be positive')
+        notes, next_cursor = db.search_notes(
+            request.args.get('q', ''), limit, request.args.get('cursor'),
+            request.args.get('game_id'), request.args.get('since'), request.args.get('until')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'notes': notes, 'next_cursor': next_cursor}), 200
+
+@app.route('/api/export', methods=['GET'])
+def export_data():
+    """
+    Download every player, game and note as newline-delimited JSON
+    ---
+    produces:
+      - application/x-ndjson
+    responses:
+      200:
+        description: >
+          One JSON record per line with a type of player, game or note. Players
+          come first, then each game followed by its notes. Load it back with
+          `python -m util.avalon_cli import`.
+    """
+    response = Response(stream_with_context(to_ndjson(db.export_records())), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = 'attachment; filename=avalon.ndjson'
+    return response
+
 @app.route('/api/games/<game_id>/start', methods=['POST'])
 def start_game(game_id):
     """
@@ -587,10 +1075,10 @@ def start_game(game_id):
     success = db.set_game_active_status(game_id, 1)
     if not success:
         return jsonify({'error': 'Game not found'}), 404
-    response, status = add_quest(game_id)
-    if response != 200:
-        return response, status
-    return jsonify({'message': 'Game started'}), 200
+    version, error_response = _update_game(game_id, lambda game: ([('add_quest', {})], None))
+    if error_response:
+        return error_response
+    return _with_etag(jsonify({'message': 'Game started'}), version), 200
 
 @app.route('/api/games/<game_id>/end', methods=['POST'])
 def end_game(game_id):
@@ -648,5 +1136,158 @@ def update_player_name():
         return jsonify({'error': 'Player not found'}), 404
     return jsonify({'message': 'Player name updated'}), 200
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Prometheus metrics of this worker
+    ---
+    produces:
+      - text/plain
+    responses:
+      200:
+        description: >
+          Request counts, 5xx counts and latency histograms per route, AvalonDB
+          method and validation timings, pooled connections and cache lookups,
+          in the Prometheus text format
+    """
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/api/admin/profiles', methods=['GET'])
+@_require_token(profiler.config.header_token)
+def list_profiles():
+    """
+    List recent request profiles, newest first
+    ---
+    parameters:
+      - in: header
+        name: Authorization
+        type: string
+        required: true
+        description: Bearer AVALON_PROFILE_TOKEN
+    responses:
+      200:
+        description: Summaries of the kept profiles (method, path, status, duration, sample count)
+      401:
+        description: Missing or wrong profile token
+      404:
+        description: No profile token is configured
+    """
+    return jsonify(profiler.list_profiles()), 200
+
+@app.route('/api/admin/profiles/<int:profile_id>', methods=['GET'])
+@_require_token(profiler.config.header_token)
+def get_profile(profile_id):
+    """
+    Get the hot functions of a request profile
+    ---
+    parameters:
+      - in: path
+        name: profile_id
+        type: integer
+        required: true
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: Number of functions to return
+      - in: header
+        name: Authorization
+        type: string
+        required: true
+        description: Bearer AVALON_PROFILE_TOKEN
+    responses:
+      200:
+        description: Profile summary with its functions by samples taken in them
+      401:
+        description: Missing or wrong profile token
+      404:
+        description: Profile not found, or no profile token is configured
+    """
+    profile = profiler.get_profile(profile_id)
+    if profile is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    limit = request.args.get('limit', default=profiler.config.top_functions, type=int)
+    return jsonify({**profile.summary(), 'functions': profile.hot_functions(limit)}), 200
+
+@app.route('/api/admin/profiles/<int:profile_id>/stacks', methods=['GET'])
+@_require_token(profiler.config.header_token)
+def get_profile_stacks(profile_id):
+    """
+    Get the sampled stacks of a request profile for a flame graph
+    ---
+    produces:
+      - text/plain
+    parameters:
+      - in: path
+        name: profile_id
+        type: integer
+        required: true
+      - in: header
+        name: Authorization
+        type: string
+        required: true
+        description: Bearer AVALON_PROFILE_TOKEN
+    responses:
+      200:
+        description: Collapsed stacks, one "frame;frame;frame count" line each (flamegraph.pl, speedscope)
+      401:
+        description: Missing or wrong profile token
+      404:
+        description: Profile not found, or no profile token is configured
+    """
+    profile = profiler.get_profile(profile_id)
+    if profile is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return Response(profile.collapsed_stacks(), mimetype='text/plain'), 200
+
+if db.queries is not None:
+    @app.route('/api/admin/queries', methods=['GET'])
+    @_require_token(ADMIN_TOKEN)
+    def get_query_report():
+        """
+        Get SQL statement statistics
+        ---
+        parameters:
+          - in: header
+            name: Authorization
+            type: string
+            required: true
+            description: Bearer AVALON_ADMIN_TOKEN
+        responses:
+          200:
+            description: >
+              Statement shapes and database time per route, the latest slow
+              statements, requests that ran the same statement shape repeatedly
+              (N+1 patterns), and the latest requests
+          401:
+            description: Missing or wrong admin token
+          404:
+            description: No admin token is configured
+        """
+        return jsonify(db.queries.report()), 200
+
+_asgi_app = None
+
+def __getattr__(name):
+    # asgi_app: the same routes for ASGI servers (uvicorn __init__:asgi_app), with
+    # event streams held on the event loop instead of a thread each. Built on
+    # first access so WSGI workers never import asyncio.
+    global _asgi_app
+    if name != 'asgi_app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _asgi_app is None:
+        from util.avalon_asgi import AvalonASGI
+        _asgi_app = AvalonASGI(app, db, STREAM_HEARTBEAT_SECONDS)
+    return _asgi_app
+
 if __name__ == '__main__':
-    app.run(port=8000, debug=APP_IS_DEBUG)
+    import argparse
+    parser = argparse.ArgumentParser(description='Avalon game notes server')
+    parser.add_argument('--write-apispec', action='store_true',
+                        help=f'Write the Swagger spec to {APISPEC_PATH} for production workers and exit '
+                             '(run with AVALON_PRODUCTION=1 for the production host)')
+    args = parser.parse_args()
+    if args.write_apispec:
+        APISPEC_PATH.write_text(json.dumps(build_apispec(), indent=2) + '\n')
+    else:
+        app.run(port=8000, debug=APP_IS_DEBUG)
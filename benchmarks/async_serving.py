@@ -0,0 +1,169 @@
+"""
+Game reads while thousands of event streams sit idle, threaded Flask vs ASGI
+
+Starts the app in a server process on a temporary database, once under
+Werkzeug's threaded server (a thread per connection) and once under uvicorn
+with asgi_app, opens `--idle` event streams to one game and leaves them
+quiet, then has `--clients` threads fetch the game as fast as they can.
+Reports read throughput and latency, and the server's threads and memory
+with the streams held open.
+
+Run from the repository root:
+    python -m benchmarks.async_serving --idle 1000 --clients 4 --seconds 5
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import logging
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SERVERS = ('flask', 'asgi')
+
+
+def load_site():
+    """The app module, imported the way a server would from the repository root"""
+    spec = importlib.util.spec_from_file_location('avalon_site', ROOT / '__init__.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    return module
+
+
+def serve(server: str, port: int):
+    site = load_site()
+    if server == 'flask':
+        from werkzeug.serving import run_simple
+        run_simple('127.0.0.1', port, site.app, threaded=True)
+    else:
+        import uvicorn
+        uvicorn.run(site.asgi_app, host='127.0.0.1', port=port, log_level='warning', access_log=False,
+                    backlog=4096)
+
+
+def request(port: int, method: str, path: str, body=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+    conn.request(method, path, json.dumps(body) if body is not None else None, headers)
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    return response.status, data
+
+
+def wait_for_server(port: int, process: subprocess.Popen):
+    deadline = time.perf_counter() + 30
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('Server exited during startup')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('Server did not start')
+
+
+def open_stream(port: int, game_id: str) -> socket.socket:
+    sock = socket.create_connection(('127.0.0.1', port), timeout=30)
+    sock.sendall(f'GET /api/games/{game_id}/stream HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n'.encode())
+    received = b''
+    while b'event: hello' not in received:
+        chunk = sock.recv(4096)
+        if not chunk:
+            raise RuntimeError('Stream closed before its hello event')
+        received += chunk
+    return sock
+
+
+def server_usage(pid: int) -> tuple[int, float]:
+    """Threads and resident MiB of a process"""
+    fields = dict(line.split(':', 1) for line in Path(f'/proc/{pid}/status').read_text().splitlines())
+    return int(fields['Threads']), int(fields['VmRSS'].split()[0]) / 1024
+
+
+def run(server: str, port: int, idle: int, clients: int, seconds: float) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PYTHONPATH=str(ROOT))
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.async_serving', '--serve', server, '--port', str(port)],
+            cwd=tmp, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        streams = []
+        try:
+            wait_for_server(port, process)
+            game_id = json.loads(request(port, 'POST', '/api/games/create')[1])['gameId']
+            for n in range(10):
+                player_id = json.loads(request(port, 'POST', '/api/players/add', {'name': f'Player {n}'})[1])['player_id']
+                request(port, 'POST', f'/api/games/{game_id}/players/add', {'player_id': player_id})
+
+            for _ in range(idle):
+                streams.append(open_stream(port, game_id))
+            threads, rss = server_usage(process.pid)
+
+            latencies = [[] for _ in range(clients)]
+            stop = time.perf_counter() + seconds
+
+            def client(n: int):
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                while time.perf_counter() < stop:
+                    start = time.perf_counter()
+                    conn.request('GET', f'/api/games/{game_id}/get')
+                    conn.getresponse().read()
+                    latencies[n].append(time.perf_counter() - start)
+                conn.close()
+
+            workers = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            for sock in streams:
+                sock.close()
+            process.terminate()
+            process.wait()
+
+    samples = sorted(latency for client_latencies in latencies for latency in client_latencies)
+    return {
+        'requests': len(samples) / elapsed,
+        'p50': statistics.median(samples) * 1e3,
+        'p99': samples[int(len(samples) * 0.99)] * 1e3,
+        'threads': threads,
+        'rss': rss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--idle', type=int, default=1000, help='Idle event streams held open')
+    parser.add_argument('--clients', type=int, default=4, help='Threads fetching the game')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--serve', choices=SERVERS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args.serve, args.port)
+
+    print(f'{args.idle} idle streams, {args.clients} clients')
+    print('server   req/s   p50 ms   p99 ms  threads  RSS MiB')
+    for server in SERVERS:
+        result = run(server, args.port, args.idle, args.clients, args.seconds)
+        print(f"{server:6} {result['requests']:7.0f} {result['p50']:8.2f} {result['p99']:8.2f} "
+              f"{result['threads']:8} {result['rss']:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
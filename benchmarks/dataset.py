@@ -0,0 +1,253 @@
+"""
+Fill a database with a large synthetic but realistic dataset
+
+Creates `--players` players, then `--games` games played with the real ags
+mutators (add_player, add_quest, add_round, update_approvals, update_fails):
+5 to 10 seated players, teams of the official sizes, approval votes, and
+fail cards played by a hidden evil side until one side wins three quests.
+Most games are over with their roles revealed; the rest are still being
+played. `--notes` notes are spread over the games.
+
+Games are built in chunks by a pool of worker processes, each into its own
+scratch database through AvalonDB.import_records, so validation, encoding and
+the normalized rows are all done in parallel. The target database then
+copies each finished chunk in with one INSERT ... SELECT per table, and
+builds its indexes and note search index once at the end. Every
+chunk has its own seed, so the same --seed gives the same data whatever the
+number of workers.
+
+Run from the repository root:
+    python -m benchmarks.dataset --env test --players 2000 --games 1000000 --notes 300000
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+import util.avalon_game_state as ags
+import util.avalon_normalized as normalized
+from util.avalon import STATE_CODECS, AvalonDB, AvalonDBConfig
+from util.avalon_inference import EVIL_COUNTS
+from util.avalon_migrations import NOTES_FTS_INSERT_TRIGGER
+
+QUEST_TEAM_SIZES = {5: [2, 3, 2, 3, 3], 6: [2, 3, 4, 3, 4], 7: [2, 3, 3, 4, 4],
+                    8: [3, 4, 4, 5, 5], 9: [3, 4, 4, 5, 5], 10: [3, 4, 4, 5, 5]}
+GOOD_ROLES = ['Merlin', 'Percival', 'Loyal Servant of Arthur']
+EVIL_ROLES = ['Assassin', 'Morgana', 'Mordred', 'Oberon', 'Minion of Mordred']
+FIRST_NAMES = ['Alice', 'Bob', 'Carol', 'Dave', 'Eve', 'Frank', 'Grace', 'Heidi', 'Ivan', 'Judy',
+               'Mallory', 'Niaj', 'Olivia', 'Peggy', 'Rupert', 'Sybil', 'Trent', 'Victor', 'Walter', 'Yara']
+NOTE_TEMPLATES = [
+    '{name} hesitated before approving the quest {quest} team',
+    'Quest {quest}: {name} pushed hard for their own team',
+    '{name} claimed Merlin after quest {quest}, nobody believed it',
+    'Suspicious vote from {name} on quest {quest}',
+    '{name} rejected every proposal until quest {quest}',
+    'Assassin guessed {name} as Merlin',
+    '{name} and the king disagreed loudly about the quest {quest} team',
+]
+# Share of games still being played
+ACTIVE_SHARE = 0.05
+# Games are spread over the HISTORY_DAYS before HISTORY_END (fixed, so a seed always gives the same data)
+HISTORY_END = datetime.datetime(2026, 1, 1, tzinfo=datetime.UTC)
+HISTORY_DAYS = 730
+GAMES_PER_CHUNK = 2000
+# Table rows are copied in this order, parents first
+COPY_TABLES = ('games', 'notes', *reversed(normalized.TABLES))
+
+
+def play_game(rng: random.Random, player_ids: List[int]) -> tuple[ags.GameState, bool]:
+    """A game among player_ids, and whether it was finished"""
+    num_players = len(player_ids)
+    num_evil = EVIL_COUNTS[num_players]
+    finished = rng.random() >= ACTIVE_SHARE
+    roles = rng.sample(EVIL_ROLES, num_evil) + rng.sample(GOOD_ROLES, 2)
+    roles += ['Loyal Servant of Arthur'] * (num_players - len(roles))
+    rng.shuffle(roles)
+    evil = {player_id for player_id, role in zip(player_ids, roles) if ags.get_role_side(role) == 'evil'}
+
+    state = ags.create_initial_game_state()
+    for player_id, role in zip(player_ids, roles):
+        state = ags.add_player(state, player_id, role if finished else '')
+    succeeded = failed = 0
+    king = rng.randrange(num_players)
+    quests_played = 5 if finished else rng.randint(0, 4)
+    for quest_index in range(quests_played):
+        if succeeded == ags.QUESTS_TO_WIN or failed == ags.QUESTS_TO_WIN:
+            break
+        state = ags.add_quest(state)
+        team_size = QUEST_TEAM_SIZES[num_players][quest_index]
+        for round_index in range(ags.MAX_PROPOSALS):
+            team = rng.sample(player_ids, team_size)
+            state = ags.add_round(state, quest_index, team, player_ids[king % num_players])
+            king += 1
+            approvals = [player_id for player_id in player_ids if rng.random() < 0.55]
+            state = ags.update_approvals(state, quest_index, round_index, approvals)
+            if len(approvals) * 2 > num_players or round_index == ags.MAX_PROPOSALS - 1:
+                fails = sum(rng.random() < 0.6 for player_id in team if player_id in evil)
+                state = ags.update_fails(state, quest_index, round_index, fails)
+                if fails:
+                    failed += 1
+                else:
+                    succeeded += 1
+                break
+    return state, finished
+
+
+def chunk_records(seed: int, chunk: int, num_games: int, num_notes: int, num_players: int) -> Iterator[Dict]:
+    """Records of one chunk of games and their notes, in import_records order"""
+    rng = random.Random(seed * 1_000_003 + chunk)
+    games = []
+    used = set()
+    for _ in range(num_games):
+        player_ids = rng.sample(range(1, num_players + 1), rng.randint(5, 10))
+        used.update(player_ids)
+        state, finished = play_game(rng, player_ids)
+        start = HISTORY_END - datetime.timedelta(seconds=rng.uniform(0, HISTORY_DAYS * 86400))
+        games.append((str(uuid.UUID(int=rng.getrandbits(128), version=4)), start, state, finished))
+
+    # Workers only need the players their games reference; the target already has them all
+    for player_id in sorted(used):
+        yield {'type': 'player', 'player_id': player_id, 'name': f'Player {player_id}'}
+    notes_per_game = [0] * num_games
+    for _ in range(num_notes):
+        notes_per_game[rng.randrange(num_games)] += 1
+    for (game_id, start, state, finished), note_count in zip(games, notes_per_game):
+        yield {'type': 'game', 'gameId': game_id, 'start_time': start.isoformat(),
+               'active': 2 if finished else 1, 'version': 0, 'state': state}
+        for n in range(note_count):
+            player_id = rng.choice(state['players'])['player_id']
+            content = rng.choice(NOTE_TEMPLATES).format(
+                name=f'{rng.choice(FIRST_NAMES)} ({player_id})', quest=rng.randint(1, max(1, len(state['quests']))))
+            timestamp = start + datetime.timedelta(minutes=5 * (n + 1))
+            yield {'type': 'note', 'noteId': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                   'gameId': game_id, 'timestamp': timestamp.isoformat(), 'content': content}
+
+
+def build_chunk(scratch: str, state_codec: str, seed: int, chunk: int, num_games: int, num_notes: int,
+                num_players: int) -> str:
+    """Write one chunk into its own database file (in a worker process); returns its path"""
+    logging.getLogger('util.avalon_game_state').setLevel(logging.WARNING)
+    logging.getLogger('util.avalon_migrations').setLevel(logging.WARNING)
+    data_dir = Path(scratch) / f'chunk-{chunk}'
+    data_dir.mkdir()
+    db = AvalonDB(AvalonDBConfig(env='test', data_dir=data_dir, pool_size=0, state_codec=state_codec))
+    db.import_records(chunk_records(seed, chunk, num_games, num_notes, num_players))
+    db.close()
+    return str(db.db_path)
+
+
+@contextmanager
+def deferred_indexes(conn: sqlite3.Connection):
+    """
+    Drop the secondary indexes and note search trigger of the copied tables
+    for the duration of a bulk load, then build them once from the loaded rows
+    """
+    tables = json.dumps(COPY_TABLES)
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+        "AND tbl_name IN (SELECT value FROM json_each(?))", (tables,)
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX {name}")
+    conn.execute("DROP TRIGGER IF EXISTS notes_fts_insert")
+    conn.commit()
+    try:
+        yield
+    finally:
+        for _, sql in indexes:
+            conn.execute(sql)
+        conn.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+        conn.execute(NOTES_FTS_INSERT_TRIGGER)
+        conn.execute("ANALYZE")
+        conn.commit()
+
+
+def copy_chunk(conn: sqlite3.Connection, path: str):
+    """Append a chunk's games, notes and normalized rows to the target in one transaction"""
+    conn.execute("ATTACH DATABASE ? AS chunk", (path,))
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            for table in COPY_TABLES:
+                columns = ', '.join(row[1] for row in cursor.execute(f"PRAGMA main.table_info({table})"))
+                cursor.execute(f"INSERT INTO main.{table} ({columns}) SELECT {columns} FROM chunk.{table}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    finally:
+        conn.execute("DETACH DATABASE chunk")
+    shutil.rmtree(Path(path).parent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--env', default='test', help='Database to fill: test or prod')
+    parser.add_argument('--data-dir', default=None, help='Directory holding the database files')
+    parser.add_argument('--state-codec', choices=STATE_CODECS, default='json', help='Codec the games are stored with')
+    parser.add_argument('--players', type=int, default=1000)
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--notes', type=int, default=3000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if args.players < 10:
+        parser.error('--players must be at least 10')
+    logging.getLogger('util.avalon_migrations').setLevel(logging.WARNING)
+
+    db = AvalonDB(AvalonDBConfig(env=args.env, data_dir=args.data_dir, state_codec=args.state_codec))
+    with db.get_connection() as conn:
+        if conn.execute("SELECT 1 FROM games LIMIT 1").fetchone() or conn.execute(
+                "SELECT 1 FROM players LIMIT 1").fetchone():
+            parser.error(f'{db.db_path} is not empty')
+    db.import_records({'type': 'player', 'player_id': player_id, 'name': f'Player {player_id}'}
+                      for player_id in range(1, args.players + 1))
+
+    chunks = range((args.games + GAMES_PER_CHUNK - 1) // GAMES_PER_CHUNK)
+
+    def share(total: int, chunk: int) -> int:
+        return total * (chunk + 1) // len(chunks) - total * chunk // len(chunks)
+
+    start = time.perf_counter()
+    done = 0
+
+    def copy_next():
+        nonlocal done
+        copy_chunk(conn, pending.popleft().result())
+        done += 1
+        print(f'\r{done}/{len(chunks)} chunks', end='', flush=True)
+
+    with tempfile.TemporaryDirectory(dir=Path(db.db_path).parent) as scratch, \
+            ProcessPoolExecutor(args.workers) as pool, db.get_connection() as conn, deferred_indexes(conn):
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(build_chunk, scratch, args.state_codec, args.seed, chunk,
+                                       share(args.games, chunk), share(args.notes, chunk), args.players))
+            # Keep a couple of chunks queued per worker, so finished ones never pile up on disk
+            if len(pending) > 2 * args.workers:
+                copy_next()
+        while pending:
+            copy_next()
+        print('\nIndexing...', end='', flush=True)
+    db.player_stats.invalidate()
+    elapsed = time.perf_counter() - start
+    print(f'\n{args.games} games and {args.notes} notes among {args.players} players '
+          f'in {elapsed:.1f}s ({args.games / elapsed:.0f} games/s) -> {db.db_path}')
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
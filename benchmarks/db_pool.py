@@ -0,0 +1,85 @@
+"""
+Requests per second through AvalonDB with and without connection pooling
+
+Replays the database calls made by the add_round endpoint (read the game,
+append a round, write it back) from several threads against a temporary
+database, once connecting per call (pool_size=0) and once pooled.
+
+Run from the repository root:
+    python -m benchmarks.db_pool --threads 8 --seconds 5
+"""
+import argparse
+import logging
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import util.avalon_game_state as ags
+from util.avalon import DEFAULT_POOL_SIZE, AvalonDB, AvalonDBConfig
+
+
+def setup_game(db: AvalonDB, num_players: int = 10) -> tuple[str, list[int]]:
+    player_ids = [db.add_player(f'Player {i}')[1] for i in range(num_players)]
+    game_id = db.create_game()
+    state = db.get_game_state(game_id)['state']
+    for player_id in player_ids:
+        state = ags.add_player(state, player_id)
+    state = ags.add_quest(state)
+    db.update_game_state(game_id, state)
+    return game_id, player_ids
+
+
+def add_round_request(db: AvalonDB, game_id: str, player_ids: list[int]):
+    game = db.get_game_state(game_id)
+    state = game['state']
+    quest_index = len(state['quests']) - 1
+    state = ags.add_round(state, quest_index, player_ids[:3], player_ids[0])
+    round_index = len(state['quests'][quest_index]['rounds']) - 1
+    state = ags.update_approvals(state, quest_index, round_index, player_ids[:6])
+    state = ags.update_fails(state, quest_index, round_index, 0)
+    db.update_game_state(game_id, state)
+    # Keep the game a constant size so both runs do the same work
+    db.update_game_state(game_id, ags.remove_round(state, quest_index, round_index))
+
+
+def run(pool_size: int, threads: int, seconds: float) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = AvalonDB(AvalonDBConfig(env="test", data_dir=Path(tmp), pool_size=pool_size))
+        game_id, player_ids = setup_game(db)
+        stop = time.perf_counter() + seconds
+        counts = [0] * threads
+
+        def worker(n: int):
+            while time.perf_counter() < stop:
+                add_round_request(db, game_id, player_ids)
+                counts[n] += 1
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        start = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - start
+        db.close()
+        return sum(counts) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE)
+    args = parser.parse_args()
+    logging.getLogger('util.avalon_game_state').setLevel(logging.WARNING)
+
+    before = run(0, args.threads, args.seconds)
+    after = run(args.pool_size, args.threads, args.seconds)
+    print(f'connect per call: {before:8.1f} req/s')
+    print(f'pooled ({args.pool_size:>2}):      {after:8.1f} req/s')
+    print(f'speedup:          {after / before:8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
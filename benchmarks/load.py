@@ -0,0 +1,244 @@
+"""
+Load test playing whole games through the HTTP API from concurrent tables
+
+Each simulated table plays `--games` games end to end the way the web UI
+does: create a game, register and seat 5 to 10 players, start it, propose
+teams round by round with approvals and fail cards until one side wins,
+jot notes, refetch the game after each change, and end it. Reports
+throughput and p50/p95/p99 latency per route, error statuses, and how many
+responses were SQLite busy/lock errors.
+
+Runs offline against the app in this process on a temporary database, or
+against a running server with --url.
+
+Run from the repository root:
+    python -m benchmarks.load --tables 8 --games 3
+    python -m benchmarks.load --url http://127.0.0.1:8000 --tables 32
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from benchmarks.async_serving import load_site
+
+QUEST_TEAM_SIZES = {5: [2, 3, 2, 3, 3], 6: [2, 3, 4, 3, 4], 7: [2, 3, 3, 4, 4],
+                    8: [3, 4, 4, 5, 5], 9: [3, 4, 4, 5, 5], 10: [3, 4, 4, 5, 5]}
+EVIL_COUNTS = {5: 2, 6: 2, 7: 3, 8: 3, 9: 3, 10: 4}
+MAX_PROPOSALS = 5
+
+# Response text of SQLite lock contention, whichever layer reported it
+LOCK_ERRORS = (b'database is locked', b'database table is locked', b'database is busy')
+
+
+class Recorder:
+    """Latencies and statuses per route, shared by every table"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Counter] = defaultdict(Counter)
+        self.lock_errors = 0
+
+    def record(self, route: str, seconds: float, status: int, body: bytes):
+        with self._lock:
+            self.latencies[route].append(seconds)
+            if status >= 400:
+                self.errors[route][status] += 1
+            if status >= 400 and any(error in body for error in LOCK_ERRORS):
+                self.lock_errors += 1
+
+
+class AppClient:
+    """Requests through the Flask test client, in this process"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method: str, path: str, body=None, headers=None) -> Tuple[int, Dict, bytes]:
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, response.headers, response.get_data()
+
+
+class HttpClient:
+    """Requests over one keep-alive connection to a running server"""
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+
+    def request(self, method: str, path: str, body=None, headers=None) -> Tuple[int, Dict, bytes]:
+        headers = dict(headers or {})
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+            body = json.dumps(body)
+        try:
+            self.conn.request(method, path, body, headers)
+            response = self.conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            # The server dropped the keep-alive connection; retry once on a new one
+            self.conn.close()
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            self.conn.request(method, path, body, headers)
+            response = self.conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+
+
+class Table:
+    """One group of friends playing games back to back"""
+
+    def __init__(self, client, recorder: Recorder, rng: random.Random, think: float):
+        self.client = client
+        self.recorder = recorder
+        self.rng = rng
+        self.think = think
+        self.etag: Optional[str] = None
+
+    def call(self, method: str, route: str, path: str, body=None, headers=None) -> Tuple[int, Dict, bytes]:
+        start = time.perf_counter()
+        status, response_headers, data = self.client.request(method, path, body, headers)
+        self.recorder.record(f'{method} {route}', time.perf_counter() - start, status, data)
+        if self.think:
+            time.sleep(self.rng.expovariate(1 / self.think))
+        return status, response_headers, data
+
+    def refresh(self, game_id: str):
+        """Refetch the game as the UI does after each change, revalidating its ETag"""
+        headers = {'If-None-Match': self.etag} if self.etag else None
+        status, response_headers, _ = self.call('GET', '/api/games/<game_id>/get', f'/api/games/{game_id}/get',
+                                                headers=headers)
+        if status == 200:
+            self.etag = response_headers.get('ETag')
+
+    def note(self, game_id: str, text: str):
+        if self.rng.random() < 0.3:
+            self.call('POST', '/api/games/<game_id>/notes/add', f'/api/games/{game_id}/notes/add',
+                      {'content': text})
+
+    def play(self):
+        status, _, data = self.call('POST', '/api/games/create', '/api/games/create')
+        if status != 201:
+            return
+        game_id = json.loads(data)['gameId']
+        self.etag = None
+
+        num_players = self.rng.randint(5, 10)
+        player_ids = []
+        for seat in range(num_players):
+            status, _, data = self.call('POST', '/api/players/add', '/api/players/add',
+                                        {'name': f'Player {self.rng.getrandbits(48):x}'})
+            if status != 201:
+                continue
+            player_id = json.loads(data)['player_id']
+            self.call('POST', '/api/games/<game_id>/players/add', f'/api/games/{game_id}/players/add',
+                      {'player_id': player_id})
+            player_ids.append(player_id)
+        self.refresh(game_id)
+        if len(player_ids) < 5:
+            return
+        num_players = len(player_ids)
+        evil = set(self.rng.sample(player_ids, EVIL_COUNTS[num_players]))
+
+        self.call('POST', '/api/games/<game_id>/start', f'/api/games/{game_id}/start')
+        self.refresh(game_id)
+        succeeded = failed = 0
+        king = self.rng.randrange(num_players)
+        for quest_number in range(1, 6):
+            if succeeded == 3 or failed == 3:
+                break
+            if quest_number > 1:
+                self.call('POST', '/api/games/<game_id>/quests/add', f'/api/games/{game_id}/quests/add')
+                self.refresh(game_id)
+            team_size = QUEST_TEAM_SIZES[num_players][quest_number - 1]
+            for proposal in range(MAX_PROPOSALS):
+                team = self.rng.sample(player_ids, team_size)
+                approvals = [player_id for player_id in player_ids if self.rng.random() < 0.6]
+                body = {'team': team, 'king': player_ids[king % num_players], 'approvals': approvals}
+                approved = len(approvals) * 2 > num_players or proposal == MAX_PROPOSALS - 1
+                if approved:
+                    fails = sum(self.rng.random() < 0.6 for player_id in team if player_id in evil)
+                    body['failures'] = fails
+                king += 1
+                self.call('POST', '/api/games/<game_id>/quests/<int:quest_number>/rounds/add',
+                          f'/api/games/{game_id}/quests/{quest_number}/rounds/add', body)
+                self.refresh(game_id)
+                if approved:
+                    break
+            if body['failures']:
+                failed += 1
+                self.note(game_id, f'Quest {quest_number} failed with {body["failures"]} fails')
+            else:
+                succeeded += 1
+                self.note(game_id, f'Quest {quest_number} passed; someone on that team is probably good')
+
+        self.call('POST', '/api/games/<game_id>/end', f'/api/games/{game_id}/end')
+        self.call('GET', '/api/games/<game_id>/notes/get', f'/api/games/{game_id}/notes/get')
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted samples"""
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def report(recorder: Recorder, elapsed: float):
+    total = sum(len(samples) for samples in recorder.latencies.values())
+    print(f"{'route':64} {'count':>6} {'req/s':>7} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7}  errors")
+    for route in sorted(recorder.latencies):
+        samples = sorted(recorder.latencies[route])
+        errors = ' '.join(f'{status}x{count}' for status, count in sorted(recorder.errors[route].items()))
+        print(f"{route:64} {len(samples):6} {len(samples) / elapsed:7.1f} "
+              f"{percentile(samples, 0.50) * 1e3:7.2f} {percentile(samples, 0.95) * 1e3:7.2f} "
+              f"{percentile(samples, 0.99) * 1e3:7.2f}  {errors}")
+    print(f'\n{total} requests in {elapsed:.1f}s: {total / elapsed:.1f} req/s')
+    print(f'SQLite busy/lock errors: {recorder.lock_errors}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--tables', type=int, default=8, help='Tables playing at once')
+    parser.add_argument('--games', type=int, default=3, help='Games each table plays')
+    parser.add_argument('--think', type=float, default=0.0, help='Mean seconds between a table\'s requests')
+    parser.add_argument('--url', help='Server to load instead of the app in this process')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    logging.getLogger('util.avalon_game_state').setLevel(logging.WARNING)
+
+    tmp = None
+    if args.url is None:
+        # The app keeps its database under ./data, so give it a scratch directory
+        tmp = tempfile.TemporaryDirectory()
+        os.chdir(tmp.name)
+        app = load_site().app
+
+    recorder = Recorder()
+
+    def run_table(n: int):
+        client = HttpClient(args.url) if args.url else AppClient(app)
+        table = Table(client, recorder, random.Random(args.seed * 100003 + n), args.think)
+        for _ in range(args.games):
+            table.play()
+
+    tables = [threading.Thread(target=run_table, args=(n,)) for n in range(args.tables)]
+    start = time.perf_counter()
+    for table in tables:
+        table.start()
+    for table in tables:
+        table.join()
+    report(recorder, time.perf_counter() - start)
+    if tmp is not None:
+        os.chdir(Path(__file__).resolve().parent.parent)
+        tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Role inference time per recorded round, memoized and from scratch
+
+Plays random 10-player games of 5 quests (up to 5 proposals each) with a
+hidden evil team that fails some quests, and infers evil probabilities after
+every round, as the inference endpoint would be polled. The memoized engine
+only filters the survivors of the previous round; the baseline uses a fresh
+engine each time and enumerates every assignment.
+
+Run from the repository root:
+    python -m benchmarks.role_inference --games 200
+"""
+import argparse
+import logging
+import random
+import time
+
+import util.avalon_game_state as ags
+from util.avalon_inference import EVIL_COUNTS, RoleInference
+
+NUM_PLAYERS = 10
+NUM_QUESTS = 5
+TEAM_SIZES = [3, 4, 4, 5, 5]
+
+
+def play_game(rng: random.Random) -> list[ags.GameState]:
+    """States of one game after each of its rounds"""
+    player_ids = list(range(1, NUM_PLAYERS + 1))
+    evil = set(rng.sample(player_ids, EVIL_COUNTS[NUM_PLAYERS]))
+    state = ags.create_initial_game_state()
+    for player_id in player_ids:
+        state = ags.add_player(state, player_id)
+
+    states = []
+    for quest_index in range(NUM_QUESTS):
+        state = ags.add_quest(state)
+        for round_index in range(rng.randint(1, 5)):
+            team = rng.sample(player_ids, TEAM_SIZES[quest_index])
+            state = ags.add_round(state, quest_index, team, rng.choice(player_ids))
+            state = ags.update_approvals(state, quest_index, round_index, rng.sample(player_ids, 6))
+            states.append(state)
+        # Only the last team goes; each evil member on it fails half the time
+        fails = sum(rng.random() < 0.5 for player_id in team if player_id in evil)
+        state = ags.update_fails(state, quest_index, round_index, fails)
+        states[-1] = state
+    return states
+
+
+def run(games: list[list[ags.GameState]], memoized: bool) -> tuple[float, int]:
+    inference = RoleInference()
+    count = 0
+    start = time.perf_counter()
+    for states in games:
+        for state in states:
+            if not memoized:
+                inference = RoleInference()
+            inference.infer(state)
+            count += 1
+    return time.perf_counter() - start, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--games', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    logging.getLogger('util.avalon_game_state').setLevel(logging.WARNING)
+
+    rng = random.Random(args.seed)
+    games = [play_game(rng) for _ in range(args.games)]
+
+    before, count = run(games, memoized=False)
+    after, _ = run(games, memoized=True)
+    print(f'{count} inferences over {args.games} games')
+    print(f'from scratch: {before / count * 1e6:8.1f} us/inference')
+    print(f'memoized:     {after / count * 1e6:8.1f} us/inference')
+    print(f'speedup:      {before / after:8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
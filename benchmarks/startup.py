@@ -0,0 +1,69 @@
+"""
+Cold start of an app worker, default vs production start-up
+
+Starts `--runs` fresh interpreters for each mode, each importing the app and
+serving one game listing, as a newly forked or autoscaled worker would. The
+database already exists (workers never create it), so this measures what
+each worker pays on its own: imports, app setup and the first request,
+which in production mode includes opening and checking the database.
+
+Run from the repository root:
+    python -m benchmarks.startup --runs 10
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+MODES = {'default': '0', 'production': '1'}
+
+
+def child():
+    """Import the app and serve one request; prints the timings as JSON"""
+    start = time.perf_counter()
+    spec = importlib.util.spec_from_file_location('avalon_site', ROOT / '__init__.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    imported = time.perf_counter()
+    response = module.app.test_client().get('/api/games/get')
+    assert response.status_code == 200, response.status_code
+    served = time.perf_counter()
+    print(json.dumps({'import': imported - start, 'first_request': served - imported}))
+
+
+def run(production: str, cwd: str) -> dict:
+    env = dict(os.environ, PYTHONPATH=str(ROOT), AVALON_PRODUCTION=production)
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.startup', '--child'], cwd=cwd, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    timings = json.loads(output.splitlines()[-1])
+    timings['process'] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child()
+
+    print(f'median of {args.runs} runs (ms)   import  first request  whole process')
+    with tempfile.TemporaryDirectory() as tmp:
+        run(MODES['default'], tmp)  # Create and migrate the database once
+        for mode, production in MODES.items():
+            runs = [run(production, tmp) for _ in range(args.runs)]
+            medians = {key: statistics.median(timings[key] for timings in runs) * 1e3 for key in runs[0]}
+            print(f"{mode:30} {medians['import']:7.1f} {medians['first_request']:14.1f} {medians['process']:14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Size and speed of the binary game state codec against JSON
+
+Encodes and decodes the final states of random 10-player, 5-quest games
+(see benchmarks.role_inference) with json and with util.avalon_codec.
+
+Run from the repository root:
+    python -m benchmarks.state_codec --games 1000
+"""
+import argparse
+import json
+import logging
+import random
+import time
+
+from benchmarks.role_inference import play_game
+from util.avalon_codec import decode_state, encode_state
+
+
+def timed(function, items) -> tuple[float, list]:
+    start = time.perf_counter()
+    results = [function(item) for item in items]
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    logging.getLogger('util.avalon_game_state').setLevel(logging.WARNING)
+
+    rng = random.Random(args.seed)
+    states = [play_game(rng)[-1] for _ in range(args.games)]
+
+    json_encode, texts = timed(json.dumps, states)
+    json_decode, _ = timed(json.loads, texts)
+    binary_encode, blobs = timed(encode_state, states)
+    binary_decode, decoded = timed(decode_state, blobs)
+    assert decoded == states
+
+    json_size = sum(len(text.encode('utf-8')) for text in texts) / args.games
+    binary_size = sum(len(blob) for blob in blobs) / args.games
+    print(f'{args.games} games          json    binary')
+    print(f'bytes per state   {json_size:8.0f}  {binary_size:8.0f}  ({json_size / binary_size:.1f}x smaller)')
+    print(f'encode us/state   {json_encode / args.games * 1e6:8.1f}  {binary_encode / args.games * 1e6:8.1f}')
+    print(f'decode us/state   {json_decode / args.games * 1e6:8.1f}  {binary_decode / args.games * 1e6:8.1f}')
+
+
+if __name__ == '__main__':
+    main()
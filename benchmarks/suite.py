@@ -0,0 +1,261 @@
+"""
+Microbenchmarks of the game state functions and every AvalonDB method
+
+Times each ags mutator, validate_game_state and get_quest_result on small,
+medium and large games, then each public AvalonDB method against a
+temporary database under the test config, seeded with `--games` large
+games. Results can be saved as JSON and compared with an earlier run; the
+comparison exits with status 1 if any case got slower than `--threshold`.
+
+Run from the repository root:
+    python -m benchmarks.suite --output before.json
+    python -m benchmarks.suite --baseline before.json
+"""
+import argparse
+import datetime
+import json
+import logging
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import util.avalon_game_state as ags
+from util.avalon import AvalonDB, AvalonDBConfig
+
+# (players, quests, rounds per quest)
+SIZES = {
+    'small': (5, 1, 1),
+    'medium': (7, 3, 3),
+    'large': (10, 5, 5),
+}
+
+# AvalonDB methods left out, and why
+NOT_BENCHMARKED = {
+    'close': 'closes the connection pool the other cases use',
+}
+
+
+class Case(NamedTuple):
+    name: str
+    function: Callable[..., object]
+    # Called before every timed call, outside the timing, to make its arguments
+    setup: Optional[Callable[[], tuple]] = None
+
+
+def build_state(num_players: int, num_quests: int, rounds_per_quest: int, first_id: int = 1) -> ags.GameState:
+    player_ids = list(range(first_id, first_id + num_players))
+    state = ags.create_initial_game_state()
+    for player_id in player_ids:
+        state = ags.add_player(state, player_id)
+    for quest_index in range(num_quests):
+        state = ags.add_quest(state)
+        for round_index in range(rounds_per_quest):
+            king = player_ids[(quest_index * rounds_per_quest + round_index) % num_players]
+            state = ags.add_round(state, quest_index, player_ids[:3], king)
+            state = ags.update_approvals(state, quest_index, round_index, player_ids[:num_players // 2 + 1])
+            state = ags.update_fails(state, quest_index, round_index, round_index % 2)
+    return state
+
+
+def ags_cases() -> List[Case]:
+    cases = [Case('ags.create_initial_game_state', ags.create_initial_game_state)]
+    for size, (num_players, num_quests, rounds_per_quest) in SIZES.items():
+        state = build_state(num_players, num_quests, rounds_per_quest)
+        player_ids = ags.get_player_ids(state)
+        quest, round = num_quests - 1, rounds_per_quest - 1
+        calls = {
+            'add_quest': (state,),
+            'remove_quest': (state, quest),
+            'add_round': (state, quest, player_ids[:3], player_ids[0]),
+            'remove_round': (state, quest, round),
+            'add_player': (state, num_players + 1),
+            'remove_player': (state, player_ids[-1]),
+            'update_team': (state, quest, round, player_ids[1:4]),
+            'update_approvals': (state, quest, round, player_ids),
+            'update_fails': (state, quest, round, 1),
+            'validate_game_state': (state, set(player_ids)),
+            'get_quest_result': (state, quest),
+        }
+        for name, args in calls.items():
+            cases.append(Case(f'ags.{name}[{size}]', lambda function=getattr(ags, name), args=args: function(*args)))
+    return cases
+
+
+def seed(db: AvalonDB, num_games: int) -> Dict:
+    """Fill a database with large games and notes; returns ids the cases use"""
+    player_ids = [db.add_player(f'Player {n}')[1] for n in range(10)]
+    state = build_state(*SIZES['large'], first_id=player_ids[0])
+    game_ids = []
+    for n in range(num_games):
+        game_id = db.create_game()
+        db.update_game_state(game_id, state)
+        db.add_note(game_id, f'Round {n}: the king seemed suspicious of the second team')
+        game_ids.append(game_id)
+    for game_id in game_ids[::2]:
+        db.set_game_active_status(game_id, 2)
+    return {'player_ids': player_ids, 'game_id': game_ids[0], 'state': state,
+            'note_id': db.get_game_notes(game_ids[0])[0]['noteId']}
+
+
+def import_batch(player_ids: List[int], state: ags.GameState) -> tuple:
+    """Records of one new game with a note, as import_records takes them"""
+    game_id = str(uuid.uuid4())
+    now = datetime.datetime.now(datetime.UTC).isoformat()
+    return ([
+        {'type': 'game', 'gameId': game_id, 'start_time': now, 'active': 0, 'version': 1, 'state': state},
+        {'type': 'note', 'noteId': str(uuid.uuid4()), 'gameId': game_id, 'timestamp': now, 'content': 'Imported'},
+    ],)
+
+
+def db_cases(db: AvalonDB, ids: Dict) -> List[Case]:
+    player_id, game_id, state = ids['player_ids'][0], ids['game_id'], ids['state']
+
+    def get_connection():
+        with db.get_connection():
+            pass
+
+    def drop_stats() -> tuple:
+        db.player_stats.invalidate()
+        return ()
+
+    cases = [
+        Case('initialize_database', db.initialize_database),
+        Case('get_connection', get_connection),
+        Case('add_player', lambda: db.add_player('Benchmark')),
+        Case('set_player_active', lambda: db.set_player_active(player_id, True)),
+        Case('get_active_players', db.get_active_players),
+        Case('get_player', lambda: db.get_player(player_id)),
+        Case('get_all_players', db.get_all_players),
+        Case('get_next_player_id', db.get_next_player_id),
+        Case('update_player_name', lambda: db.update_player_name(player_id, 'Player 0')),
+        Case('create_game', db.create_game),
+        Case('set_game_active_status', lambda: db.set_game_active_status(game_id, 1)),
+        Case('list_games', lambda: db.list_games(limit=20)),
+        Case('get_games', db.get_games),
+        Case('get_game_state', lambda: db.get_game_state(game_id)),
+        Case('get_game_version', lambda: db.get_game_version(game_id)),
+        Case('update_game_state', lambda: db.update_game_state(game_id, state)),
+        Case('append_game_events', lambda: db.append_game_events(
+            game_id, [('update_fails', {'quest_index': 0, 'round_index': 0, 'fails': 0})])),
+        Case('backfill_normalized', db.backfill_normalized),
+        Case('get_player_stats', db.get_player_stats),
+        Case('get_player_stats[cold]', db.get_player_stats, setup=drop_stats),
+        Case('export_records', lambda: sum(1 for _ in db.export_records())),
+        Case('import_records', db.import_records, setup=lambda: import_batch(ids['player_ids'], state)),
+        Case('get_game_events', lambda: db.get_game_events(game_id)),
+        Case('add_note', lambda: db.add_note(game_id, 'Benchmark note')),
+        Case('get_game_notes', lambda: db.get_game_notes(game_id)),
+        Case('search_notes', lambda: db.search_notes('suspicious')),
+        Case('get_note', lambda: db.get_note(ids['note_id'])),
+        Case('delete_note', db.delete_note, setup=lambda: (db.add_note(game_id, 'To delete'),)),
+    ]
+    public = {name for name in dir(AvalonDB) if not name.startswith('_') and callable(getattr(AvalonDB, name))}
+    missing = public - {case.name.split('[')[0] for case in cases} - NOT_BENCHMARKED.keys()
+    if missing:
+        raise RuntimeError(f"AvalonDB methods without a benchmark: {', '.join(sorted(missing))}")
+    return [case._replace(name=f'AvalonDB.{case.name}') for case in cases]
+
+
+def measure(case: Case, min_time: float, repeat: int) -> Dict:
+    """Microseconds per call: best and median of `repeat` runs of at least `min_time` seconds each"""
+    if case.setup is None:
+        loops = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(loops):
+                case.function()
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+            loops *= 2
+        runs = [elapsed / loops]
+        for _ in range(repeat - 1):
+            start = time.perf_counter()
+            for _ in range(loops):
+                case.function()
+            runs.append((time.perf_counter() - start) / loops)
+    else:
+        # Calls with per-call setup are timed one at a time
+        runs = []
+        for _ in range(repeat):
+            loops, elapsed = 0, 0.0
+            while elapsed < min_time:
+                args = case.setup()
+                start = time.perf_counter()
+                case.function(*args)
+                elapsed += time.perf_counter() - start
+                loops += 1
+            runs.append(elapsed / loops)
+    return {'best_us': min(runs) * 1e6, 'median_us': statistics.median(runs) * 1e6, 'loops': loops}
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Print each case against the baseline; returns the names that regressed"""
+    regressions = []
+    print(f"\n{'case':48} {'baseline us':>12} {'now us':>12} {'change':>8}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:48} {'-':>12} {result['best_us']:12.1f} {'new':>8}")
+            continue
+        ratio = result['best_us'] / before['best_us']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  slower'
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = '  faster'
+        print(f"{name:48} {before['best_us']:12.1f} {result['best_us']:12.1f} {ratio - 1:+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--games', type=int, default=200, help='Games seeded into the benchmark database')
+    parser.add_argument('--min-time', type=float, default=0.05, help='Minimum seconds per timed run')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--filter', default='', help='Only run cases whose name contains this')
+    parser.add_argument('--output', type=Path, help='Save the results to this JSON file')
+    parser.add_argument('--baseline', type=Path, help='Compare against results saved by --output')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Slowdown of the best run that counts as a regression (default 0.10)')
+    args = parser.parse_args()
+    logging.getLogger('util.avalon_game_state').setLevel(logging.WARNING)
+    logging.getLogger('util.avalon_migrations').setLevel(logging.WARNING)
+
+    results = {}
+
+    def run(cases: List[Case]):
+        for case in cases:
+            if args.filter in case.name:
+                results[case.name] = measure(case, args.min_time, args.repeat)
+                print(f"{case.name:48} {results[case.name]['best_us']:12.2f} us")
+
+    run(ags_cases())
+    with tempfile.TemporaryDirectory() as tmp:
+        db = AvalonDB(AvalonDBConfig(env="test", data_dir=Path(tmp)))
+        run(db_cases(db, seed(db, args.games)))
+        db.close()
+
+    if args.output:
+        args.output.write_text(json.dumps({
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': datetime.datetime.now(datetime.UTC).isoformat(),
+            'games': args.games,
+            'results': results,
+        }, indent=2) + '\n')
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text())['results'], args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} case(s) slower than the baseline by more than {args.threshold:.0%}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Shared fixtures: an AvalonDB on a temporary database, and the Flask app
+
+The app module is the repository's __init__.py. Each test imports it afresh,
+from a temporary working directory so its database lands there, with the
+AVALON_* environment variables the test asks for.
+"""
+import importlib.util
+import os
+from pathlib import Path
+
+import pytest
+
+import util.avalon_game_state as ags
+from util.avalon import AvalonDB, AvalonDBConfig
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def make_db(tmp_path):
+    databases = []
+
+    def make(**config) -> AvalonDB:
+        database = AvalonDB(AvalonDBConfig(data_dir=tmp_path / 'data', **config))
+        databases.append(database)
+        return database
+
+    yield make
+    for database in databases:
+        database.close()
+
+
+@pytest.fixture
+def db(make_db) -> AvalonDB:
+    return make_db()
+
+
+@pytest.fixture
+def add_players():
+    """Add `count` players to a database, returning their ids"""
+    def add(database: AvalonDB, count: int) -> list[int]:
+        return [database.add_player(f'Player {n}')[1] for n in range(count)]
+    return add
+
+
+@pytest.fixture
+def play():
+    """
+    A state with the given players and one round per (team, approvals, fails)
+    quest; fails None leaves the quest unplayed
+    """
+    def build(player_ids, quests, roles=None) -> ags.GameState:
+        state = ags.create_initial_game_state()
+        for n, player_id in enumerate(player_ids):
+            state = ags.add_player(state, player_id, roles[n] if roles else '')
+        for quest_index, (team, approvals, fails) in enumerate(quests):
+            state = ags.add_quest(state)
+            state = ags.add_round(state, quest_index, team, team[0])
+            state = ags.update_approvals(state, quest_index, 0, approvals)
+            if fails is not None:
+                state = ags.update_fails(state, quest_index, 0, fails)
+        return state
+    return build
+
+
+@pytest.fixture
+def load_app(tmp_path, monkeypatch):
+    modules = []
+
+    def load(**env):
+        for name in [name for name in os.environ if name.startswith('AVALON_')]:
+            monkeypatch.delenv(name)
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        monkeypatch.chdir(tmp_path)
+        spec = importlib.util.spec_from_file_location('avalon_app', ROOT / '__init__.py')
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        modules.append(module)
+        return module
+
+    yield load
+    for module in modules:
+        module.db.close()
+
+
+@pytest.fixture
+def app_module(load_app):
+    return load_app()
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
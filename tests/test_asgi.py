@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+from util.avalon_asgi import _LoopQueue
+from util.avalon_pubsub import GameBroker, format_sse
+
+
+def _scope(method, path):
+    return {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'headers': [
+        (b'host', b'testserver'), (b'content-type', b'application/json')]}
+
+
+async def _request(asgi_app, method, path, body=b''):
+    """Status and body of a request through the ASGI app"""
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi_app(_scope(method, path), receive, send)
+    return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+
+
+def test_ordinary_requests_reach_the_flask_views(app_module):
+    async def main():
+        status, body = await _request(app_module.asgi_app, 'POST', '/api/games/create')
+        assert status == 201
+        game_id = json.loads(body)['gameId']
+        status, body = await _request(app_module.asgi_app, 'GET', f'/api/games/{game_id}/get')
+        assert (status, json.loads(body)['version']) == (200, 0)
+        assert (await _request(app_module.asgi_app, 'GET', '/api/nowhere'))[0] == 404
+        assert (await _request(app_module.asgi_app, 'GET', '/api/games/nope/stream'))[0] == 404
+
+    asyncio.run(main())
+
+
+def test_stream_is_served_on_the_loop_until_the_client_leaves(app_module):
+    asgi_app = app_module.asgi_app
+    game_id = app_module.db.create_game()
+    broker = app_module.db.broker
+
+    async def main():
+        disconnect = asyncio.Event()
+        frames = asyncio.Queue()
+
+        async def receive():
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            await frames.put(message)
+
+        stream = asyncio.create_task(asgi_app(_scope('GET', f'/api/games/{game_id}/stream'), receive, send))
+        start = await frames.get()
+        assert (start['status'], dict(start['headers'])[b'content-type']) == (200, b'text/event-stream; charset=utf-8')
+        assert (await frames.get())['body'] == format_sse('hello', {'version': 0}).encode()
+
+        # Written from a pool thread, as a view would
+        await asgi_app.db.append_game_events(game_id, [('add_quest', {})])
+        body = (await frames.get())['body'].decode()
+        assert body.startswith('event: events\n') and '"version": 1' in body
+
+        disconnect.set()
+        await asyncio.wait_for(stream, 5)
+        assert broker.subscriber_count(game_id) == 0
+
+    asyncio.run(main())
+
+
+def test_a_subscription_whose_loop_closed_drops_itself():
+    broker = GameBroker()
+    loop = asyncio.new_event_loop()
+    broker.subscribe('g', _LoopQueue(broker, 'g', loop, asyncio.Event()))
+    loop.close()
+    broker.publish('g', 'events', {'version': 1})
+    assert broker.subscriber_count('g') == 0
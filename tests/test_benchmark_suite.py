@@ -0,0 +1,37 @@
+import pytest
+
+import util.avalon_game_state as ags
+from benchmarks import suite
+
+
+def test_built_states_are_valid_games():
+    for num_players, num_quests, rounds_per_quest in suite.SIZES.values():
+        state = suite.build_state(num_players, num_quests, rounds_per_quest)
+        assert ags.validate_game_state(state, set(ags.get_player_ids(state)))[0]
+        assert [len(quest['rounds']) for quest in state['quests']] == [rounds_per_quest] * num_quests
+
+
+def test_every_case_runs(db):
+    cases = suite.ags_cases() + suite.db_cases(db, suite.seed(db, 3))
+    assert len({case.name for case in cases}) == len(cases)
+    for case in cases:
+        case.function(*(case.setup() if case.setup else ()))
+
+
+def test_every_public_db_method_needs_a_case(db, monkeypatch):
+    monkeypatch.setattr(suite.AvalonDB, 'new_method', lambda self: None, raising=False)
+    with pytest.raises(RuntimeError, match='new_method'):
+        suite.db_cases(db, suite.seed(db, 1))
+
+
+def test_measure_and_compare(capsys):
+    result = suite.measure(suite.Case('noop', lambda: None), min_time=0.001, repeat=3)
+    assert result['loops'] >= 1 and 0 < result['best_us'] <= result['median_us']
+    per_call = suite.measure(suite.Case('noop', lambda x: x, setup=lambda: (1,)), min_time=0.001, repeat=2)
+    assert per_call['best_us'] > 0
+
+    results = {'same': {'best_us': 104}, 'slower': {'best_us': 150}, 'faster': {'best_us': 50}, 'new': {'best_us': 1}}
+    baseline = {name: {'best_us': 100} for name in ('same', 'slower', 'faster')}
+    assert suite.compare(results, baseline, threshold=0.10) == ['slower']
+    output = capsys.readouterr().out
+    assert 'faster' in output and '+50.0%' in output
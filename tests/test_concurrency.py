@@ -0,0 +1,73 @@
+import threading
+
+from util.avalon import VERSION_CONFLICT
+
+
+def test_compare_and_swap_rejects_a_stale_version(db, add_players, play):
+    player_ids = add_players(db, 5)
+    game_id = db.create_game()
+    state = play(player_ids, [])
+    assert db.update_game_state(game_id, state, expected_version=0) == (True, None)
+    assert db.update_game_state(game_id, state, expected_version=0) == (False, VERSION_CONFLICT)
+    assert db.append_game_events(game_id, [('add_quest', {})], expected_version=0) == (False, VERSION_CONFLICT)
+    assert db.append_game_events(game_id, [('add_quest', {})], expected_version=1) == (True, None)
+    assert db.get_game_version(game_id) == 2
+
+
+def test_a_loaded_state_is_not_read_again(db, add_players, play, monkeypatch):
+    player_ids = add_players(db, 5)
+    game_id = db.create_game()
+    db.update_game_state(game_id, play(player_ids, []))
+    game = db.get_game_state(game_id)
+    replays = []
+    monkeypatch.setattr(db, '_replay_events', lambda *args: replays.append(args))
+    events = [('add_quest', {})]
+    assert db.append_game_events(game_id, events, game['version'] - 1, game['state']) == (False, VERSION_CONFLICT)
+    assert db.append_game_events(game_id, events, game['version'], game['state']) == (True, None)
+    assert db.append_game_events(game_id, events, game['version'], game['state']) == (False, VERSION_CONFLICT)
+    assert replays == []
+    monkeypatch.undo()
+    assert db.get_game_state(game_id)['state']['quests'] == [{'rounds': []}]
+
+
+def test_concurrent_appends_are_all_kept(db, add_players):
+    player_ids = add_players(db, 8)
+    game_id = db.create_game()
+    results = []
+
+    def add(player_id):
+        results.append(db.append_game_events(game_id, [('add_player', {'player_id': player_id, 'role': ''})]))
+
+    threads = [threading.Thread(target=add, args=(player_id,)) for player_id in player_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [(True, None)] * len(player_ids)
+    game = db.get_game_state(game_id)
+    assert game['version'] == len(player_ids)
+    assert sorted(player['player_id'] for player in game['state']['players']) == player_ids
+
+
+def _add_player(client, game_id, player_id, **headers):
+    return client.post(f'/api/games/{game_id}/players/add', json={'player_id': player_id}, headers=headers)
+
+
+def test_if_match_pins_the_version(client):
+    player_ids = [client.post('/api/players/add', json={'name': f'P{n}'}).get_json()['player_id'] for n in range(2)]
+    game_id = client.post('/api/games/create').get_json()['gameId']
+
+    response = _add_player(client, game_id, player_ids[0], **{'If-Match': '"0"'})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"1"'
+    response = _add_player(client, game_id, player_ids[1], **{'If-Match': '"0"'})
+    assert response.status_code == 412
+    # The gzipped body's ETag pins the same version
+    assert _add_player(client, game_id, player_ids[1], **{'If-Match': '"1-gzip"'}).status_code == 200
+
+
+def test_a_write_that_keeps_losing_races_is_a_409(app_module, client, monkeypatch):
+    player_id = client.post('/api/players/add', json={'name': 'P'}).get_json()['player_id']
+    game_id = client.post('/api/games/create').get_json()['gameId']
+    monkeypatch.setattr(app_module.db, 'append_game_events', lambda *args: (False, VERSION_CONFLICT))
+    assert _add_player(client, game_id, player_id).status_code == 409
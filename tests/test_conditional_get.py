@@ -0,0 +1,39 @@
+def test_game_is_304_until_it_changes(client):
+    game_id = client.post('/api/games/create').get_json()['gameId']
+    response = client.get(f'/api/games/{game_id}/get')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert etag == '"0"'
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    response = client.get(f'/api/games/{game_id}/get', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert response.data == b''
+
+    client.post(f'/api/games/{game_id}/quests/add')
+    response = client.get(f'/api/games/{game_id}/get', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"1"'
+    assert response.get_json()['version'] == 1
+
+
+def test_unknown_game_is_404_whatever_the_etag(client):
+    assert client.get('/api/games/nope/get', headers={'If-None-Match': '"0"'}).status_code == 404
+
+
+def test_player_list_is_304_until_it_changes(client):
+    client.post('/api/players/add', json={'name': 'Alice'})
+    etag = client.get('/api/players/get').headers['ETag']
+    assert client.get('/api/players/get', headers={'If-None-Match': etag}).status_code == 304
+    client.post('/api/players/add', json={'name': 'Bob'})
+    assert client.get('/api/players/get', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_a_weak_etag_still_revalidates(client):
+    # Proxies that re-encode a response weaken its ETag
+    game_id = client.post('/api/games/create').get_json()['gameId']
+    assert client.get(f'/api/games/{game_id}/get', headers={'If-None-Match': 'W/"0"'}).status_code == 304
+    assert client.get(f'/api/games/{game_id}/inference', headers={'If-None-Match': 'W/"0"'}).status_code == 304
+    client.post(f'/api/games/{game_id}/quests/add')
+    assert client.get(f'/api/games/{game_id}/get', headers={'If-None-Match': 'W/"0"'}).status_code == 200
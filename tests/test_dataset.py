@@ -0,0 +1,58 @@
+import random
+
+import util.avalon_game_state as ags
+from benchmarks import dataset
+
+
+def test_games_follow_the_rules():
+    rng = random.Random(0)
+    for _ in range(50):
+        player_ids = rng.sample(range(1, 20), rng.randint(5, 10))
+        state, finished = dataset.play_game(rng, player_ids)
+        assert ags.validate_game_state(state, set(player_ids))[0]
+        sizes = dataset.QUEST_TEAM_SIZES[len(player_ids)]
+        for quest_index, quest in enumerate(state['quests']):
+            assert 1 <= len(quest['rounds']) <= ags.MAX_PROPOSALS
+            assert {len(round['team']) for round in quest['rounds']} == {sizes[quest_index]}
+            assert ags.get_quest_result(state, quest_index) is not None
+        summary = ags.get_game_summary(state)
+        if finished:
+            assert ags.get_game_winner(summary) is not None
+            assert all(player['role'] for player in state['players'])
+        else:
+            assert not any(player['role'] for player in state['players'])
+
+
+def test_a_seed_always_gives_the_same_records():
+    def records(seed, chunk):
+        return list(dataset.chunk_records(seed, chunk, num_games=20, num_notes=15, num_players=30))
+
+    first = records(1, 0)
+    assert first == records(1, 0)
+    assert first != records(1, 1) and first != records(2, 0)
+    assert sum(record['type'] == 'game' for record in first) == 20
+    assert sum(record['type'] == 'note' for record in first) == 15
+
+
+def _indexes(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")}
+
+
+def test_chunks_are_built_apart_and_copied_in(db, tmp_path):
+    db.import_records({'type': 'player', 'player_id': player_id, 'name': f'Player {player_id}'}
+                      for player_id in range(1, 31))
+    (tmp_path / 'scratch').mkdir()
+    paths = [dataset.build_chunk(str(tmp_path / 'scratch'), 'binary', 0, chunk, 10, 5, 30) for chunk in range(2)]
+    with db.get_connection() as conn:
+        indexes = _indexes(conn)
+        with dataset.deferred_indexes(conn):
+            # Players aren't copied, so their index stays
+            assert _indexes(conn) == {'idx_players_active'}
+            for path in paths:
+                dataset.copy_chunk(conn, path)
+        assert _indexes(conn) == indexes
+        assert tuple(conn.execute("SELECT COUNT(*), COUNT(state_blob) FROM games").fetchone()) == (20, 20)
+        about_quests = conn.execute("SELECT COUNT(*) FROM notes WHERE content LIKE '%quest%'").fetchone()[0]
+    assert not list((tmp_path / 'scratch').iterdir())
+    # The search index was rebuilt from the copied notes
+    assert len(db.search_notes('quest', limit=100)[0]) == about_quests > 0
@@ -0,0 +1,54 @@
+import util.avalon_game_state as ags
+
+
+def _snapshot(db, game_id):
+    with db.get_connection() as conn:
+        row = conn.execute("SELECT version, snapshot_version FROM games WHERE gameId = ?", (game_id,)).fetchone()
+    return row['version'], row['snapshot_version']
+
+
+def test_events_are_logged_and_replayed(db, add_players):
+    player_ids = add_players(db, 5)
+    game_id = db.create_game()
+    events = [('add_player', {'player_id': player_id, 'role': ''}) for player_id in player_ids]
+    events += [('add_quest', {}), ('add_round', {'quest_index': 0, 'team': player_ids[:2], 'king': player_ids[0]})]
+    assert db.append_game_events(game_id, events) == (True, None)
+
+    logged = db.get_game_events(game_id)
+    assert [(event['version'], event['op']) for event in logged] == [
+        (n, op) for n, (op, _) in enumerate(events, start=1)]
+    game = db.get_game_state(game_id)
+    assert game['version'] == len(events)
+    assert game['state'] == ags.apply_events(ags.create_initial_game_state(), events)
+    # Below the snapshot interval, games.state is left as it was
+    assert _snapshot(db, game_id) == (len(events), 0)
+
+
+def test_state_is_snapshotted_every_interval(make_db, add_players):
+    db = make_db(snapshot_interval=3)
+    player_ids = add_players(db, 5)
+    game_id = db.create_game()
+    for player_id in player_ids:
+        assert db.append_game_events(game_id, [('add_player', {'player_id': player_id, 'role': ''})])[0]
+    assert _snapshot(db, game_id) == (5, 3)
+    assert ags.get_player_ids(db.get_game_state(game_id)['state']) == player_ids
+
+
+def test_invalid_events_are_not_logged(db, add_players):
+    add_players(db, 1)
+    game_id = db.create_game()
+    assert db.append_game_events(game_id, [('drop_table', {})]) == (False, 'Unknown event: drop_table')
+    assert db.append_game_events(game_id, [('add_round', {'quest_index': 0, 'team': [1], 'king': 1})]) == (
+        False, 'Invalid event')
+    assert db.get_game_events(game_id) == []
+    assert db.get_game_version(game_id) == 0
+
+
+def test_full_state_write_is_a_snapshot(db, add_players, play):
+    player_ids = add_players(db, 5)
+    game_id = db.create_game()
+    db.append_game_events(game_id, [('add_player', {'player_id': player_ids[0], 'role': ''})])
+    state = play(player_ids, [(player_ids[:2], player_ids[:3], 0)])
+    assert db.update_game_state(game_id, state) == (True, None)
+    assert _snapshot(db, game_id) == (2, 2)
+    assert db.get_game_state(game_id)['state'] == state
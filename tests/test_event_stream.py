@@ -0,0 +1,54 @@
+import json
+import queue
+
+import pytest
+
+from util.avalon_pubsub import GameBroker, format_sse
+
+
+def _frame(chunk):
+    event, data = (chunk.decode() if isinstance(chunk, bytes) else chunk).strip().split('\n')
+    return event.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+
+
+def test_format_sse():
+    assert format_sse('state', {'version': 3}) == 'event: state\ndata: {"version": 3}\n\n'
+
+
+def test_publish_fans_out_to_the_game_subscribers_only():
+    broker = GameBroker()
+    first, second, other = broker.subscribe('g'), broker.subscribe('g'), broker.subscribe('h')
+    broker.publish('g', 'events', {'version': 1})
+    assert first.get_nowait() == second.get_nowait() == format_sse('events', {'version': 1})
+    assert other.empty()
+    broker.unsubscribe('g', first)
+    assert broker.subscriber_count('g') == 1
+
+
+def test_a_subscriber_that_falls_behind_is_told_to_resync():
+    broker = GameBroker(max_queue=2)
+    subscription = broker.subscribe('g')
+    for version in range(3):
+        broker.publish('g', 'events', {'version': version})
+    assert _frame(subscription.get_nowait()) == ('resync', {})
+    with pytest.raises(queue.Empty):
+        subscription.get_nowait()
+
+
+def test_stream_sends_hello_then_each_write(app_module, client):
+    game_id = client.post('/api/games/create').get_json()['gameId']
+    response = client.get(f'/api/games/{game_id}/stream', buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    frames = iter(response.response)
+    assert _frame(next(frames)) == ('hello', {'version': 0})
+
+    client.post(f'/api/games/{game_id}/quests/add')
+    event, data = _frame(next(frames))
+    assert event == 'events'
+    assert data == {'version': 1, 'events': [{'op': 'add_quest', 'args': {}}]}
+    response.close()
+    assert app_module.db.broker.subscriber_count(game_id) == 0
+
+
+def test_stream_of_unknown_game_is_404(client):
+    assert client.get('/api/games/nope/stream').status_code == 404
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from util.avalon import from_ndjson, to_ndjson
+
+
+def _fill(db, add_players, play):
+    player_ids = add_players(db, 5)
+    db.set_player_active(player_ids[4], False)
+    game_ids = sorted(db.create_game() for _ in range(3))
+    # Logged events past the snapshot, so the export has to replay them
+    db.append_game_events(game_ids[0], [('add_player', {'player_id': player_id, 'role': ''})
+                                        for player_id in player_ids])
+    db.update_game_state(game_ids[1], play(player_ids, [(player_ids[:2], player_ids[:3], 1)]))
+    for game_id in game_ids[:2]:
+        db.add_note(game_id, f'notes on {game_id}')
+    return game_ids
+
+
+def test_export_and_import_round_trip(make_db, add_players, play):
+    source, target = make_db(), make_db(env='test')
+    game_ids = _fill(source, add_players, play)
+    lines = list(to_ndjson(source.export_records(batch_size=2)))
+    records = list(from_ndjson(lines))
+    assert [record['type'] for record in records] == ['player'] * 5 + ['game', 'note', 'game', 'note', 'game']
+
+    assert target.import_records(from_ndjson(lines), batch_size=2) == {'players': 5, 'games': 3, 'notes': 2}
+    for game_id in game_ids:
+        assert target.get_game_state(game_id)['state'] == source.get_game_state(game_id)['state']
+        assert target.get_game_notes(game_id) == source.get_game_notes(game_id)
+    assert target.get_all_players() == source.get_all_players()
+    assert len(target.search_notes('notes')[0]) == 2
+    # Existing ids are skipped
+    assert target.import_records(records) == {'players': 0, 'games': 0, 'notes': 0}
+
+
+def test_writes_carry_on_during_an_export(db, add_players, play):
+    _fill(db, add_players, play)
+    records = db.export_records(batch_size=1)
+    assert next(records)['type'] == 'player'
+    # The export's read transaction is open, on another pooled connection
+    assert db.add_player('Late')[0]
+    assert db.add_note(db.create_game(), 'written mid-export')
+    # The export is a snapshot from before those writes
+    rest = list(records)
+    assert sum(record['type'] == 'player' for record in rest) == 4
+    assert sum(record['type'] == 'game' for record in rest) == 3
+
+
+def test_a_bad_record_imports_nothing(db):
+    records = [{'type': 'player', 'player_id': 1, 'name': 'Ada'},
+               {'type': 'game', 'gameId': 'g', 'start_time': 't', 'state': {'players': [{'player_id': 2, 'role': ''}],
+                                                                          'quests': []}}]
+    with pytest.raises(ValueError, match='Record 2'):
+        db.import_records(records)
+    assert db.get_all_players() == []
+    with pytest.raises(ValueError, match='Line 2'):
+        list(from_ndjson(['{}', '{', '']))
+
+
+def test_export_route_streams_ndjson(client, app_module, add_players, play):
+    game_ids = _fill(app_module.db, add_players, play)
+    response = client.get('/api/export')
+    assert response.mimetype == 'application/x-ndjson'
+    assert 'attachment' in response.headers['Content-Disposition']
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [record['gameId'] for record in records if record['type'] == 'game'] == game_ids
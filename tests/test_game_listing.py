@@ -0,0 +1,68 @@
+import pytest
+
+import util.avalon_game_state as ags
+from util.avalon import GAME_FIELDS
+
+
+def test_keyset_pages_cover_every_game_once(db):
+    game_ids = {db.create_game() for _ in range(7)}
+    seen, cursor = [], None
+    while True:
+        games, cursor = db.list_games(limit=3, cursor=cursor, fields=['gameId', 'start_time'])
+        seen += games
+        if cursor is None:
+            break
+    assert {game['gameId'] for game in seen} == game_ids
+    assert len(seen) == len(game_ids)
+    keys = [(game['start_time'], game['gameId']) for game in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_listing_filters_and_projects(db, add_players, play):
+    player_ids = add_players(db, 5)
+    game_ids = [db.create_game() for _ in range(3)]
+    db.update_game_state(game_ids[1], play(player_ids, [(player_ids[:2], player_ids[:3], 1)]))
+    db.set_game_active_status(game_ids[1], 1)
+
+    games, cursor = db.list_games(active=1, fields=['gameId', 'player_count', 'quests_failed'])
+    assert games == [{'gameId': game_ids[1], 'player_count': 5, 'quests_failed': 1}]
+    assert cursor is None
+    with pytest.raises(ValueError):
+        db.list_games(fields=['gameId', 'password'])
+    with pytest.raises(ValueError):
+        db.list_games(cursor='garbage')
+
+
+def test_single_game_responses_keep_their_fields(client):
+    game_id = client.post('/api/games/create').get_json()['gameId']
+    assert set(client.get(f'/api/games/{game_id}/get').get_json()) == set(GAME_FIELDS)
+    assert set(client.get('/api/games/get').get_json()['games'][0]) == set(GAME_FIELDS)
+    games = client.get('/api/games/get?limit=1&fields=gameId,player_ids').get_json()['games']
+    assert games == [{'gameId': game_id, 'player_ids': []}]
+    assert client.get('/api/games/get?limit=0').status_code == 400
+
+
+def test_a_quest_counts_once_it_has_been_played(play):
+    players = [1, 2, 3, 4, 5]
+    state = play(players, [([1, 2], [1, 2, 3], 0), ([1, 2], [1, 2, 3], 0)])
+    # A team proposed for quest 3 is not a third success
+    proposed = ags.add_round(ags.add_quest(state), 2, [1, 2, 3], 1)
+    assert ags.get_game_summary(proposed)['quests_succeeded'] == 2
+    voted_down = ags.update_approvals(proposed, 2, 0, [1])
+    assert ags.get_quest_result(voted_down, 2) is None
+    played = ags.update_fails(ags.update_approvals(proposed, 2, 0, [1, 2, 3]), 2, 0, 0)
+    summary = ags.get_game_summary(played)
+    assert summary['quests_succeeded'] == 3
+    assert ags.get_game_winner(summary) == 'good'
+
+
+def test_the_last_allowed_proposal_is_played_whatever_the_vote(play):
+    players = [1, 2, 3, 4, 5]
+    state = play(players, [([1, 2], [1, 2, 3], 0)])
+    state = ags.add_quest(state)
+    for round_index in range(ags.MAX_PROPOSALS - 1):
+        state = ags.update_approvals(ags.add_round(state, 1, [1, 2, 3], players[round_index]), 1, round_index, [1])
+    assert ags.get_quest_result(state, 1) is None
+    state = ags.add_round(state, 1, [1, 2, 3], players[-1])
+    assert ags.get_quest_result(state, 1) is True
+    assert ags.get_quest_result(ags.update_fails(state, 1, ags.MAX_PROPOSALS - 1, 1), 1) is False
@@ -0,0 +1,53 @@
+import copy
+
+import util.avalon_game_state as ags
+
+
+def _state():
+    state = ags.create_initial_game_state()
+    for player_id in range(1, 6):
+        state = ags.add_player(state, player_id)
+    for quest_index in range(3):
+        state = ags.add_quest(state)
+        state = ags.add_round(state, quest_index, [1, 2], 1)
+    return state
+
+
+def test_mutators_leave_their_input_unchanged():
+    state = _state()
+    before = copy.deepcopy(state)
+    ags.update_approvals(state, 1, 0, [1, 2, 3])
+    ags.update_fails(state, 1, 0, 1)
+    ags.add_round(state, 2, [3, 4], 3)
+    ags.remove_quest(state, 0)
+    ags.remove_player(state, 5)
+    assert state == before
+
+
+def test_update_copies_only_the_path_to_the_changed_round():
+    state = _state()
+    new_state = ags.update_fails(state, 1, 0, 1)
+    assert new_state['players'] is state['players']
+    assert new_state['quests'][0] is state['quests'][0]
+    assert new_state['quests'][2] is state['quests'][2]
+    assert new_state['quests'][1] is not state['quests'][1]
+    assert new_state['quests'][1]['rounds'][0]['team'] is state['quests'][1]['rounds'][0]['team']
+    assert new_state['quests'][1]['rounds'][0]['fails'] == 1
+    assert state['quests'][1]['rounds'][0]['fails'] == 0
+
+
+def test_invalid_indices_return_none():
+    state = _state()
+    assert ags.update_fails(state, 5, 0, 1) is None
+    assert ags.update_approvals(state, 0, 3, [1]) is None
+    assert ags.remove_quest(state, -1) is None
+    assert ags.remove_player(state, 99) is None
+
+
+def test_apply_events_matches_calling_the_mutators():
+    state = _state()
+    events = [('update_approvals', {'quest_index': 0, 'round_index': 0, 'approvals': [1, 2, 3]}),
+              ('update_fails', {'quest_index': 0, 'round_index': 0, 'fails': 0})]
+    expected = ags.update_fails(ags.update_approvals(state, 0, 0, [1, 2, 3]), 0, 0, 0)
+    assert ags.apply_events(state, events) == expected
+    assert ags.apply_events(state, [('update_fails', {'quest_index': 9, 'round_index': 0, 'fails': 0})]) is None
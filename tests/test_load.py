@@ -0,0 +1,33 @@
+import random
+
+from benchmarks import load
+
+
+def test_percentile_is_nearest_rank():
+    samples = [float(n) for n in range(1, 101)]
+    assert [load.percentile(samples, fraction) for fraction in (0.0, 0.5, 0.95, 0.99, 1.0)] == [1, 51, 96, 100, 100]
+    assert load.percentile([7.0], 0.99) == 7
+
+
+def test_recorder_counts_errors_and_lock_contention():
+    recorder = load.Recorder()
+    recorder.record('GET /a', 0.1, 200, b'{}')
+    recorder.record('GET /a', 0.2, 500, b'{"error": "database is locked"}')
+    recorder.record('GET /a', 0.3, 404, b'{"error": "Game not found"}')
+    assert recorder.latencies['GET /a'] == [0.1, 0.2, 0.3]
+    assert recorder.errors['GET /a'] == {500: 1, 404: 1}
+    assert recorder.lock_errors == 1
+
+
+def test_tables_play_whole_games_without_errors(app_module, capsys):
+    recorder = load.Recorder()
+    for seed in range(2):
+        load.Table(load.AppClient(app_module.app), recorder, random.Random(seed), think=0).play()
+    assert not any(recorder.errors.values())
+    assert recorder.lock_errors == 0
+
+    games, _ = app_module.db.list_games(fields=['gameId', 'quests_succeeded', 'quests_failed'])
+    assert len(games) == 2
+    assert all(3 in (game['quests_succeeded'], game['quests_failed']) for game in games)
+    load.report(recorder, 1.0)
+    assert 'POST /api/games/<game_id>/quests/<int:quest_number>/rounds/add' in capsys.readouterr().out
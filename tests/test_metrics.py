@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from util.avalon_metrics import CONTENT_TYPE, FOLD_EVERY, Counter, Histogram, Metric
+
+
+def test_text_format():
+    counter = Counter('requests_total', 'Requests', ('route', 'status'))
+    counter.inc('/a "b"\n', '200')
+    counter.inc('/a "b"\n', '200', amount=2)
+    histogram = Histogram('duration_seconds', 'Durations', ('route',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, '/a')
+
+    assert counter.render() == [
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{route="/a \\"b\\"\\n",status="200"} 3',
+    ]
+    assert histogram.render() == [
+        '# HELP duration_seconds Durations',
+        '# TYPE duration_seconds histogram',
+        'duration_seconds_bucket{route="/a",le="0.1"} 2',
+        'duration_seconds_bucket{route="/a",le="1.0"} 3',
+        'duration_seconds_bucket{route="/a",le="+Inf"} 4',
+        'duration_seconds_sum{route="/a"} 3.65',
+        'duration_seconds_count{route="/a"} 4',
+    ]
+
+
+def test_a_metric_needs_a_kind_that_adds_and_renders_samples():
+    with pytest.raises(TypeError):
+        Metric('untyped', 'Neither adds nor renders')
+
+
+def test_observations_from_many_threads_are_all_counted():
+    counter = Counter('calls_total', 'Calls')
+
+    def count():
+        for _ in range(FOLD_EVERY * 4 + 1):
+            counter.inc()
+
+    threads = [threading.Thread(target=count) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.render()[-1] == f'calls_total {8 * (FOLD_EVERY * 4 + 1)}'
+
+
+def test_metrics_route(client, app_module, monkeypatch):
+    game_id = client.post('/api/games/create').get_json()['gameId']
+    client.post(f'/api/games/{game_id}/quests/add')
+    client.get(f'/api/games/{game_id}/get')
+    client.get(f'/api/games/{game_id}/get')
+    monkeypatch.setattr(app_module.db, 'get_game_version', app_module.metrics._timed('get_game_version', _fail))
+    assert client.get(f'/api/games/{game_id}/get').status_code == 500
+
+    response = client.get('/metrics')
+    assert response.headers['Content-Type'] == CONTENT_TYPE
+    lines = response.get_data(as_text=True).splitlines()
+    helps = {line.split()[2] for line in lines if line.startswith('# HELP')}
+    types = {line.split()[2] for line in lines if line.startswith('# TYPE')}
+    assert helps == types
+    assert all(line.split('{')[0].split()[0].removesuffix('_bucket').removesuffix('_sum').removesuffix('_count')
+               in types for line in lines if not line.startswith('#'))
+
+    assert 'avalon_http_requests_total{method="POST",route="/api/games/create",status="201"} 1' in lines
+    assert 'avalon_http_requests_total{method="GET",route="/api/games/<game_id>/get",status="200"} 2' in lines
+    assert 'avalon_http_request_duration_seconds_count{method="GET",route="/api/games/<game_id>/get"} 3' in lines
+    assert 'avalon_db_operation_duration_seconds_count{operation="create_game"} 1' in lines
+    assert 'avalon_db_operation_errors_total{operation="get_game_version"} 1' in lines
+    assert 'avalon_http_request_errors_total{method="GET",route="/api/games/<game_id>/get"} 1' in lines
+    assert 'avalon_cache_lookups_total{cache="responses",result="hit"} 1' in lines
+    assert 'avalon_game_state_validation_seconds_count{kind="event"} 1' in lines
+
+
+def _fail(*args):
+    raise RuntimeError('database is gone')
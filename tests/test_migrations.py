@@ -0,0 +1,83 @@
+import json
+import sqlite3
+
+from util.avalon_migrations import MIGRATIONS, get_schema_version, migrate
+
+
+def _indexes(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+
+def test_new_database_is_at_the_latest_version(db):
+    with db.get_connection() as conn:
+        assert get_schema_version(conn) == len(MIGRATIONS)
+        assert migrate(conn) == len(MIGRATIONS)
+        assert {'idx_games_start_time', 'idx_notes_game_timestamp', 'idx_players_active',
+                'idx_round_approvals_player'} <= _indexes(conn)
+
+
+def test_database_from_before_the_runner_is_upgraded(tmp_path):
+    # The schema the app created before migrations existed
+    conn = sqlite3.connect(tmp_path / 'legacy.db')
+    conn.executescript("""
+        CREATE TABLE players (player_id INTEGER PRIMARY KEY, name TEXT NOT NULL, active INTEGER NOT NULL DEFAULT 1);
+        CREATE TABLE games (gameId TEXT PRIMARY KEY, state TEXT NOT NULL, start_time TEXT NOT NULL,
+                            active INTEGER NOT NULL DEFAULT 0);
+        CREATE TABLE notes (noteId TEXT PRIMARY KEY, gameId TEXT NOT NULL, timestamp TEXT NOT NULL,
+                            content TEXT NOT NULL);
+        INSERT INTO notes VALUES ('n', 'g', 't', 'Merlin was obvious');
+    """)
+    state = {'players': [{'player_id': n, 'role': ''} for n in range(1, 6)],
+             'quests': [{'rounds': [{'team': [1, 2], 'approvals': [1, 2, 3], 'fails': 1, 'king': 1}]}]}
+    conn.execute("INSERT INTO games VALUES ('g', ?, 't', 1)", (json.dumps(state),))
+    conn.commit()
+
+    assert migrate(conn) == len(MIGRATIONS)
+    row = conn.execute("SELECT version, player_ids, player_count, quests_failed FROM games").fetchone()
+    assert row == (0, '[1, 2, 3, 4, 5]', 5, 1)
+    # Its normalized rows are backfilled too
+    assert conn.execute("SELECT COUNT(*) FROM game_players WHERE gameId = 'g'").fetchone() == (5,)
+    assert conn.execute("SELECT king, fails FROM rounds WHERE gameId = 'g'").fetchall() == [(1, 1)]
+    assert conn.execute("SELECT rowid FROM notes_fts WHERE notes_fts MATCH 'merlin'").fetchall() == [(1,)]
+    conn.close()
+
+
+def test_quests_counted_before_they_were_played_are_recounted(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'avalon.db')
+    cursor = conn.cursor()
+    for migration in MIGRATIONS[:7]:
+        migration(cursor)
+    conn.execute("PRAGMA user_version = 7")
+    # add_round records fails: 0 on every proposed team
+    rounds = [{'team': [1, 2], 'approvals': [1, 2, 3], 'fails': 0, 'king': 1}] * 2
+    rounds.append({'team': [1, 2], 'approvals': [], 'fails': 0, 'king': 1})
+    state = {'players': [{'player_id': n, 'role': ''} for n in range(1, 6)],
+             'quests': [{'rounds': [round]} for round in rounds]}
+    conn.execute("INSERT INTO games (gameId, state, start_time, quests_succeeded) VALUES ('g', ?, 't', 3)",
+                 (json.dumps(state),))
+    conn.commit()
+
+    assert migrate(conn) == len(MIGRATIONS)
+    assert conn.execute("SELECT quests_succeeded, quests_failed FROM games").fetchone() == (2, 0)
+    conn.close()
+
+
+def test_games_without_normalized_rows_are_backfilled(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'avalon.db')
+    cursor = conn.cursor()
+    for migration in MIGRATIONS[:8]:
+        migration(cursor)
+    conn.execute("PRAGMA user_version = 8")
+    # Written before the normalized tables existed, then changed by a logged event
+    state = {'players': [{'player_id': n, 'role': ''} for n in range(1, 6)], 'quests': [{'rounds': []}]}
+    conn.execute("INSERT INTO games (gameId, state, start_time, version) VALUES ('g', ?, 't', 1)",
+                 (json.dumps(state),))
+    conn.execute("INSERT INTO game_events (gameId, version, op, args, timestamp) VALUES ('g', 1, 'add_round', ?, 't')",
+                 (json.dumps({'quest_index': 0, 'team': [1, 2], 'king': 3}),))
+    conn.commit()
+
+    assert migrate(conn) == len(MIGRATIONS)
+    assert conn.execute("SELECT COUNT(*) FROM game_players").fetchone() == (5,)
+    assert conn.execute("SELECT quest_index, round_index, king, fails FROM rounds").fetchall() == [(0, 0, 3, 0)]
+    assert conn.execute("SELECT player_id FROM round_team ORDER BY player_id").fetchall() == [(1,), (2,)]
+    conn.close()
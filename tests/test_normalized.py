@@ -0,0 +1,48 @@
+from util import avalon_normalized as normalized
+
+
+def _rows(db, game_id):
+    with db.get_connection() as conn:
+        return {
+            table: sorted(tuple(row)[1:] for row in conn.execute(f"SELECT * FROM {table} WHERE gameId = ?", (game_id,)))
+            for table in normalized.TABLES
+        }
+
+
+def _events(player_ids):
+    events = [('add_player', {'player_id': player_id, 'role': ''}) for player_id in player_ids]
+    for quest_index, fails in enumerate([0, 1]):
+        events += [
+            ('add_quest', {}),
+            ('add_round', {'quest_index': quest_index, 'team': player_ids[:2], 'king': player_ids[quest_index]}),
+            ('update_approvals', {'quest_index': quest_index, 'round_index': 0, 'approvals': player_ids[:3]}),
+            ('update_fails', {'quest_index': quest_index, 'round_index': 0, 'fails': fails}),
+        ]
+    return events + [('add_round', {'quest_index': 1, 'team': player_ids[2:4], 'king': player_ids[2]})]
+
+
+def test_events_and_whole_states_write_the_same_rows(db, add_players):
+    player_ids = add_players(db, 5)
+    by_events, by_state = db.create_game(), db.create_game()
+    assert db.append_game_events(by_events, _events(player_ids))[0]
+    assert db.update_game_state(by_state, db.get_game_state(by_events)['state'])[0]
+
+    rows = _rows(db, by_events)
+    assert rows == _rows(db, by_state)
+    assert len(rows['game_players']) == 5
+    # (quest_index, round_index, king, fails)
+    assert rows['rounds'] == [(0, 0, player_ids[0], 0), (1, 0, player_ids[1], 1), (1, 1, player_ids[2], 0)]
+    assert len(rows['round_approvals']) == 6
+
+
+def test_backfill_rebuilds_the_rows_from_the_states(db, add_players):
+    player_ids = add_players(db, 5)
+    game_id = db.create_game()
+    db.append_game_events(game_id, _events(player_ids))
+    expected = _rows(db, game_id)
+    with db.get_connection() as conn:
+        normalized.delete_game(conn.cursor(), game_id)
+        conn.commit()
+    assert _rows(db, game_id) == {table: [] for table in normalized.TABLES}
+    assert db.backfill_normalized(batch_size=1) == 1
+    assert _rows(db, game_id) == expected
@@ -0,0 +1,56 @@
+import pytest
+
+
+def _ids(notes):
+    return {note['noteId'] for note in notes}
+
+
+def test_search_matches_every_word_stems_and_prefixes(db):
+    game_id = db.create_game()
+    merlin = db.add_note(game_id, 'Merlin was hinting at the assassin all game')
+    hints = db.add_note(game_id, 'Percival hinted twice')
+    db.add_note(game_id, 'Nothing to see here')
+
+    assert _ids(db.search_notes('hint')[0]) == {merlin, hints}
+    assert _ids(db.search_notes('merlin hinting')[0]) == {merlin}
+    assert _ids(db.search_notes('perc*')[0]) == {hints}
+    # Quoted, so FTS5 operators in the input are just words
+    assert db.search_notes('NOT OR "')[0] == []
+    [note] = db.search_notes('assassin')[0]
+    assert '<mark>assassin</mark>' in note['snippet']
+    with pytest.raises(ValueError):
+        db.search_notes(' * ')
+
+
+def test_index_follows_deletes_and_edits(db):
+    game_id = db.create_game()
+    note_id = db.add_note(game_id, 'Morgana fooled Percival')
+    with db.get_connection() as conn:
+        conn.execute("UPDATE notes SET content = 'Oberon sat alone' WHERE noteId = ?", (note_id,))
+        conn.commit()
+    assert db.search_notes('morgana')[0] == []
+    assert _ids(db.search_notes('oberon')[0]) == {note_id}
+    assert db.delete_note(note_id)
+    assert db.search_notes('oberon')[0] == []
+
+
+def test_pages_filters_and_route(client, app_module):
+    game_ids = [client.post('/api/games/create').get_json()['gameId'] for _ in range(2)]
+    note_ids = {app_module.db.add_note(game_id, f'quest {n} failed') for n in range(3) for game_id in game_ids}
+
+    seen, cursor = set(), None
+    while True:
+        response = client.get('/api/notes/search', query_string={'q': 'fail', 'limit': 4, 'cursor': cursor})
+        assert response.status_code == 200
+        page = response.get_json()
+        seen |= _ids(page['notes'])
+        if (cursor := page['next_cursor']) is None:
+            break
+    assert seen == note_ids
+
+    notes = client.get('/api/notes/search', query_string={'q': 'quest', 'game_id': game_ids[0]}).get_json()['notes']
+    assert {note['gameId'] for note in notes} == {game_ids[0]} and len(notes) == 3
+    assert client.get('/api/notes/search?q=quest&until=2000-01-01').get_json()['notes'] == []
+    assert client.get('/api/notes/search?q=quest&since=yesterday').status_code == 400
+    assert client.get('/api/notes/search?q=quest&cursor=garbage').status_code == 400
+    assert client.get('/api/notes/search').status_code == 400
@@ -0,0 +1,42 @@
+import sqlite3
+
+from util.avalon import PlayerRegistry
+
+
+def test_unknown_counts_hits_and_misses():
+    registry = PlayerRegistry()
+    registry.update([1, 2])
+    assert registry.unknown({1, 2, 3}) == {3}
+    assert (registry.hits, registry.misses) == (2, 1)
+
+
+def test_added_players_validate_without_a_lookup(db, add_players, play):
+    player_ids = add_players(db, 5)
+    game_id = db.create_game()
+    misses = db.player_registry.misses
+    assert db.update_game_state(game_id, play(player_ids, [])) == (True, None)
+    assert db.player_registry.misses == misses
+
+
+def test_players_added_elsewhere_are_looked_up_once(db, play):
+    game_id = db.create_game()
+    # As if another worker process had added them
+    with sqlite3.connect(db.db_path) as conn:
+        conn.executemany("INSERT INTO players (player_id, name) VALUES (?, ?)",
+                         [(n, f'Player {n}') for n in range(1, 6)])
+    state = play(range(1, 6), [])
+    assert db.update_game_state(game_id, state) == (True, None)
+    misses = db.player_registry.misses
+    assert db.update_game_state(game_id, state) == (True, None)
+    assert db.player_registry.misses == misses
+
+
+def test_unknown_player_ids_are_rejected(db, add_players, play):
+    player_ids = add_players(db, 4)
+    game_id = db.create_game()
+    ok, error = db.update_game_state(game_id, play([*player_ids, 99], []))
+    assert not ok
+    assert '99' in error
+    ok, error = db.append_game_events(game_id, [('add_player', {'player_id': 99, 'role': ''})])
+    assert not ok
+    assert '99' in error
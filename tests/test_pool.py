@@ -0,0 +1,62 @@
+import os
+import threading
+
+
+def test_connections_are_reused(db):
+    for n in range(20):
+        db.add_player(f'Player {n}')
+        db.get_all_players()
+    counts = db.pool.counts()
+    assert counts['opened'] == 1
+    assert counts == {'idle': 1, 'in_use': 0, 'opened': 1}
+
+
+def test_pool_keeps_at_most_size_idle_connections(make_db):
+    db = make_db(pool_size=2)
+    held = [db.pool.acquire() for _ in range(4)]
+    for conn in held:
+        db.pool.release(conn)
+    assert db.pool.counts()['idle'] == 2
+
+
+def test_release_rolls_back_an_open_transaction(db):
+    db.add_player('Alice')
+    with db.get_connection() as conn:
+        conn.execute("UPDATE players SET name = 'Bob'")
+        assert conn.in_transaction
+    assert db.get_player(1)['name'] == 'Alice'
+
+
+def test_a_forked_child_leaves_inherited_connections_open(db, monkeypatch):
+    conn = db.pool.acquire()
+    conn.execute("INSERT INTO players (player_id, name) VALUES (1, 'Alice')")
+    parent = os.getpid()
+    monkeypatch.setattr(os, 'getpid', lambda: parent + 1)
+    db.pool.release(conn)
+    # Still the parent's: neither rolled back nor closed
+    assert conn.in_transaction
+    monkeypatch.undo()
+    conn.rollback()
+    db.pool.release(conn)
+    assert db.pool.counts()['idle'] == 1
+
+
+def test_concurrent_callers_share_the_pool(db):
+    errors = []
+
+    def work(n):
+        try:
+            for m in range(10):
+                db.add_player(f'Player {n}.{m}')
+                db.get_all_players()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(db.get_all_players()) == 80
+    assert db.pool.counts()['in_use'] == 0
@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+IMPORT_APP = f"""
+import importlib.util, json, pathlib, sys
+spec = importlib.util.spec_from_file_location('avalon_app', {str(ROOT / '__init__.py')!r})
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+print(json.dumps({{'flasgger': 'flasgger' in sys.modules, 'database': pathlib.Path('data').exists()}}))
+"""
+
+
+def _import_in_a_new_process(tmp_path, production):
+    env = {name: value for name, value in os.environ.items() if not name.startswith('AVALON_')}
+    env['PYTHONPATH'] = str(ROOT)
+    if production:
+        env['AVALON_PRODUCTION'] = '1'
+    result = subprocess.run([sys.executable, '-c', IMPORT_APP], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_production_import_leaves_flasgger_and_the_database_alone(tmp_path):
+    assert _import_in_a_new_process(tmp_path, production=True) == {'flasgger': False, 'database': False}
+    assert _import_in_a_new_process(tmp_path, production=False) == {'flasgger': True, 'database': True}
+
+
+def test_production_serves_the_same_spec_and_docs(load_app):
+    development = load_app().app.test_client().get('/apispec.json').get_json()
+    client = load_app(AVALON_PRODUCTION='1').app.test_client()
+
+    spec = client.get('/apispec.json').get_json()
+    assert spec['paths'] == development['paths']
+    assert spec['host'] != development['host']
+    assert '/api/games/create' in spec['paths'] and '/apispec.json' not in spec['paths']
+
+    docs = client.get('/apidocs/')
+    assert docs.status_code == 200 and b'apispec.json' in docs.data
+    assert client.get('/flasgger_static/swagger-ui-bundle.js').status_code == 200
+    assert client.post('/api/games/create').status_code == 201
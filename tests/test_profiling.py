@@ -0,0 +1,56 @@
+from collections import Counter
+
+from flask import Flask
+
+from util.avalon_profiling import PROFILE_HEADER, PROFILE_ID_HEADER, Profile
+
+TOKEN = 'profile-secret'
+AUTHORIZATION = {'Authorization': f'Bearer {TOKEN}'}
+
+
+def test_endpoints_are_absent_without_a_token(client):
+    assert client.get('/api/admin/profiles').status_code == 404
+    response = client.post('/api/games/create', headers={PROFILE_HEADER: ''})
+    assert PROFILE_ID_HEADER not in response.headers
+
+
+def test_the_token_triggers_and_reads_profiles(load_app):
+    client = load_app(AVALON_PROFILE_TOKEN=TOKEN).app.test_client()
+    assert client.get('/api/admin/profiles').status_code == 401
+    assert client.get('/api/admin/profiles', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert PROFILE_ID_HEADER not in client.post('/api/games/create', headers={PROFILE_HEADER: 'wrong'}).headers
+    assert PROFILE_ID_HEADER not in client.post('/api/games/create').headers
+
+    response = client.post('/api/games/create', headers={PROFILE_HEADER: TOKEN})
+    profile_id = int(response.headers[PROFILE_ID_HEADER])
+    [summary] = client.get('/api/admin/profiles', headers=AUTHORIZATION).get_json()
+    assert summary['profile_id'] == profile_id
+    assert (summary['trigger'], summary['method'], summary['endpoint'], summary['status']) == \
+        ('header', 'POST', 'create_game', 201)
+
+    detail = client.get(f'/api/admin/profiles/{profile_id}', headers=AUTHORIZATION).get_json()
+    assert 'functions' in detail
+    stacks = client.get(f'/api/admin/profiles/{profile_id}/stacks', headers=AUTHORIZATION)
+    assert stacks.mimetype == 'text/plain'
+    assert client.get('/api/admin/profiles/999', headers=AUTHORIZATION).status_code == 404
+
+
+def test_hot_functions_and_collapsed_stacks():
+    def outer():
+        pass
+
+    def inner():
+        pass
+
+    with Flask(__name__).test_request_context('/api/games/get'):
+        profile = Profile(1, 'sample', depth=0)
+    profile.samples = Counter({(outer.__code__, inner.__code__): 3, (outer.__code__,): 1})
+    functions = profile.hot_functions(limit=10)
+    assert [(f['function'].split()[0], f['self'], f['total']) for f in functions] == [
+        ('test_hot_functions_and_collapsed_stacks.<locals>.inner', 3, 3),
+        ('test_hot_functions_and_collapsed_stacks.<locals>.outer', 1, 4),
+    ]
+    assert functions[0]['self_percent'] == 75.0
+    lines = profile.collapsed_stacks().splitlines()
+    assert [line.rsplit(' ', 1)[1] for line in lines] == ['1', '3']
+    assert lines[1].count(';') == 1
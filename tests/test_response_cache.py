@@ -0,0 +1,67 @@
+import gzip
+import json
+
+from util import avalon_cache
+from util.avalon_cache import MIN_COMPRESS_BYTES, ResponseCache
+
+
+def test_lookups_are_by_game_and_version():
+    cache = ResponseCache(max_entries=2)
+    body = b'x' * MIN_COMPRESS_BYTES
+    assert cache.get('a', 1) is None
+    assert cache.put('a', 1, body, accept_gzip=True) == (gzip.compress(body, compresslevel=6), True)
+    assert cache.get('a', 1) == (body, False)
+    assert gzip.decompress(cache.get('a', 1, accept_gzip=True)[0]) == body
+    assert cache.get('a', 2) is None
+    # A slower reader of an older version doesn't replace the newer body
+    cache.put('a', 2, b'new')
+    cache.put('a', 1, b'old')
+    assert cache.get('a', 2) == (b'new', False)
+    # Small bodies aren't compressed
+    assert cache.get('a', 2, accept_gzip=True) == (b'new', False)
+    assert (cache.hits, cache.misses) == (4, 2)
+
+
+def test_least_recently_used_games_are_evicted():
+    cache = ResponseCache(max_entries=2)
+    for game_id in 'abc':
+        cache.put(game_id, 1, game_id.encode())
+        cache.get('a', 1)
+    assert cache.get('b', 1) is None
+    assert cache.get('a', 1) and cache.get('c', 1)
+    cache.discard('a')
+    assert cache.get('a', 1) is None
+    disabled = ResponseCache(max_entries=0)
+    assert disabled.put('a', 1, b'body') == (b'body', False)
+    assert disabled.get('a', 1) is None
+
+
+def test_route_serves_each_version_from_the_cache(client, app_module, add_players, monkeypatch):
+    monkeypatch.setattr(avalon_cache, 'MIN_COMPRESS_BYTES', 100)
+    db = app_module.db
+    player_ids = add_players(db, 5)
+    game_id = client.post('/api/games/create').get_json()['gameId']
+    for player_id in player_ids:
+        client.post(f'/api/games/{game_id}/players/add', json={'player_id': player_id, 'role': 'Loyal Servant'})
+
+    first = client.get(f'/api/games/{game_id}/get')
+    hits = db.responses.hits
+    second = client.get(f'/api/games/{game_id}/get')
+    assert db.responses.hits == hits + 1
+    assert second.get_data() == first.get_data()
+    assert 'Accept-Encoding' in second.headers['Vary']
+
+    zipped = client.get(f'/api/games/{game_id}/get', headers={'Accept-Encoding': 'gzip'})
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(zipped.get_data()) == first.get_data()
+    assert (first.headers['ETag'], zipped.headers['ETag']) == ('"5"', '"5-gzip"')
+    revalidated = client.get(f'/api/games/{game_id}/get',
+                             headers={'Accept-Encoding': 'gzip', 'If-None-Match': zipped.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.headers['ETag'] == '"5-gzip"'
+    assert 'Accept-Encoding' in revalidated.headers['Vary']
+
+    client.post(f'/api/games/{game_id}/quests/add')
+    changed = client.get(f'/api/games/{game_id}/get')
+    assert changed.get_json()['version'] == first.get_json()['version'] + 1
+    assert json.loads(changed.get_data())['state']['quests'] == [{'rounds': []}]
@@ -0,0 +1,65 @@
+from fractions import Fraction
+from itertools import combinations
+
+import pytest
+
+import util.avalon_game_state as ags
+from util.avalon_inference import RoleInference
+
+
+def _brute_force(state, num_evil):
+    """Evil probability of each seat, enumerating assignments by player id"""
+    player_ids = ags.get_player_ids(state)
+    roles = {player['player_id']: ags.get_role_side(player['role']) for player in state['players']}
+    rounds = [round for quest in state['quests'] for round in quest['rounds'] if round.get('fails')]
+    consistent = []
+    for evil in map(set, combinations(player_ids, num_evil)):
+        if (all(len(evil & set(round['team'])) >= round['fails'] for round in rounds)
+                and all((side == 'evil') == (player_id in evil) for player_id, side in roles.items() if side)):
+            consistent.append(evil)
+    return len(consistent), [Fraction(sum(player_id in evil for evil in consistent), len(consistent))
+                             for player_id in player_ids]
+
+
+def test_probabilities_match_enumerating_every_assignment(play):
+    players = [1, 2, 3, 4, 5, 6, 7]
+    state = play(players, [([1, 2], players, 0), ([1, 3, 4], players, 1), ([2, 4, 5], players, 1),
+                           ([4, 6, 7], [], None)], roles=['Merlin', '', '', '', '', '', ''])
+    inference = RoleInference().infer(state)
+
+    assignments, expected = _brute_force(state, 3)
+    assert inference['evil_count'] == 3
+    assert inference['assignments'] == assignments
+    assert [player['player_id'] for player in inference['players']] == players
+    assert [pytest.approx(float(p)) for p in expected] == [p['evil_probability'] for p in inference['players']]
+    assert inference['players'][0]['evil_probability'] == 0
+
+
+def test_another_round_filters_the_cached_survivors(play):
+    inference = RoleInference(cache_size=8)
+    players = [1, 2, 3, 4, 5]
+    before = play(players, [([1, 2, 3], players, 1)])
+    inference.infer(before)
+    assert len(inference._cache) == 2
+
+    after = play(players, [([1, 2, 3], players, 1), ([1, 3, 4], players, 0), ([3, 4], players, 2)])
+    result = inference.infer(after)
+    # Only the new constraint is stored; the played round without fails isn't one
+    assert len(inference._cache) == 3
+    assert [p['evil_probability'] for p in result['players']] == [0, 0, 1, 1, 0]
+
+
+def test_impossible_rounds_and_unsupported_games(client):
+    state = ags.create_initial_game_state()
+    for player_id in range(1, 6):
+        state = ags.add_player(state, player_id, '')
+    state = ags.add_quest(state)
+    state = ags.add_round(state, 0, [1, 2, 3], 1)
+    state = ags.update_fails(ags.update_approvals(state, 0, 0, [1, 2, 3]), 0, 0, 3)
+    result = RoleInference().infer(state)
+    assert result['assignments'] == 0
+    assert {p['evil_probability'] for p in result['players']} == {None}
+
+    game_id = client.post('/api/games/create').get_json()['gameId']
+    assert client.get(f'/api/games/{game_id}/inference').status_code == 400
+    assert client.get('/api/games/nope/inference').status_code == 404
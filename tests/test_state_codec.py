@@ -0,0 +1,66 @@
+import pytest
+
+from util.avalon_codec import UnencodableState, decode_state, encode_state
+
+
+def _state(num_players=10):
+    player_ids = [1000 + n for n in range(num_players)]
+    return {
+        'players': [{'player_id': player_id, 'role': 'Merlin' if n == 0 else 'Évil ☠' if n == 1 else ''}
+                    for n, player_id in enumerate(player_ids)],
+        'quests': [
+            {'rounds': [{'team': player_ids[:3], 'approvals': player_ids[::2], 'fails': 1, 'king': player_ids[9]},
+                        # Out of seat order, so the order is stored
+                        {'team': [player_ids[8], player_ids[1]], 'approvals': [], 'king': player_ids[0]}]},
+            {'rounds': [{'team': [player_ids[2]], 'king': player_ids[2]}]},
+            {'rounds': []},
+        ],
+    }
+
+
+def test_round_trip_keeps_the_exact_state():
+    state = _state()
+    assert decode_state(encode_state(state)) == state
+    empty = {'players': [], 'quests': []}
+    assert decode_state(encode_state(empty)) == empty
+
+
+@pytest.mark.parametrize('change', [
+    lambda state: state.update(extra=1),
+    lambda state: state['players'].append({'player_id': 1000, 'role': ''}),
+    lambda state: state['players'][0].update(player_id=2 ** 32),
+    lambda state: state['quests'][0]['rounds'][0].update(team=[1]),
+    lambda state: state['quests'][0]['rounds'][0].update(fails=500),
+    lambda state: state['quests'][0]['rounds'][0].update(approvals=[1000, 1000]),
+])
+def test_states_the_format_cannot_hold_are_rejected(change):
+    state = _state()
+    change(state)
+    with pytest.raises(UnencodableState):
+        encode_state(state)
+
+
+def test_binary_database_reads_and_writes_both_codecs(make_db, add_players, play):
+    json_db = make_db()
+    player_ids = add_players(json_db, 5)
+    json_game = json_db.create_game()
+    json_db.update_game_state(json_game, play(player_ids, [(player_ids[:2], player_ids[:3], 0)]))
+    json_db.close()
+
+    binary_db = make_db(state_codec='binary')
+    binary_game = binary_db.create_game()
+    state = play(player_ids, [(player_ids[:2], player_ids, None)])
+    binary_db.update_game_state(binary_game, state)
+    # A role too long for the format is kept as JSON
+    long_role = play(player_ids, [], roles=['x' * 300, '', '', '', ''])
+    long_role_game = binary_db.create_game()
+    assert binary_db.update_game_state(long_role_game, long_role)[0]
+
+    with binary_db.get_connection() as conn:
+        rows = dict(conn.execute("SELECT gameId, state_blob IS NOT NULL FROM games").fetchall())
+    assert rows == {json_game: 0, binary_game: 1, long_role_game: 0}
+    assert binary_db.get_game_state(binary_game)['state'] == state
+    assert binary_db.get_game_state(long_role_game)['state'] == long_role
+    assert len(binary_db.get_game_state(json_game)['state']['players']) == 5
+    with pytest.raises(ValueError):
+        make_db(state_codec='pickle')
@@ -0,0 +1,99 @@
+import random
+
+import util.avalon_game_state as ags
+from util.avalon_stats import GAME_ENDED
+
+ROLES = ['Merlin', 'Percival', 'Loyal Servant', 'Assassin', 'Morgana', '']
+
+
+def _reference(states, player_id):
+    """The counters of one player, counted round by round"""
+    counts = dict.fromkeys(['games', 'decided_games', 'wins', 'votes', 'approvals', 'proposals',
+                            'failed_proposals', 'quests', 'failed_quests'], 0)
+    for state in states:
+        if player_id not in ags.get_player_ids(state):
+            continue
+        counts['games'] += 1
+        winner = ags.get_game_winner(ags.get_game_summary(state))
+        role = next(player['role'] for player in state['players'] if player['player_id'] == player_id)
+        side = ags.get_role_side(role)
+        if winner and side:
+            counts['decided_games'] += 1
+            counts['wins'] += side == winner
+        for quest_index, quest in enumerate(state['quests']):
+            for index, round in enumerate(quest['rounds']):
+                went = index == len(quest['rounds']) - 1 and ags.get_quest_result(state, quest_index) is not None
+                # The game's last round is only known to have been voted on once its team went or got an approval
+                last = quest_index == len(state['quests']) - 1 and index == len(quest['rounds']) - 1
+                counts['votes'] += went or bool(round['approvals']) or not last
+                counts['approvals'] += player_id in round['approvals']
+                failed = went and round['fails'] > 0
+                if round['king'] == player_id:
+                    counts['proposals'] += 1
+                    counts['failed_proposals'] += failed
+                if went and player_id in round['team']:
+                    counts['quests'] += 1
+                    counts['failed_quests'] += failed
+    return counts
+
+
+def _random_game(rng, player_ids):
+    seats = rng.sample(player_ids, 6)
+    state = ags.create_initial_game_state()
+    for player_id in seats:
+        state = ags.add_player(state, player_id, rng.choice(ROLES))
+    for quest_index in range(5):
+        state = ags.add_quest(state)
+        for round_index in range(rng.randint(1, 3)):
+            state = ags.add_round(state, quest_index, rng.sample(seats, 3), rng.choice(seats))
+            state = ags.update_approvals(state, quest_index, round_index, rng.sample(seats, rng.randint(0, 6)))
+            state = ags.update_fails(state, quest_index, round_index, rng.choice([0, 0, 1]))
+    return state
+
+
+def test_counts_match_a_round_by_round_reference(db, add_players):
+    rng = random.Random(1)
+    player_ids = add_players(db, 8)
+    states = []
+    for _ in range(12):
+        game_id = db.create_game()
+        states.append(_random_game(rng, player_ids))
+        assert db.update_game_state(game_id, states[-1])[0]
+        db.set_game_active_status(game_id, GAME_ENDED)
+    # Games that haven't ended are left out
+    db.update_game_state(db.create_game(), _random_game(rng, player_ids))
+
+    for player_id in player_ids:
+        stats = db.get_player_stats(player_id)
+        expected = _reference(states, player_id)
+        assert {name: stats[name] for name in expected} == expected
+        assert stats['rejections'] == stats['votes'] - stats['approvals']
+
+
+def test_running_totals_match_a_recount(db, add_players):
+    rng = random.Random(2)
+    player_ids = add_players(db, 8)
+    db.get_player_stats()
+    for _ in range(5):
+        game_id = db.create_game()
+        db.update_game_state(game_id, _random_game(rng, player_ids))
+        db.set_game_active_status(game_id, GAME_ENDED)
+    incremental = db.get_player_stats()
+    db.player_stats.invalidate()
+    assert db.get_player_stats() == incremental
+
+
+def test_rounds_awaiting_a_vote_are_not_rejections(db, add_players, play):
+    player_ids = add_players(db, 5)
+    game_id = db.create_game()
+    # Quest 1 played; quest 2 had one team voted down and another not yet voted on
+    state = play(player_ids, [(player_ids[:2], player_ids[:3], 0), (player_ids[:2], [], None)])
+    state = ags.add_round(state, 1, player_ids[2:4], player_ids[2])
+    db.update_game_state(game_id, state)
+    db.set_game_active_status(game_id, GAME_ENDED)
+
+    stats = db.get_player_stats(player_ids[4])
+    assert (stats['votes'], stats['approvals'], stats['rejections']) == (2, 0, 2)
+    stats = db.get_player_stats(player_ids[0])
+    assert (stats['votes'], stats['approvals'], stats['rejections']) == (2, 1, 1)
+    assert (stats['quests'], stats['failed_quests']) == (1, 0)
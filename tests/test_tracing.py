@@ -0,0 +1,55 @@
+import json
+import logging
+
+from util.avalon_tracing import QueryTracer, statement_shape
+
+TOKEN = 'admin-secret'
+AUTHORIZATION = {'Authorization': f'Bearer {TOKEN}'}
+
+
+def test_statement_shape_drops_values():
+    sql = """SELECT * FROM  notes
+             WHERE gameId = 'it''s' AND rowid IN (1, 2.5, 3) AND content IS NOT NULL AND t1.x = ?"""
+    assert statement_shape(sql) == \
+        "SELECT * FROM notes WHERE gameId = ? AND rowid IN (?) AND content IS NOT ? AND t1.x = ?"
+
+
+def test_tracer_collects_requests_repeats_and_slow_statements(tmp_path, caplog):
+    tracer = QueryTracer(slow_query_ms=0, repeat_threshold=3)
+    conn = tracer.connect(str(tmp_path / 'traced.db'))
+    conn.execute("CREATE TABLE players (name TEXT)")
+    token = tracer.start_request('POST /players')
+    with caplog.at_level(logging.WARNING, logger='util.avalon_tracing'):
+        for name in ('Ada', 'Grace', 'Edsger'):
+            conn.execute("INSERT INTO players VALUES (?)", (name,))
+            conn.execute(f"SELECT * FROM players WHERE name = '{name}'").fetchall()
+        conn.commit()
+    summary = tracer.finish_request(token, '/players', 201)
+    conn.close()
+
+    assert summary['repeated'] == [{'sql': "INSERT INTO players VALUES (?)", 'count': 3},
+                                   {'sql': "SELECT * FROM players WHERE name = ?", 'count': 3}]
+    assert summary['queries'] >= 6
+    report = json.dumps(tracer.report())
+    for name in ('Ada', 'Grace', 'Edsger'):
+        assert name not in report and name not in caplog.text
+    assert 'Slow statement' in caplog.text
+    assert tracer.report()['routes'][0]['request'] == 'POST /players'
+
+
+def test_report_needs_tracing_and_the_admin_token(load_app):
+    untraced = load_app(AVALON_ADMIN_TOKEN=TOKEN)
+    assert untraced.db.queries is None
+    client = untraced.app.test_client()
+    assert client.get('/api/admin/queries', headers=AUTHORIZATION).status_code == 404
+    assert 'Server-Timing' not in client.post('/api/games/create').headers
+
+    assert load_app(AVALON_TRACE_QUERIES='1').app.test_client().get('/api/admin/queries').status_code == 404
+
+    client = load_app(AVALON_TRACE_QUERIES='1', AVALON_ADMIN_TOKEN=TOKEN).app.test_client()
+    assert client.post('/api/players/add', json={'name': 'Secret Agent'}).headers['Server-Timing'].startswith('db;')
+    assert client.get('/api/admin/queries').status_code == 401
+    response = client.get('/api/admin/queries', headers=AUTHORIZATION)
+    assert response.status_code == 200
+    assert 'POST /api/players/add' in {route['request'] for route in response.get_json()['routes']}
+    assert b'Secret Agent' not in response.data
@@ -0,0 +1,51 @@
+import util.avalon_game_state as ags
+
+PLAYERS = {1, 2, 3, 4, 5}
+
+
+def _state():
+    state = ags.create_initial_game_state()
+    for player_id in sorted(PLAYERS):
+        state = ags.add_player(state, player_id)
+    state = ags.add_quest(state)
+    return ags.add_round(state, 0, [1, 2], 1)
+
+
+def test_valid_state_passes():
+    assert ags.validate_game_state(_state(), PLAYERS) == (True, None)
+
+
+def test_errors_locate_the_bad_node():
+    state = ags.update_approvals(_state(), 0, 0, [1, 9])
+    assert ags.validate_game_state(state, PLAYERS) == (
+        False, 'Invalid approval player_id in Round 0 in Quest 0: 9')
+    assert ags.validate_game_state(ags.add_player(_state(), 9), PLAYERS) == (
+        False, 'Invalid player player_id in Player 5: 9')
+    assert ags.validate_game_state(ags.add_round(_state(), 0, [1, 2], 9), PLAYERS) == (
+        False, 'Invalid king player_id in Round 1 in Quest 0: 9')
+    state = {**_state(), 'players': [{'player_id': '1', 'role': ''}]}
+    assert ags.validate_game_state(state, PLAYERS) == (False, 'Player id in Player 0 must be an int')
+    state = ags.add_round(ags.add_quest(_state()), 1, [1], 1)
+    del state['quests'][1]['rounds'][0]['king']
+    assert ags.validate_game_state(state, PLAYERS) == (False, 'Round 0 in Quest 1 missing "king" field')
+
+
+def test_validate_event_checks_only_the_touched_round():
+    state = _state()
+    # An invalid round elsewhere is not looked at
+    broken = ags.add_round(state, 0, [9], 9)
+    event = ('update_fails', {'quest_index': 0, 'round_index': 0, 'fails': 1})
+    assert ags.validate_event(ags.apply_events(broken, [event]), *event, PLAYERS) == (True, None)
+    event = ('update_approvals', {'quest_index': 0, 'round_index': 1, 'approvals': [1]})
+    ok, error = ags.validate_event(ags.apply_events(broken, [event]), *event, PLAYERS)
+    assert not ok and error.startswith('Invalid team member player_id in Round 1 in Quest 0')
+
+
+def test_optional_round_fields_may_be_missing():
+    state = _state()
+    round = state['quests'][0]['rounds'][0]
+    del round['fails'], round['approvals']
+    assert ags.validate_game_state(state, PLAYERS) == (True, None)
+    assert ags.get_approvals(round) == []
+    assert ags.get_failures(round) is None
+    assert ags.get_quest_result(state, 0) is None
@@ -1,376 +1,1142 @@
-import os
-import sqlite3
-import json
-import uuid
-
-from typing import Dict, List, Optional, Any, Tuple
-from contextlib import contextmanager
-import datetime
-from pathlib import Path
-
-import util.avalon_game_state as ags
-
-
-class AvalonDBConfig:
-    def __init__(self, env: str = "prod"):
-        self.env = env
-        self.data_dir = Path("data")
-        self.data_dir.mkdir(exist_ok=True)
-
-        if self.env == "test":
-            self.db_path = self.data_dir / "avalon_test.db"
-        else:
-            self.db_path = self.data_dir / "avalon.db"
-
-
-class AvalonDB:
-    def __init__(self, config: AvalonDBConfig = None):
-        if config is None:
-            config = AvalonDBConfig()
-        self.db_path = str(config.db_path)
-        self.initialize_database()
-
-    @contextmanager
-    def get_connection(self):
-        """Context manager for database connections"""
-        conn = sqlite3.connect(self.db_path)
-        # Enable foreign keys
-        conn.execute("PRAGMA foreign_keys = ON")
-        # Enable returning dictionary-like objects
-        conn.row_factory = sqlite3.Row
-        try:
-            yield conn
-        finally:
-            conn.close()
-
-    def initialize_database(self):
-        """Create tables if they don't exist"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS players (
-                    player_id INTEGER PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    active INTEGER NOT NULL DEFAULT 1
-                )
-            """)
-
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS games (
-                    gameId TEXT PRIMARY KEY,
-                    state TEXT NOT NULL,  -- JSON stored as TEXT
-                    start_time TEXT NOT NULL,
-                    active INTEGER NOT NULL DEFAULT 0
-                )
-            """)
-
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS notes (
-                    noteId TEXT PRIMARY KEY,
-                    gameId TEXT NOT NULL,
-                    timestamp TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    FOREIGN KEY (gameId) REFERENCES games(gameId) ON DELETE CASCADE
-                )
-            """)
-            
-            conn.commit()
-
-    # Player operations
-    def add_player(self, name: str) -> Tuple[bool, Optional[int]]:
-        """Add a new player to the database"""
-        player_id = self.get_next_player_id()
-        try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "INSERT INTO players (player_id, name, active) VALUES (?, ?, 1)",
-                    (player_id, name)
-                )
-                conn.commit()
-                return True, player_id
-        except sqlite3.IntegrityError:
-            return False, None
-
-    def set_player_active(self, player_id: int, active: bool) -> bool:
-        """Set the active status of a player"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE players SET active = ? WHERE player_id = ?",
-                (1 if active else 0, player_id)
-            )
-            conn.commit()
-            return cursor.rowcount > 0
-
-    def get_active_players(self) -> List[Dict]:
-        """Get all active players"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM players WHERE active = 1")
-            return [dict(row) for row in cursor.fetchall()]
-
-    def get_player(self, player_id: int) -> Optional[Dict]:
-        """Get player by player_id"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM players WHERE player_id = ?", (player_id,))
-            result = cursor.fetchone()
-            return dict(result) if result else None
-
-    def get_all_players(self) -> List[Dict]:
-        """Get all players"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM players")
-            return [dict(row) for row in cursor.fetchall()]
-
-    def get_next_player_id(self) -> int:
-        """Get the next available player ID"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT MAX(player_id) FROM players")
-            result = cursor.fetchone()[0]
-            return (result + 1) if result is not None else 1
-
-    def update_player_name(self, player_id: int, name: str) -> bool:
-        """Update a player's name by player_id"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE players SET name = ? WHERE player_id = ?",
-                (name, player_id)
-            )
-            conn.commit()
-            return cursor.rowcount > 0
-
-    # Game operations
-    def create_game(self) -> str:
-        """Create a new game with initial state and return its ID"""
-        game_id = str(uuid.uuid4())
-        initial_state = ags.create_initial_game_state()
-        start_time = datetime.datetime.now(datetime.UTC).isoformat()
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO games (gameId, state, start_time, active) VALUES (?, ?, ?, 0)",
-                (game_id, json.dumps(initial_state), start_time)
-            )
-            conn.commit()
-        return game_id
-
-    def set_game_active_status(self, game_id: str, active_status: int) -> bool:
-        """Set the active status of a game"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE games SET active = ? WHERE gameId = ?",
-                (active_status, game_id)
-            )
-            conn.commit()
-            return cursor.rowcount > 0
-
-    def get_games(self) -> list[dict[str, str]]:
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM games ORDER BY start_time DESC")
-            games = [dict(row) for row in cursor.fetchall()]
-            return games
-
-    def get_game_state(self, game_id: str) -> Optional[Dict]:
-        """Get game by ID"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM games WHERE gameId = ?", (game_id,))
-            result = cursor.fetchone()
-            if result:
-                row = dict(result)
-                row['state'] = json.loads(row['state'])
-                return row
-            return None
-
-    def update_game_state(self, game_id: str, new_state: ags.GameState) -> tuple[bool, Optional[str]]:
-        """
-        Update game state after validating it
-        
-        Args:
-            game_id: ID of the game to update
-            new_state: New game state to save
-        
-        Returns:
-            tuple[bool, Optional[str]]: (True, None) if update was successful, (False, error_message) if failed
-        """
-        # Get list of valid player_ids from database
-        valid_player_ids = [player['player_id'] for player in self.get_all_players()]
-        
-        # Validate the new state before saving
-        is_valid, error_msg = ags.validate_game_state(new_state, valid_player_ids)
-        if not is_valid:
-            return False, error_msg
-            
-        try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "UPDATE games SET state = ? WHERE gameId = ?",
-                    (json.dumps(new_state), game_id)
-                )
-                conn.commit()
-                return (cursor.rowcount > 0, None)
-        except sqlite3.Error as e:
-            return False, f"Database error: {str(e)}"
-
-    # Note operations
-    def add_note(self, game_id: str, content: str) -> Optional[str]:
-        """Add a new note and return its ID"""
-        try:
-            note_id = str(uuid.uuid4())
-            timestamp = datetime.datetime.now(datetime.UTC).isoformat()
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "INSERT INTO notes (noteId, gameId, timestamp, content) VALUES (?, ?, ?, ?)",
-                    (note_id, game_id, timestamp, content)
-                )
-                conn.commit()
-                return note_id
-        except sqlite3.Error:
-            return None
-
-    def get_game_notes(self, game_id: str) -> List[Dict]:
-        """Get all notes for a specific game"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT * FROM notes WHERE gameId = ? ORDER BY timestamp DESC",
-                (game_id,)
-            )
-            return [dict(row) for row in cursor.fetchall()]
-
-    def get_note(self, note_id: str) -> Optional[Dict]:
-        """Get note by ID"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM notes WHERE noteId = ?", (note_id,))
-            result = cursor.fetchone()
-            return dict(result) if result else None
-
-    def delete_note(self, note_id: str) -> bool:
-        """Delete a note by ID"""
-        try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM notes WHERE noteId = ?", (note_id,))
-                conn.commit()
-                return cursor.rowcount > 0
-        except sqlite3.Error:
-            return False
-
-if __name__ == "__main__":
-    # Set up test environment
-    test_config = AvalonDBConfig(env="test")
-    
-    # Delete existing test database if it exists
-    if test_config.db_path.exists():
-        test_config.db_path.unlink()
-    
-    # Create fresh database
-    db = AvalonDB(test_config)
-    
-    # Add 5 test players
-    test_players = [
-        (1, "Alice Anderson"),
-        (2, "Bob Baker"),
-        (3, "Carol Chen"),
-        (4, "Dave Davis"),
-        (5, "Eve Edwards")
-    ]
-    
-    print("Adding players...")
-    for player_id, name in test_players:
-        success = db.add_player(player_id, name)
-        print(f"Added {name} ({player_id}): {'✓' if success else '✗'}")
-    
-    # Create a new game
-    game_id = db.create_game()
-    print(f"\nCreated game: {game_id}")
-    
-    # Get initial state
-    game = db.get_game_state(game_id)
-    state = game['state']
-    
-    # First quest - 2 rounds
-    print("\nQuest 1:")
-    state = ags.add_quest(state)
-    
-    # Round 1
-    state = ags.add_round(state, 0, ["alice", "bob"])
-    state = ags.update_approvals(state, 0, 0, ["alice", "bob", "carol"])
-    state = ags.update_fails(state, 0, 0, 1)
-    print("Round 1: Failed")
-    
-    # Add note about suspicious behavior
-    db.add_note(game_id, "Quest 1, Round 1: Bob seemed nervous when team was proposed")
-    
-    # Round 2
-    state = ags.add_round(state, 0, ["carol", "dave"])
-    state = ags.update_approvals(state, 0, 1, ["alice", "bob", "carol", "dave", "eve"])
-    state = ags.update_fails(state, 0, 1, 0)
-    print("Round 2: Succeeded")
-    
-    db.add_note(game_id, "Quest 1, Round 2: Eve's confidence in approving this team was notable")
-    
-    # Second quest - 3 rounds
-    print("\nQuest 2:")
-    state = ags.add_quest(state)
-    
-    # Round 1
-    state = ags.add_round(state, 1, ["eve", "alice", "bob"])
-    state = ags.update_approvals(state, 1, 0, ["bob", "carol", "dave"])
-    state = ags.update_fails(state, 1, 0, 2)
-    print("Round 1: Failed")
-    
-    # Round 2
-    state = ags.add_round(state, 1, ["carol", "dave", "eve"])
-    state = ags.update_approvals(state, 1, 1, ["alice", "dave", "eve"])
-    state = ags.update_fails(state, 1, 1, 1)
-    print("Round 2: Failed")
-    
-    db.add_note(game_id, "Quest 2: Dave keeps pushing for teams with Eve")
-    
-    # Round 3
-    state = ags.add_round(state, 1, ["alice", "carol", "eve"])
-    state = ags.update_approvals(state, 1, 2, ["alice", "bob", "carol", "dave", "eve"])
-    state = ags.update_fails(state, 1, 2, 0)
-    print("Round 3: Succeeded")
-    
-    # After game ends, add roles
-    roles = ["Merlin", "Assassin", "Loyal Servant", "Morgana", "Percival"]
-    for (alias, _), role in zip(test_players, roles):
-        state = ags.add_player(state, alias, role)
-    
-    # Save final state
-    db.update_game_state(game_id, state)
-    
-    # Add final notes about the game
-    db.add_note(game_id, "Final thoughts: Dave (Morgana) played well but got too obvious with Eve")
-    db.add_note(game_id, "Bob correctly identified Alice as Merlin - good read on the Quest 2 approval pattern")
-    
-    # Print game summary
-    print("\nGame Summary:")
-    print(f"Number of quests: {len(state['quests'])}")
-    print(f"Number of players: {len(state['players'])}")
-    
-    # Print quest results
-    for quest_idx in range(len(state['quests'])):
-        result = ags.get_quest_result(state, quest_idx)
-        print(f"Quest {quest_idx + 1} result: {'Success' if result else 'Failure'}")
-    
-    # Print all notes
-    print("\nGame Notes:")
-    notes = db.get_game_notes(game_id)
-    notes.sort(key=lambda n: n['timestamp'])
-    for note in notes:
-        print(f"\n[{note['timestamp']}]")
+import os
+import sqlite3
+import json
+import random
+import threading
+import time
+import uuid
+
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Any, Tuple
+from contextlib import contextmanager
+import datetime
+from pathlib import Path
+
+import util.avalon_game_state as ags
+import util.avalon_normalized as normalized
+from util.avalon_cache import DEFAULT_RESPONSE_CACHE_SIZE, ResponseCache
+from util.avalon_codec import UnencodableState, decode_state, encode_state
+from util.avalon_migrations import NOTES_FTS_INSERT_TRIGGER, migrate
+from util.avalon_pubsub import GameBroker
+from util.avalon_stats import GAME_ENDED, PlayerStats
+from util.avalon_tracing import DEFAULT_SLOW_QUERY_MS, QueryTracer
+
+
+DEFAULT_POOL_SIZE = 5
+DEFAULT_SNAPSHOT_INTERVAL = 20
+DEFAULT_WRITE_ATTEMPTS = 5
+DEFAULT_SEARCH_LIMIT = 20
+DEFAULT_EXPORT_BATCH = 500
+DEFAULT_IMPORT_BATCH = 5000
+
+# How game state snapshots are stored: JSON text in games.state, or the
+# compact format of util.avalon_codec in games.state_blob
+STATE_CODECS = ('json', 'binary')
+
+# Error returned by versioned writes when the game changed since it was read
+VERSION_CONFLICT = "Version conflict"
+
+
+def retry_on_conflict(write: Callable[[], tuple[bool, Optional[str]]],
+                      attempts: int = DEFAULT_WRITE_ATTEMPTS) -> tuple[bool, Optional[str]]:
+    """
+    Run a read-modify-write until it stops losing version races
+
+    `write` must re-read whatever it modifies on every call and return the
+    (success, error) pair of a versioned write. Between attempts it backs off
+    for a short randomized delay rather than holding a database lock.
+    """
+    for attempt in range(attempts):
+        success, error = write()
+        if error != VERSION_CONFLICT:
+            break
+        time.sleep(random.uniform(0, 0.005 * 2 ** attempt))
+    return success, error
+
+
+# Columns of a game as get_game_state and get_games return it
+GAME_FIELDS = ('gameId', 'start_time', 'active', 'version', 'state')
+# Columns list_games can return: those, and the summary kept for listings
+GAME_LIST_FIELDS = (
+    'gameId', 'start_time', 'active', 'version',
+    'player_ids', 'player_count', 'quests_succeeded', 'quests_failed', 'state'
+)
+
+# What _replay_events needs to rebuild the game's state, besides the other GAME_FIELDS
+_GAME_COLUMNS = "gameId, state, state_blob, start_time, active, version, snapshot_version"
+
+_SUMMARY_ASSIGNMENTS = "player_ids = ?, player_count = ?, quests_succeeded = ?, quests_failed = ?"
+
+
+def _import_row(kind: str, record: Dict, player_ids: set[int]) -> Any:
+    """Insert parameters for one exported record"""
+    if kind == 'player':
+        player_id = int(record['player_id'])
+        player_ids.add(player_id)
+        return player_id, str(record['name']), int(record.get('active', 1))
+    if kind == 'game':
+        state = record['state']
+        is_valid, error_msg = ags.validate_game_state(state, player_ids)
+        if not is_valid:
+            raise ValueError(error_msg)
+        # Imported states are snapshots with no event log behind them
+        version = int(record.get('version', 0))
+        return (str(record['gameId']), str(record['start_time']), int(record.get('active', 0)),
+                version, version, *_summary_params(state)), state
+    if kind == 'note':
+        return str(record['noteId']), str(record['gameId']), str(record['timestamp']), str(record['content'])
+    raise ValueError(f"Unknown record type: {kind}")
+
+
+def to_ndjson(records: Iterable[Dict]) -> Iterator[str]:
+    """Encode records as newline-delimited JSON, one line at a time"""
+    for record in records:
+        yield json.dumps(record, separators=(',', ':')) + '\n'
+
+
+def from_ndjson(lines: Iterable[str]) -> Iterator[Dict]:
+    """
+    Decode newline-delimited JSON lazily, skipping blank lines
+
+    Raises:
+        ValueError: If a line is not valid JSON, with its 1-based line number
+    """
+    for number, line in enumerate(lines, start=1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Line {number}: {e}") from e
+
+
+def _match_expression(query: str) -> str:
+    """
+    FTS5 query matching notes that contain every word of a search
+
+    Each word is quoted so punctuation in user input can't be parsed as FTS5
+    syntax; a trailing * keeps its meaning as a prefix search.
+    """
+    terms = []
+    for word in query.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*').replace('"', '""')
+        if word:
+            terms.append(f'"{word}"*' if prefix else f'"{word}"')
+    if not terms:
+        raise ValueError("Empty search query")
+    return ' '.join(terms)
+
+
+def _load_state(text: str, blob: Optional[bytes]) -> ags.GameState:
+    """Decode a snapshot stored by either state codec"""
+    return decode_state(blob) if blob is not None else json.loads(text)
+
+
+def _summary_params(state: ags.GameState) -> tuple:
+    """Values for _SUMMARY_ASSIGNMENTS, in order"""
+    summary = ags.get_game_summary(state)
+    return (json.dumps(summary['player_ids']), summary['player_count'],
+            summary['quests_succeeded'], summary['quests_failed'])
+
+
+class AvalonDBConfig:
+    def __init__(self, env: str = "prod", data_dir: Optional[Path] = None, pool_size: int = DEFAULT_POOL_SIZE,
+                 snapshot_interval: int = DEFAULT_SNAPSHOT_INTERVAL, state_codec: str = 'json',
+                 response_cache_size: int = DEFAULT_RESPONSE_CACHE_SIZE, compress_responses: bool = True,
+                 defer_init: bool = False, trace_queries: bool = False,
+                 slow_query_ms: float = DEFAULT_SLOW_QUERY_MS):
+        self.env = env
+        self.data_dir = Path(data_dir) if data_dir is not None else Path("data")
+        # Idle connections kept warm between requests; 0 connects per call
+        self.pool_size = pool_size
+        # Number of logged events after which games.state is rewritten
+        self.snapshot_interval = snapshot_interval
+        # Either codec reads both formats, so a database can switch at any time
+        if state_codec not in STATE_CODECS:
+            raise ValueError(f"Unknown state codec: {state_codec}")
+        self.state_codec = state_codec
+        # Games whose serialized response is kept in memory; 0 disables it
+        self.response_cache_size = response_cache_size
+        # Also keep a gzipped copy of each cached response
+        self.compress_responses = compress_responses
+        # Create and migrate the database on first use instead of in AvalonDB()
+        self.defer_init = defer_init
+        # Trace every statement (see util.avalon_tracing), logging those slower than slow_query_ms
+        self.trace_queries = trace_queries
+        self.slow_query_ms = slow_query_ms
+
+        if self.env == "test":
+            self.db_path = self.data_dir / "avalon_test.db"
+        else:
+            self.db_path = self.data_dir / "avalon.db"
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of long-lived SQLite connections
+
+    Connections are opened with their pragmas applied once and handed out one
+    caller at a time, so each worker thread keeps reusing a warm connection.
+    Up to `size` idle connections are kept; any extra ones opened under load
+    are closed when released. After a fork the child drops the inherited
+    connections and starts a fresh pool.
+    """
+
+    def __init__(self, db_path: str, size: int = DEFAULT_POOL_SIZE, tracer: Optional[QueryTracer] = None):
+        self.db_path = db_path
+        self.size = size
+        self.tracer = tracer
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._idle: List[sqlite3.Connection] = []
+        self._in_use = 0
+        self._opened = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.tracer is not None:
+            conn = self.tracer.connect(self.db_path)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        # Readers and the writer don't block each other, so a long read
+        # transaction (e.g. export_records) doesn't lock out writes.
+        # The mode is stored in the database file, so this converts it once
+        conn.execute("PRAGMA journal_mode = WAL")
+        # Enable foreign keys
+        conn.execute("PRAGMA foreign_keys = ON")
+        # Enable returning dictionary-like objects
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Take an idle connection, opening a new one if none is available"""
+        if self._pid != os.getpid():
+            # SQLite connections must not cross a fork; never close the
+            # parent's handles from the child, just forget them
+            self._reset()
+        with self._lock:
+            self._in_use += 1
+            if self._idle:
+                return self._idle.pop()
+            self._opened += 1
+        return self._connect()
+
+    def release(self, conn: sqlite3.Connection):
+        """Return a connection to the pool, closing it if the pool is full"""
+        if self._pid != os.getpid():
+            # Taken before a fork: the handle belongs to the parent, so the
+            # child neither rolls it back nor closes it
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._in_use -= 1
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """Close every idle connection"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def counts(self) -> Dict[str, int]:
+        """Connections idle and in use now, and opened since the pool started"""
+        with self._lock:
+            return {'idle': len(self._idle), 'in_use': self._in_use, 'opened': self._opened}
+
+
+class PlayerRegistry:
+    """
+    In-process cache of player ids known to exist
+
+    Players are never deleted, so an id stays valid once it has been seen.
+    Ids this process has not seen yet (e.g. players added by another worker)
+    are looked up by primary key and remembered.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids: set[int] = set()
+        # Ids looked up by unknown() that were already known, and that were not
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, player_id: int):
+        with self._lock:
+            self._ids.add(player_id)
+
+    def update(self, player_ids):
+        with self._lock:
+            self._ids.update(player_ids)
+
+    def unknown(self, player_ids: set[int]) -> set[int]:
+        """Return the ids not yet known to exist"""
+        with self._lock:
+            unknown = player_ids - self._ids
+            self.hits += len(player_ids) - len(unknown)
+            self.misses += len(unknown)
+        return unknown
+
+    def invalidate(self):
+        with self._lock:
+            self._ids.clear()
+
+
+class AvalonDB:
+    def __init__(self, config: AvalonDBConfig = None):
+        if config is None:
+            config = AvalonDBConfig()
+        self.data_dir = config.data_dir
+        self.db_path = str(config.db_path)
+        # Statement tracing, or None when it is off
+        self.queries = QueryTracer(config.slow_query_ms) if config.trace_queries else None
+        self.pool = ConnectionPool(self.db_path, config.pool_size, self.queries)
+        self.snapshot_interval = config.snapshot_interval
+        self.state_codec = config.state_codec
+        self.player_registry = PlayerRegistry()
+        self.player_stats = PlayerStats()
+        # Serialized GET responses, dropped by every write to their game
+        self.responses = ResponseCache(config.response_cache_size, config.compress_responses)
+        # Committed game changes are published here for live subscribers
+        self.broker = GameBroker()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        if not config.defer_init:
+            self._ensure_initialized()
+
+    def _state_columns(self, state: ags.GameState) -> Tuple[str, Optional[bytes]]:
+        """Values of games.state and games.state_blob for a snapshot"""
+        if self.state_codec == 'binary':
+            try:
+                return '', encode_state(state)
+            except UnencodableState:
+                pass  # Anything the binary format can't hold is kept as JSON
+        return json.dumps(state), None
+
+    @contextmanager
+    def get_connection(self):
+        """Context manager for pooled database connections"""
+        if not self._initialized:
+            self._ensure_initialized()
+        conn = self.pool.acquire()
+        try:
+            yield conn
+        finally:
+            self.pool.release(conn)
+
+    def close(self):
+        """Close all pooled connections"""
+        self.pool.close()
+
+    def _ensure_initialized(self):
+        """Create the database and apply pending migrations, once per AvalonDB"""
+        with self._init_lock:
+            if self._initialized:
+                return
+            self.data_dir.mkdir(exist_ok=True)
+            conn = self.pool.acquire()
+            try:
+                migrate(conn)
+            finally:
+                self.pool.release(conn)
+            self._initialized = True
+
+    def initialize_database(self):
+        """Bring the schema up to date by applying pending migrations"""
+        with self.get_connection() as conn:
+            migrate(conn)
+
+    # Player operations
+    def add_player(self, name: str) -> Tuple[bool, Optional[int]]:
+        """Add a new player to the database"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                # SQLite assigns MAX(player_id) + 1 inside the insert, so concurrent adds can't collide
+                cursor.execute("INSERT INTO players (name, active) VALUES (?, 1) RETURNING player_id", (name,))
+                player_id = cursor.fetchone()[0]
+                conn.commit()
+                self.player_registry.add(player_id)
+                return True, player_id
+        except sqlite3.IntegrityError:
+            return False, None
+
+    def set_player_active(self, player_id: int, active: bool) -> bool:
+        """Set the active status of a player"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE players SET active = ? WHERE player_id = ?",
+                (1 if active else 0, player_id)
+            )
+            conn.commit()
+            if cursor.rowcount > 0:
+                self.player_registry.add(player_id)
+            return cursor.rowcount > 0
+
+    def get_active_players(self) -> List[Dict]:
+        """Get all active players"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM players WHERE active = 1")
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_player(self, player_id: int) -> Optional[Dict]:
+        """Get player by player_id"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM players WHERE player_id = ?", (player_id,))
+            result = cursor.fetchone()
+            return dict(result) if result else None
+
+    def get_all_players(self) -> List[Dict]:
+        """Get all players"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM players")
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_next_player_id(self) -> int:
+        """Get the next available player ID"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MAX(player_id) FROM players")
+            result = cursor.fetchone()[0]
+            return (result + 1) if result is not None else 1
+
+    def update_player_name(self, player_id: int, name: str) -> bool:
+        """Update a player's name by player_id"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE players SET name = ? WHERE player_id = ?",
+                (name, player_id)
+            )
+            conn.commit()
+            if cursor.rowcount > 0:
+                self.player_registry.add(player_id)
+            return cursor.rowcount > 0
+
+    # Game operations
+    def create_game(self) -> str:
+        """Create a new game with initial state and return its ID"""
+        game_id = str(uuid.uuid4())
+        initial_state = ags.create_initial_game_state()
+        start_time = datetime.datetime.now(datetime.UTC).isoformat()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO games (gameId, state, state_blob, start_time, active) VALUES (?, ?, ?, ?, 0)",
+                (game_id, *self._state_columns(initial_state), start_time)
+            )
+            conn.commit()
+        return game_id
+
+    def set_game_active_status(self, game_id: str, active_status: int) -> bool:
+        """Set the active status of a game"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            # The status is part of the game's representation, so it bumps the version too
+            cursor.execute(
+                "UPDATE games SET active = ?, version = version + 1 WHERE gameId = ? RETURNING version",
+                (active_status, game_id)
+            )
+            result = cursor.fetchone()
+            conn.commit()
+            if result and active_status == GAME_ENDED:
+                self.player_stats.add_game(cursor, game_id)
+            elif result:
+                self.player_stats.discard(game_id)
+        if not result:
+            return False
+        self.responses.discard(game_id)
+        self.broker.publish(game_id, 'status', {'version': result['version'], 'active': active_status})
+        return True
+
+    def list_games(self, limit: Optional[int] = None, cursor: Optional[str] = None,
+                   active: Optional[int] = None, fields: Optional[List[str]] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        List one page of games, newest first
+
+        Args:
+            limit: Maximum number of games to return, or None for all of them
+            cursor: next_cursor from the previous page, or None for the first page
+            active: Only return games with this active status
+            fields: Columns to return, from GAME_LIST_FIELDS; defaults to all but 'state'
+
+        Returns:
+            Tuple[List[Dict], Optional[str]]: The games, and the cursor of the next page if there may be one
+
+        Raises:
+            ValueError: If a field or the cursor is not valid
+        """
+        fields = list(fields) if fields else [f for f in GAME_LIST_FIELDS if f != 'state']
+        unknown = set(fields) - set(GAME_LIST_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        # Keyset columns and what replaying the event log needs are always read
+        columns = set(fields) | {'gameId', 'start_time'}
+        if 'state' in columns:
+            columns |= {'version', 'snapshot_version', 'state_blob'}
+
+        conditions, params = [], []
+        if active is not None:
+            conditions.append("active = ?")
+            params.append(active)
+        if cursor:
+            start_time, separator, game_id = cursor.partition('|')
+            if not separator:
+                raise ValueError("Invalid cursor")
+            conditions.append("(start_time, gameId) < (?, ?)")
+            params.extend((start_time, game_id))
+        query = f"SELECT {', '.join(sorted(columns))} FROM games"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY start_time DESC, gameId DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        with self.get_connection() as conn:
+            db_cursor = conn.cursor()
+            db_cursor.execute(query, params)
+            games = [dict(row) for row in db_cursor.fetchall()]
+            if 'state' in columns:
+                self._replay_events(db_cursor, games)
+
+        next_cursor = None
+        if limit is not None and len(games) == limit:
+            next_cursor = f"{games[-1]['start_time']}|{games[-1]['gameId']}"
+        for game in games:
+            if 'player_ids' in game:
+                game['player_ids'] = json.loads(game['player_ids'])
+            for column in columns.difference(fields).intersection(game):
+                del game[column]
+        return games, next_cursor
+
+    def get_games(self) -> list[dict[str, Any]]:
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT {_GAME_COLUMNS} FROM games ORDER BY start_time DESC")
+            games = [dict(row) for row in cursor.fetchall()]
+            self._replay_events(cursor, games)
+            return games
+
+    def get_game_state(self, game_id: str) -> Optional[Dict]:
+        """Get game by ID, with its state rebuilt from the latest snapshot and event log"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT {_GAME_COLUMNS} FROM games WHERE gameId = ?", (game_id,))
+            result = cursor.fetchone()
+            if result:
+                row = dict(result)
+                self._replay_events(cursor, [row])
+                return row
+            return None
+
+    def get_game_version(self, game_id: str) -> Optional[int]:
+        """Get the current version of a game without loading its state"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT version FROM games WHERE gameId = ?", (game_id,))
+            result = cursor.fetchone()
+            return result['version'] if result else None
+
+    def _replay_events(self, cursor: sqlite3.Cursor, games: List[Dict]):
+        """Decode each game's snapshot and apply the events logged after it, in place"""
+        stale = {}
+        for game in games:
+            game['state'] = _load_state(game['state'], game.pop('state_blob'))
+            if game['version'] > game['snapshot_version']:
+                stale[game['gameId']] = game
+        if stale:
+            placeholders = ', '.join('?' * len(stale))
+            cursor.execute(
+                f"SELECT e.gameId, e.op, e.args FROM game_events e JOIN games g ON g.gameId = e.gameId "
+                f"WHERE e.gameId IN ({placeholders}) AND e.version > g.snapshot_version "
+                f"ORDER BY e.gameId, e.version",
+                tuple(stale)
+            )
+            events: Dict[str, List[Tuple[str, Dict]]] = {}
+            for row in cursor:
+                events.setdefault(row['gameId'], []).append((row['op'], json.loads(row['args'])))
+            for game_id, game_events in events.items():
+                stale[game_id]['state'] = ags.apply_events(stale[game_id]['state'], game_events)
+        for game in games:
+            del game['snapshot_version']
+
+    def update_game_state(self, game_id: str, new_state: ags.GameState,
+                          expected_version: Optional[int] = None) -> tuple[bool, Optional[str]]:
+        """
+        Update game state after validating it
+        
+        Args:
+            game_id: ID of the game to update
+            new_state: New game state to save
+            expected_version: If given, only write if the game is still at this version
+        
+        Returns:
+            tuple[bool, Optional[str]]: (True, None) if update was successful, (False, error_message) if failed.
+            The error is VERSION_CONFLICT if another write got there first.
+        """
+        # Validate the new state before saving
+        is_valid, error_msg = self._validate_state(new_state)
+        if not is_valid:
+            return False, error_msg
+            
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                # A full write is also a snapshot, so earlier events need no replay
+                if expected_version is None:
+                    cursor.execute(
+                        "UPDATE games SET state = ?, state_blob = ?, version = version + 1, "
+                        f"snapshot_version = version + 1, {_SUMMARY_ASSIGNMENTS} WHERE gameId = ? RETURNING version",
+                        (*self._state_columns(new_state), *_summary_params(new_state), game_id)
+                    )
+                else:
+                    cursor.execute(
+                        "UPDATE games SET state = ?, state_blob = ?, version = version + 1, "
+                        f"snapshot_version = version + 1, {_SUMMARY_ASSIGNMENTS} WHERE gameId = ? AND version = ? RETURNING version",
+                        (*self._state_columns(new_state), *_summary_params(new_state), game_id, expected_version)
+                    )
+                result = cursor.fetchone()
+                if not result:
+                    conn.rollback()
+                    return False, self._missing_or_conflict(cursor, game_id)
+                normalized.write_state(cursor, game_id, new_state)
+                conn.commit()
+            self.player_stats.discard(game_id)
+            self.responses.discard(game_id)
+            self.broker.publish(game_id, 'state', {'version': result['version'], 'state': new_state})
+            return True, None
+        except sqlite3.Error as e:
+            return False, f"Database error: {str(e)}"
+
+    def append_game_events(self, game_id: str, events: List[Tuple[str, Dict]],
+                           expected_version: Optional[int] = None,
+                           state: Optional[ags.GameState] = None) -> tuple[bool, Optional[str]]:
+        """
+        Apply mutations to a game and append them to its event log
+
+        Args:
+            game_id: ID of the game to update
+            events: List of (op, kwargs) pairs naming ags.EVENT_OPS mutators
+            expected_version: If given, only append if the game is still at this version
+            state: The game's state at expected_version, if the caller already loaded it,
+                   so it isn't read and replayed again
+
+        Returns:
+            tuple[bool, Optional[str]]: (True, None) if the events were stored, (False, error_message) if not.
+            The error is VERSION_CONFLICT if the game is not at expected_version.
+
+        Each event is stored as one small row instead of rewriting games.state.
+        The state is re-snapshotted once snapshot_interval events have piled up.
+        Without expected_version, appends that lose a race with another writer
+        are retried against the fresh state.
+        """
+        for op, _ in events:
+            if op not in ags.EVENT_OPS:
+                return False, f"Unknown event: {op}"
+        if expected_version is None:
+            if state is not None:
+                raise ValueError("A state passed to append_game_events needs its expected_version")
+            return retry_on_conflict(lambda: self._append_game_events(game_id, events, None, None))
+        return self._append_game_events(game_id, events, expected_version, state)
+
+    def _append_game_events(self, game_id: str, events: List[Tuple[str, Dict]],
+                            expected_version: Optional[int],
+                            state: Optional[ags.GameState]) -> tuple[bool, Optional[str]]:
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                if state is None:
+                    cursor.execute("SELECT * FROM games WHERE gameId = ?", (game_id,))
+                else:
+                    # The version check below proves the caller's state is current
+                    cursor.execute("SELECT version, snapshot_version FROM games WHERE gameId = ?", (game_id,))
+                result = cursor.fetchone()
+                if not result:
+                    return False, "Game not found"
+                game = dict(result)
+                base_version, snapshot_version = game['version'], game['snapshot_version']
+                if expected_version is not None and base_version != expected_version:
+                    return False, VERSION_CONFLICT
+                if state is None:
+                    self._replay_events(cursor, [game])
+                    state = game['state']
+
+                # The stored state is already valid, so only check what each event touched
+                new_state = state
+                states = []
+                for event in events:
+                    new_state = ags.apply_events(new_state, [event])
+                    if new_state is None:
+                        return False, "Invalid event"
+                    is_valid, error_msg = self._validate_state(new_state, event)
+                    if not is_valid:
+                        return False, error_msg
+                    states.append(new_state)
+
+                # Compare-and-swap the version first; it fails fast if another
+                # writer got in since the read above, without any long-held lock
+                version = base_version + len(events)
+                if version - snapshot_version >= self.snapshot_interval:
+                    cursor.execute(
+                        "UPDATE games SET state = ?, state_blob = ?, version = ?, snapshot_version = ?, "
+                        f"{_SUMMARY_ASSIGNMENTS} WHERE gameId = ? AND version = ?",
+                        (*self._state_columns(new_state), version, version, *_summary_params(new_state),
+                         game_id, base_version)
+                    )
+                else:
+                    cursor.execute(
+                        f"UPDATE games SET version = ?, {_SUMMARY_ASSIGNMENTS} WHERE gameId = ? AND version = ?",
+                        (version, *_summary_params(new_state), game_id, base_version)
+                    )
+                if cursor.rowcount == 0:
+                    conn.rollback()
+                    return False, VERSION_CONFLICT
+
+                timestamp = datetime.datetime.now(datetime.UTC).isoformat()
+                cursor.executemany(
+                    "INSERT INTO game_events (gameId, version, op, args, timestamp) VALUES (?, ?, ?, ?, ?)",
+                    [(game_id, base_version + n, op, json.dumps(args), timestamp)
+                     for n, (op, args) in enumerate(events, start=1)]
+                )
+                for state, (op, args) in zip(states, events):
+                    normalized.write_event(cursor, game_id, state, op, args)
+                conn.commit()
+            self.player_stats.discard(game_id)
+            self.responses.discard(game_id)
+            # Subscribers already hold the earlier state, so send just the events
+            self.broker.publish(game_id, 'events', {
+                'version': version,
+                'events': [{'op': op, 'args': args} for op, args in events]
+            })
+            return True, None
+        except sqlite3.Error as e:
+            return False, f"Database error: {str(e)}"
+
+    def backfill_normalized(self, batch_size: int = 500) -> int:
+        """
+        Rebuild the normalized tables of every game from its current state
+
+        Games are processed in gameId order, one write transaction per batch.
+
+        Returns:
+            int: Number of games backfilled
+        """
+        count, last_game_id = 0, ''
+        while True:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                # Lock out writers so no game changes between reading and rewriting it
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute(
+                    "SELECT * FROM games WHERE gameId > ? ORDER BY gameId LIMIT ?",
+                    (last_game_id, batch_size)
+                )
+                games = [dict(row) for row in cursor.fetchall()]
+                if not games:
+                    return count
+                self._replay_events(cursor, games)
+                for game in games:
+                    normalized.delete_game(cursor, game['gameId'])
+                normalized.write_states(cursor, [(game['gameId'], game['state']) for game in games])
+                conn.commit()
+            count += len(games)
+            last_game_id = games[-1]['gameId']
+            self.player_stats.invalidate()
+
+    def get_player_stats(self, player_id: Optional[int] = None) -> Any:
+        """
+        Statistics over every ended game
+
+        Args:
+            player_id: Only return this player's statistics
+
+        Returns:
+            Any: One player's statistics dict, or a list of them for every
+                 player with an ended game if no player_id was given
+        """
+        with self.get_connection() as conn:
+            self.player_stats.refresh(conn.cursor())
+        if player_id is not None:
+            return self.player_stats.get(player_id)
+        return self.player_stats.all()
+
+    def export_records(self, batch_size: int = DEFAULT_EXPORT_BATCH) -> Iterator[Dict]:
+        """
+        Stream every player, then every game followed by its notes
+
+        Rows are read batch_size at a time from a single read transaction, so
+        memory use stays flat however large the database is and the export is
+        a consistent snapshot. The database is in WAL mode, so writes carry on
+        while an export is read. Each record has a 'type' of 'player', 'game' or
+        'note'; games carry their current state. import_records reads them back.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN")
+            for row in cursor.execute("SELECT player_id, name, active FROM players ORDER BY player_id"):
+                yield {'type': 'player', **dict(row)}
+
+            notes = conn.execute("SELECT noteId, gameId, timestamp, content FROM notes ORDER BY gameId, timestamp")
+            note = notes.fetchone()
+            games = conn.execute(
+                "SELECT gameId, start_time, active, version, snapshot_version, state, state_blob "
+                "FROM games ORDER BY gameId"
+            )
+            while batch := [dict(row) for row in games.fetchmany(batch_size)]:
+                self._replay_events(cursor, batch)
+                for game in batch:
+                    yield {'type': 'game', **game}
+                    # Both queries are in gameId order, so notes are merged in as they come
+                    while note is not None and note['gameId'] <= game['gameId']:
+                        if note['gameId'] == game['gameId']:
+                            yield {'type': 'note', **dict(note)}
+                        note = notes.fetchone()
+            conn.rollback()
+
+    def import_records(self, records: Iterable[Dict], batch_size: int = DEFAULT_IMPORT_BATCH) -> Dict[str, int]:
+        """
+        Insert exported players, games and notes, skipping ids that already exist
+
+        The whole import is one transaction, written batch_size records at a
+        time with executemany, so it either fully succeeds or changes nothing.
+        Notes are added to the search index in one pass at the end.
+
+        Args:
+            records: Records as yielded by export_records; a note must come after its game
+            batch_size: Number of records buffered per table between writes
+
+        Returns:
+            Dict[str, int]: Number of players, games and notes inserted
+
+        Raises:
+            ValueError: If a record is malformed, with its 1-based position
+        """
+        counts = {'players': 0, 'games': 0, 'notes': 0}
+        batches: Dict[str, list] = {'player': [], 'game': [], 'note': []}
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                player_ids = {row[0] for row in cursor.execute("SELECT player_id FROM players")}
+                last_note = cursor.execute("SELECT COALESCE(MAX(rowid), 0) FROM notes").fetchone()[0]
+                cursor.execute("DROP TRIGGER IF EXISTS notes_fts_insert")
+                for number, record in enumerate(records, start=1):
+                    try:
+                        kind = record['type']
+                        row = _import_row(kind, record, player_ids)
+                    except (KeyError, TypeError, ValueError) as e:
+                        raise ValueError(f"Record {number}: {e!r}") from e
+                    batch = batches[kind]
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        self._write_import_batches(cursor, batches, counts)
+                self._write_import_batches(cursor, batches, counts)
+                cursor.execute(
+                    "INSERT INTO notes_fts (rowid, content) SELECT rowid, content FROM notes WHERE rowid > ?",
+                    (last_note,)
+                )
+                cursor.execute(NOTES_FTS_INSERT_TRIGGER)
+                conn.commit()
+            except sqlite3.IntegrityError as e:
+                conn.rollback()
+                raise ValueError(f"Import rejected: {e}") from e
+            except BaseException:
+                conn.rollback()
+                raise
+        self.player_registry.update(player_ids)
+        self.player_stats.invalidate()
+        self.responses.invalidate()
+        return counts
+
+    def _write_import_batches(self, cursor: sqlite3.Cursor, batches: Dict[str, list], counts: Dict[str, int]):
+        """Insert and empty the buffered import rows, parents before children"""
+        if batches['player']:
+            cursor.executemany("INSERT OR IGNORE INTO players (player_id, name, active) VALUES (?, ?, ?)",
+                               batches['player'])
+            counts['players'] += cursor.rowcount
+        if batches['game']:
+            # Games also get normalized rows, so find the new ones up front
+            ids = json.dumps([row[0] for row, _ in batches['game']])
+            seen = {row[0] for row in cursor.execute(
+                "SELECT gameId FROM games WHERE gameId IN (SELECT value FROM json_each(?))", (ids,))}
+            new = []
+            for row, state in batches['game']:
+                if row[0] not in seen:
+                    seen.add(row[0])
+                    new.append((row, state))
+            cursor.executemany(
+                "INSERT INTO games (gameId, state, state_blob, start_time, active, version, snapshot_version, "
+                "player_ids, player_count, quests_succeeded, quests_failed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(row[0], *self._state_columns(state), *row[1:]) for row, state in new]
+            )
+            normalized.write_states(cursor, [(row[0], state) for row, state in new])
+            counts['games'] += len(new)
+        if batches['note']:
+            cursor.executemany("INSERT OR IGNORE INTO notes (noteId, gameId, timestamp, content) VALUES (?, ?, ?, ?)",
+                               batches['note'])
+            counts['notes'] += cursor.rowcount
+        for batch in batches.values():
+            batch.clear()
+
+    def _missing_or_conflict(self, cursor: sqlite3.Cursor, game_id: str) -> Optional[str]:
+        """Explain why a versioned UPDATE matched no rows"""
+        cursor.execute("SELECT 1 FROM games WHERE gameId = ?", (game_id,))
+        return VERSION_CONFLICT if cursor.fetchone() else None
+
+    def _validate_state(self, state: ags.GameState, event: Optional[Tuple[str, Dict]] = None) -> tuple[bool, Optional[str]]:
+        """
+        Validate a state, checking only the player ids it references
+
+        Given the (op, args) event that produced the state, only the subtree
+        that event touched is validated.
+        """
+        referenced = ags.get_referenced_player_ids(state, event)
+        unknown = self.player_registry.unknown(referenced)
+        if unknown:
+            placeholders = ', '.join('?' * len(unknown))
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f"SELECT player_id FROM players WHERE player_id IN ({placeholders})",
+                    tuple(unknown)
+                )
+                found = {row['player_id'] for row in cursor.fetchall()}
+            self.player_registry.update(found)
+            referenced -= unknown - found
+        if event:
+            return ags.validate_event(state, *event, referenced)
+        return ags.validate_game_state(state, referenced)
+
+    def get_game_events(self, game_id: str) -> List[Dict]:
+        """Get the full event history of a game, oldest first"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT * FROM game_events WHERE gameId = ? ORDER BY version",
+                (game_id,)
+            )
+            events = [dict(row) for row in cursor.fetchall()]
+            for event in events:
+                event['args'] = json.loads(event['args'])
+            return events
+
+    # Note operations
+    def add_note(self, game_id: str, content: str) -> Optional[str]:
+        """Add a new note and return its ID"""
+        try:
+            note_id = str(uuid.uuid4())
+            timestamp = datetime.datetime.now(datetime.UTC).isoformat()
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "INSERT INTO notes (noteId, gameId, timestamp, content) VALUES (?, ?, ?, ?)",
+                    (note_id, game_id, timestamp, content)
+                )
+                conn.commit()
+            self.broker.publish(game_id, 'note', {'noteId': note_id, 'timestamp': timestamp, 'content': content})
+            return note_id
+        except sqlite3.Error:
+            return None
+
+    def get_game_notes(self, game_id: str) -> List[Dict]:
+        """Get all notes for a specific game"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT * FROM notes WHERE gameId = ? ORDER BY timestamp DESC",
+                (game_id,)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+
+    def search_notes(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT, cursor: Optional[str] = None,
+                     game_id: Optional[str] = None, since: Optional[str] = None,
+                     until: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Full-text search over every note, best matches first
+
+        Args:
+            query: Words that must all appear in a note; 'word*' matches a prefix
+            limit: Maximum number of notes to return
+            cursor: next_cursor from the previous page, or None for the first page
+            game_id: Only search this game's notes
+            since: Only notes written at or after this ISO date or time
+            until: Only notes written before this ISO date or time
+
+        Returns:
+            Tuple[List[Dict], Optional[str]]: The notes, each with a snippet of
+            its content around the matches, and the cursor of the next page if
+            there may be one
+
+        Raises:
+            ValueError: If the query is empty or a date or the cursor is not valid
+        """
+        conditions, params = ["notes_fts MATCH ?"], [_match_expression(query)]
+        if game_id is not None:
+            conditions.append("n.gameId = ?")
+            params.append(game_id)
+        for bound, operator in ((since, '>='), (until, '<')):
+            if bound is not None:
+                datetime.datetime.fromisoformat(bound)
+                conditions.append(f"n.timestamp {operator} ?")
+                params.append(bound)
+        if cursor:
+            rank, separator, note_id = cursor.partition('|')
+            if not separator:
+                raise ValueError("Invalid cursor")
+            conditions.append("(notes_fts.rank, n.noteId) > (?, ?)")
+            params.extend((float(rank), note_id))
+        params.append(limit)
+
+        with self.get_connection() as conn:
+            db_cursor = conn.cursor()
+            db_cursor.execute(f"""
+                SELECT n.noteId, n.gameId, n.timestamp, notes_fts.rank AS rank,
+                       snippet(notes_fts, 0, '<mark>', '</mark>', '…', 16) AS snippet
+                FROM notes_fts JOIN notes n ON n.rowid = notes_fts.rowid
+                WHERE {' AND '.join(conditions)}
+                ORDER BY notes_fts.rank, n.noteId
+                LIMIT ?
+            """, params)
+            notes = [dict(row) for row in db_cursor.fetchall()]
+
+        next_cursor = None
+        if len(notes) == limit:
+            next_cursor = f"{notes[-1]['rank']!r}|{notes[-1]['noteId']}"
+        for note in notes:
+            del note['rank']
+        return notes, next_cursor
+
+    def get_note(self, note_id: str) -> Optional[Dict]:
+        """Get note by ID"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM notes WHERE noteId = ?", (note_id,))
+            result = cursor.fetchone()
+            return dict(result) if result else None
+
+    def delete_note(self, note_id: str) -> bool:
+        """Delete a note by ID"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM notes WHERE noteId = ?", (note_id,))
+                conn.commit()
+                return cursor.rowcount > 0
+        except sqlite3.Error:
+            return False
+
+if __name__ == "__main__":
+    # Set up test environment
+    test_config = AvalonDBConfig(env="test")
+    
+    # Delete existing test database if it exists
+    if test_config.db_path.exists():
+        test_config.db_path.unlink()
+    
+    # Create fresh database
+    db = AvalonDB(test_config)
+    
+    # Add 5 test players; the database assigns their ids
+    test_players = ["Alice Anderson", "Bob Baker", "Carol Chen", "Dave Davis", "Eve Edwards"]
+    
+    print("Adding players...")
+    ids = {}
+    for name in test_players:
+        success, player_id = db.add_player(name)
+        ids[name.split()[0].lower()] = player_id
+        print(f"Added {name} ({player_id}): {'✓' if success else '✗'}")
+    alice, bob, carol, dave, eve = ids.values()
+    
+    # Create a new game
+    game_id = db.create_game()
+    print(f"\nCreated game: {game_id}")
+    
+    # Get initial state
+    game = db.get_game_state(game_id)
+    state = game['state']
+    
+    # First quest - 2 rounds
+    print("\nQuest 1:")
+    state = ags.add_quest(state)
+    
+    # Round 1
+    state = ags.add_round(state, 0, [alice, bob], alice)
+    state = ags.update_approvals(state, 0, 0, [alice, bob, carol])
+    state = ags.update_fails(state, 0, 0, 1)
+    print("Round 1: Failed")
+    
+    # Add note about suspicious behavior
+    db.add_note(game_id, "Quest 1, Round 1: Bob seemed nervous when team was proposed")
+    
+    # Round 2
+    state = ags.add_round(state, 0, [carol, dave], bob)
+    state = ags.update_approvals(state, 0, 1, [alice, bob, carol, dave, eve])
+    state = ags.update_fails(state, 0, 1, 0)
+    print("Round 2: Succeeded")
+    
+    db.add_note(game_id, "Quest 1, Round 2: Eve's confidence in approving this team was notable")
+    
+    # Second quest - 3 rounds
+    print("\nQuest 2:")
+    state = ags.add_quest(state)
+    
+    # Round 1
+    state = ags.add_round(state, 1, [eve, alice, bob], carol)
+    state = ags.update_approvals(state, 1, 0, [bob, carol, dave])
+    state = ags.update_fails(state, 1, 0, 2)
+    print("Round 1: Failed")
+    
+    # Round 2
+    state = ags.add_round(state, 1, [carol, dave, eve], dave)
+    state = ags.update_approvals(state, 1, 1, [alice, dave, eve])
+    state = ags.update_fails(state, 1, 1, 1)
+    print("Round 2: Failed")
+    
+    db.add_note(game_id, "Quest 2: Dave keeps pushing for teams with Eve")
+    
+    # Round 3
+    state = ags.add_round(state, 1, [alice, carol, eve], eve)
+    state = ags.update_approvals(state, 1, 2, [alice, bob, carol, dave, eve])
+    state = ags.update_fails(state, 1, 2, 0)
+    print("Round 3: Succeeded")
+    
+    # After game ends, add roles
+    roles = ["Merlin", "Assassin", "Loyal Servant", "Morgana", "Percival"]
+    for player_id, role in zip(ids.values(), roles):
+        state = ags.add_player(state, player_id, role)
+    
+    # Save final state
+    success, error = db.update_game_state(game_id, state)
+    print(f"\nSaved final state: {'✓' if success else '✗ ' + error}")
+    
+    # Add final notes about the game
+    db.add_note(game_id, "Final thoughts: Dave (Morgana) played well but got too obvious with Eve")
+    db.add_note(game_id, "Bob correctly identified Alice as Merlin - good read on the Quest 2 approval pattern")
+    
+    # Print game summary
+    print("\nGame Summary:")
+    print(f"Number of quests: {len(state['quests'])}")
+    print(f"Number of players: {len(state['players'])}")
+    
+    # Print quest results
+    for quest_idx in range(len(state['quests'])):
+        result = ags.get_quest_result(state, quest_idx)
+        print(f"Quest {quest_idx + 1} result: {'Success' if result else 'Failure'}")
+    
+    # Print all notes
+    print("\nGame Notes:")
+    notes = db.get_game_notes(game_id)
+    notes.sort(key=lambda n: n['timestamp'])
+    for note in notes:
+        print(f"\n[{note['timestamp']}]")
         print(note['content'])
\ No newline at end of file
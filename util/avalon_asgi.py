@@ -0,0 +1,260 @@
+"""
+Serving the Flask app from an asyncio event loop (ASGI)
+
+Ordinary requests are handed to the Flask WSGI app on a bounded thread pool,
+the only place AvalonDB is ever called from, so the pool size caps how many
+requests touch SQLite at once however many connections are open. Event
+streams (stream_game) are served on the loop itself: an idle subscriber is a
+suspended coroutine and a queue rather than a parked thread, so thousands of
+them cost little more than their sockets.
+
+Run with any ASGI server from the repository root, e.g.
+    uvicorn __init__:asgi_app --port 8000
+"""
+import asyncio
+import contextvars
+import io
+import queue
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from werkzeug.exceptions import HTTPException
+
+from util.avalon import AvalonDB
+from util.avalon_pubsub import GameBroker, format_sse
+
+# Bytes of a WSGI response body gathered per trip to the thread pool
+RESPONSE_CHUNK_BYTES = 64 * 1024
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict]]
+Send = Callable[[Dict], Awaitable[None]]
+
+
+class AsyncAvalonDB:
+    """
+    AvalonDB with every method turned into a coroutine
+
+    Calls run on a thread pool of at most `max_workers` threads, so awaiting
+    them never blocks the event loop.
+    """
+
+    def __init__(self, db: AvalonDB, max_workers: Optional[int] = None):
+        self.db = db
+        self.executor = ThreadPoolExecutor(max_workers or max(db.pool.size, 1),
+                                           thread_name_prefix='avalon-db')
+
+    async def run(self, function: Callable, *args, **kwargs) -> Any:
+        """Run any blocking callable on the pool"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(function, *args, **kwargs))
+
+    def __getattr__(self, name: str) -> Callable[..., Awaitable[Any]]:
+        method = getattr(self.db, name)
+        if not callable(method):
+            return method
+        return partial(self.run, method)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.db.close()
+
+
+class _LoopQueue(queue.Queue):
+    """Broker subscription that wakes a coroutine when a frame arrives"""
+
+    def __init__(self, broker: GameBroker, game_id: str, loop: asyncio.AbstractEventLoop, ready: asyncio.Event):
+        super().__init__(broker.max_queue)
+        self._broker = broker
+        self._game_id = game_id
+        self._loop = loop
+        self._ready = ready
+
+    def _put(self, item):
+        super()._put(item)
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            # The loop closed before the stream could unsubscribe. Nothing will
+            # read this queue again, and the writer publishing to it has already
+            # committed, so drop the subscription rather than fail the write
+            self._broker.unsubscribe(self._game_id, self)
+
+
+def _environ(scope: Scope, body: bytes) -> Dict[str, Any]:
+    """WSGI environ of an ASGI HTTP request (PEP 3333)"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+            continue
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+class AvalonASGI:
+    """
+    ASGI application serving a Flask app's routes
+
+    Args:
+        app: The Flask app; its url_map decides which view a request reaches
+        db: The AvalonDB its views use
+        heartbeat_seconds: Idle time after which event streams send a keep-alive comment
+        max_workers: Size of the thread pool running views (default: the connection pool size)
+    """
+
+    def __init__(self, app, db: AvalonDB, heartbeat_seconds: float, max_workers: Optional[int] = None):
+        self.app = app
+        self.db = AsyncAvalonDB(db, max_workers)
+        self.heartbeat_seconds = heartbeat_seconds
+        # Endpoints served on the event loop instead of the pool
+        self.handlers: Dict[str, Callable[..., Awaitable[None]]] = {'stream_game': self._stream_game}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            handler, view_args = self._match(scope)
+            if handler is not None:
+                await handler(scope, receive, send, **view_args)
+            else:
+                await self._wsgi(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    async def _lifespan(self, receive: Receive, send: Send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(None, self.db.close)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _match(self, scope: Scope) -> Tuple[Optional[Callable], Dict[str, Any]]:
+        adapter = self.app.url_map.bind('', script_name=scope.get('root_path') or None)
+        try:
+            endpoint, view_args = adapter.match(scope['path'], scope['method'])
+        except HTTPException:
+            return None, {}  # Let Flask answer it (404, 405, redirects...)
+        return self.handlers.get(endpoint), view_args
+
+    async def _wsgi(self, scope: Scope, receive: Receive, send: Send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        # Every step runs in one context so Flask's request context, pushed
+        # on one pool thread, is still current when a streamed body resumes on another
+        context = contextvars.copy_context()
+        start: List = []
+
+        def start_response(status: str, headers: List[Tuple[str, str]], exc_info=None):
+            start[:] = [status, headers]
+
+        def begin():
+            response = self.app.wsgi_app(_environ(scope, bytes(body)), start_response)
+            return response, iter(response)
+
+        def read(chunks) -> Tuple[bytes, bool]:
+            out = bytearray()
+            for chunk in chunks:
+                out += chunk
+                if len(out) >= RESPONSE_CHUNK_BYTES:
+                    return bytes(out), True
+            return bytes(out), False
+
+        response, chunks = await self.db.run(context.run, begin)
+        try:
+            data, more = await self.db.run(context.run, read, chunks)
+            status, headers = start
+            await send({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            })
+            await send({'type': 'http.response.body', 'body': data, 'more_body': more})
+            while more:
+                data, more = await self.db.run(context.run, read, chunks)
+                await send({'type': 'http.response.body', 'body': data, 'more_body': more})
+        finally:
+            if hasattr(response, 'close'):
+                await self.db.run(context.run, response.close)
+
+    async def _stream_game(self, scope: Scope, receive: Receive, send: Send, game_id: str):
+        """stream_game, without a thread per subscriber"""
+        version = await self.db.get_game_version(game_id)
+        if version is None:
+            return await self._wsgi(scope, receive, send)  # Flask's 404
+
+        ready = asyncio.Event()
+        closed = False
+
+        async def watch_disconnect():
+            nonlocal closed
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            closed = True
+            ready.set()
+
+        broker = self.db.db.broker
+        subscription = broker.subscribe(game_id, _LoopQueue(broker, game_id, asyncio.get_running_loop(), ready))
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream; charset=utf-8'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ],
+            })
+            frame = format_sse('hello', {'version': version})
+            while not closed:
+                await send({'type': 'http.response.body', 'body': frame.encode('utf-8'), 'more_body': True})
+                frame = None
+                while frame is None and not closed:
+                    try:
+                        frame = subscription.get_nowait()
+                    except queue.Empty:
+                        ready.clear()
+                        if not subscription.empty():
+                            continue
+                        try:
+                            await asyncio.wait_for(ready.wait(), self.heartbeat_seconds)
+                        except TimeoutError:
+                            frame = ': heartbeat\n\n'
+        finally:
+            watcher.cancel()
+            broker.unsubscribe(game_id, subscription)
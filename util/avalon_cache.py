@@ -0,0 +1,87 @@
+"""
+In-process cache of serialized game responses
+
+Each game keeps the response body of one version: a write makes that version
+stale, so lookups are by (game id, current version) and a hit never needs the
+game to be read or serialized again. Bodies are optionally kept gzipped too,
+so clients that accept gzip are served without compressing on every request.
+get() and put() say which body they returned, so the caller can tag a gzipped
+one with its own ETag.
+"""
+import gzip
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+DEFAULT_RESPONSE_CACHE_SIZE = 1024
+# Smaller bodies gain little from gzip and are served as they are
+MIN_COMPRESS_BYTES = 1024
+
+# (version, body, gzipped body or None)
+Entry = Tuple[int, bytes, Optional[bytes]]
+
+
+class ResponseCache:
+    """
+    LRU of game response bodies, at most `max_entries` games
+
+    A `max_entries` of 0 disables the cache.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_RESPONSE_CACHE_SIZE, compress: bool = True):
+        self.max_entries = max_entries
+        self.compress = compress
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, Entry] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, game_id: str, version: int, accept_gzip: bool = False) -> Optional[Tuple[bytes, bool]]:
+        """
+        Cached body of a game at a version
+
+        Returns:
+            Optional[Tuple[bytes, bool]]: (body, whether it is gzipped), or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(game_id)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(game_id)
+        _, body, compressed = entry
+        if accept_gzip and compressed is not None:
+            return compressed, True
+        return body, False
+
+    def put(self, game_id: str, version: int, body: bytes, accept_gzip: bool = False) -> Tuple[bytes, bool]:
+        """
+        Store a game's body; a newer version already cached is kept instead
+
+        Returns:
+            Tuple[bytes, bool]: The body to send for this version, as get() would return it
+        """
+        if not self.max_entries:
+            return body, False
+        compressed = None
+        if self.compress and len(body) >= MIN_COMPRESS_BYTES:
+            compressed = gzip.compress(body, compresslevel=6)
+        with self._lock:
+            entry = self._entries.get(game_id)
+            if entry is None or entry[0] <= version:
+                self._entries[game_id] = (version, body, compressed)
+                self._entries.move_to_end(game_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        if accept_gzip and compressed is not None:
+            return compressed, True
+        return body, False
+
+    def discard(self, game_id: str):
+        with self._lock:
+            self._entries.pop(game_id, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,81 @@
+"""
+Maintenance commands for the Avalon database
+
+Run from the repository root, e.g.:
+    python -m util.avalon_cli migrate --env prod
+    python -m util.avalon_cli export -o backup.ndjson
+"""
+import argparse
+import logging
+import sys
+
+from util.avalon import DEFAULT_IMPORT_BATCH, AvalonDB, AvalonDBConfig, from_ndjson, to_ndjson
+from util.avalon_migrations import MIGRATIONS, get_schema_version
+
+
+def migrate(db: AvalonDB, args: argparse.Namespace):
+    # Opening the database already applied any pending migrations
+    with db.get_connection() as conn:
+        version = get_schema_version(conn)
+    print(f'{db.db_path}: schema version {version} of {len(MIGRATIONS)}')
+
+
+def backfill(db: AvalonDB, args: argparse.Namespace):
+    count = db.backfill_normalized(args.batch_size)
+    print(f'Backfilled normalized tables for {count} games')
+
+
+def export(db: AvalonDB, args: argparse.Namespace):
+    output = open(args.output, 'w', encoding='utf-8') if args.output != '-' else sys.stdout
+    try:
+        output.writelines(to_ndjson(db.export_records()))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+def import_(db: AvalonDB, args: argparse.Namespace):
+    source = open(args.input, encoding='utf-8') if args.input != '-' else sys.stdin
+    try:
+        counts = db.import_records(from_ndjson(source), args.batch_size)
+    except ValueError as e:
+        sys.exit(f'Nothing imported: {e}')
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    print(f"Imported {counts['players']} players, {counts['games']} games and {counts['notes']} notes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Avalon database maintenance')
+    parser.add_argument('--env', default='prod', help='Database to use: prod or test')
+    parser.add_argument('--data-dir', default=None, help='Directory holding the database files')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('migrate', help='Apply pending schema migrations').set_defaults(run=migrate)
+
+    backfill_parser = commands.add_parser('backfill', help='Rebuild the normalized quest/round tables of every game')
+    backfill_parser.add_argument('--batch-size', type=int, default=500)
+    backfill_parser.set_defaults(run=backfill)
+
+    export_parser = commands.add_parser('export', help='Write every player, game and note as NDJSON')
+    export_parser.add_argument('--output', '-o', default='-', help='File to write, - for stdout')
+    export_parser.set_defaults(run=export)
+
+    import_parser = commands.add_parser('import', help='Load an NDJSON export, skipping ids that already exist')
+    import_parser.add_argument('input', help='File to read, - for stdin')
+    import_parser.add_argument('--batch-size', type=int, default=DEFAULT_IMPORT_BATCH)
+    import_parser.set_defaults(run=import_)
+
+    args = parser.parse_args()
+    # Show migration progress
+    logging.basicConfig(level=logging.INFO)
+    db = AvalonDB(AvalonDBConfig(env=args.env, data_dir=args.data_dir))
+    try:
+        args.run(db, args)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
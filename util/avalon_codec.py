@@ -0,0 +1,180 @@
+"""
+Compact binary encoding of game states
+
+Player ids are written once, in the roster; every other reference is a seat
+number (index in state['players']). Teams and approvals become bitmasks over
+seats, so each round packs into a fixed-width record:
+
+    flags u8 | king seat u8 | fails i8 | team mask | approvals mask
+
+with masks ceil(players / 8) bytes wide. Lists whose order isn't seat order
+are flagged and their seat order is appended after the quests, so decoding
+returns exactly the state that was encoded. States the format can't hold
+(more than 255 players, references to players not on the roster, unknown
+keys...) raise UnencodableState and should be stored as JSON instead.
+
+    u8 format | u8 players | u8 quests
+    players:  u32 player_id | u8 role length | role (UTF-8)
+    quests:   u8 rounds | round records
+    orders:   u8 count | seats, for each flagged list in round order
+"""
+import struct
+
+import util.avalon_game_state as ags
+
+FORMAT_VERSION = 1
+
+_HAS_APPROVALS = 1
+_HAS_FAILS = 2
+_TEAM_ORDERED = 4
+_APPROVALS_ORDERED = 8
+
+_HEADER = struct.Struct('<BBB')
+_PLAYER = struct.Struct('<IB')
+_ROUND = struct.Struct('<BBb')
+
+_ROUND_KEYS = frozenset({'team', 'approvals', 'fails', 'king'})
+
+# Positions of the set bits of every byte value
+_BYTE_SEATS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+class UnencodableState(ValueError):
+    pass
+
+
+def _check(condition: bool, reason: str):
+    if not condition:
+        raise UnencodableState(reason)
+
+
+def _seat_mask(player_ids: list, seats: dict, orders: list) -> tuple[int, bool]:
+    """Bitmask of a list of player ids, and whether its order had to be saved"""
+    _check(type(player_ids) is list and all(type(player_id) is int for player_id in player_ids),
+           'Player list is not a list of ints')
+    try:
+        listed = [seats[player_id] for player_id in player_ids]
+    except KeyError as e:
+        raise UnencodableState(f'Player {e} is not on the roster') from None
+    mask = 0
+    for seat in listed:
+        mask |= 1 << seat
+    _check(mask.bit_count() == len(listed), 'A player is listed twice')
+    reordered = listed != sorted(listed)
+    if reordered:
+        orders.append(listed)
+    return mask, reordered
+
+
+def encode_state(state: ags.GameState) -> bytes:
+    """
+    Pack a game state into the binary format
+
+    Raises:
+        UnencodableState: If the state has anything the format can't represent
+    """
+    _check(type(state) is dict and state.keys() == {'players', 'quests'}, 'Unexpected state keys')
+    players, quests = state['players'], state['quests']
+    _check(type(players) is list and len(players) < 256, 'Too many players')
+    _check(type(quests) is list and len(quests) < 256, 'Too many quests')
+
+    out = bytearray(_HEADER.pack(FORMAT_VERSION, len(players), len(quests)))
+    seats = {}
+    for seat, player in enumerate(players):
+        _check(type(player) is dict and player.keys() == {'player_id', 'role'}, 'Unexpected player keys')
+        player_id, role = player['player_id'], player['role']
+        _check(type(player_id) is int and 0 <= player_id < 2 ** 32, 'Player id out of range')
+        _check(player_id not in seats, f'Player {player_id} is on the roster twice')
+        _check(type(role) is str, 'Role is not a string')
+        role = role.encode('utf-8')
+        _check(len(role) < 256, 'Role is too long')
+        seats[player_id] = seat
+        out += _PLAYER.pack(player_id, len(role))
+        out += role
+
+    width = max(1, (len(players) + 7) // 8)
+    orders = []
+    for quest in quests:
+        _check(type(quest) is dict and quest.keys() == {'rounds'}, 'Unexpected quest keys')
+        rounds = quest['rounds']
+        _check(type(rounds) is list and len(rounds) < 256, 'Too many rounds')
+        out.append(len(rounds))
+        for round in rounds:
+            _check(type(round) is dict and round.keys() <= _ROUND_KEYS and 'team' in round and 'king' in round,
+                   'Unexpected round keys')
+            king = seats.get(round['king']) if type(round['king']) is int else None
+            _check(king is not None, 'King is not on the roster')
+            flags = 0
+            team, ordered = _seat_mask(round['team'], seats, orders)
+            if ordered:
+                flags |= _TEAM_ORDERED
+            approvals = 0
+            if 'approvals' in round:
+                flags |= _HAS_APPROVALS
+                approvals, ordered = _seat_mask(round['approvals'], seats, orders)
+                if ordered:
+                    flags |= _APPROVALS_ORDERED
+            fails = 0
+            if 'fails' in round:
+                flags |= _HAS_FAILS
+                fails = round['fails']
+                _check(type(fails) is int and -128 <= fails < 128, 'Fails out of range')
+            out += _ROUND.pack(flags, king, fails)
+            out += team.to_bytes(width, 'little')
+            out += approvals.to_bytes(width, 'little')
+
+    for seat_list in orders:
+        out.append(len(seat_list))
+        out += bytes(seat_list)
+    return bytes(out)
+
+
+def decode_state(data: bytes) -> ags.GameState:
+    """Unpack a state written by encode_state"""
+    version, num_players, num_quests = _HEADER.unpack_from(data, 0)
+    if version != FORMAT_VERSION:
+        raise ValueError(f'Unknown game state format {version}')
+    offset = _HEADER.size
+
+    players, roster = [], []
+    for _ in range(num_players):
+        player_id, role_length = _PLAYER.unpack_from(data, offset)
+        offset += _PLAYER.size
+        role = bytes(data[offset:offset + role_length]).decode('utf-8')
+        offset += role_length
+        players.append({'player_id': player_id, 'role': role})
+        roster.append(player_id)
+
+    def seat_ids(mask: bytes) -> list[int]:
+        return [roster[8 * index + bit] for index, byte in enumerate(mask) for bit in _BYTE_SEATS[byte]]
+
+    width = max(1, (num_players + 7) // 8)
+    quests, ordered = [], []
+    for _ in range(num_quests):
+        num_rounds = data[offset]
+        offset += 1
+        rounds = []
+        for _ in range(num_rounds):
+            flags, king, fails = _ROUND.unpack_from(data, offset)
+            offset += _ROUND.size
+            team = data[offset:offset + width]
+            approvals = data[offset + width:offset + 2 * width]
+            offset += 2 * width
+            round = {'team': seat_ids(team)}
+            if flags & _TEAM_ORDERED:
+                ordered.append((round, 'team'))
+            if flags & _HAS_APPROVALS:
+                round['approvals'] = seat_ids(approvals)
+                if flags & _APPROVALS_ORDERED:
+                    ordered.append((round, 'approvals'))
+            if flags & _HAS_FAILS:
+                round['fails'] = fails
+            round['king'] = roster[king]
+            rounds.append(round)
+        quests.append({'rounds': rounds})
+
+    for round, key in ordered:
+        count = data[offset]
+        round[key] = [roster[seat] for seat in data[offset + 1:offset + 1 + count]]
+        offset += 1 + count
+    return {'players': players, 'quests': quests}
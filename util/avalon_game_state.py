@@ -1,22 +1,27 @@
 import logging
-from typing import List, Optional
-from typing_extensions import TypedDict
-from copy import deepcopy
+from typing import Any, Callable, Container, List, Optional, get_args, get_origin
+from typing_extensions import NotRequired, TypedDict, get_type_hints, is_typeddict
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
+QUESTS_TO_WIN = 3
+# The team of a quest's last allowed proposal goes whatever the vote
+MAX_PROPOSALS = 5
+
+# Words marking a role as one of Mordred's servants, e.g. 'Assassin', 'Minion of Mordred'
+EVIL_ROLE_WORDS = ('assassin', 'evil', 'minion', 'mordred', 'morgana', 'oberon')
+
+
 class Player(TypedDict):
     player_id: int  # References players.player_id in SQLite
     role: str   # The game role assigned to the player
 
 class Round(TypedDict):
-    team: List[int]       # List of player player_ids
-    approvals: List[int]  # List of player player_ids who approved
-    fails: int            # Number of fail cards played
-    king: int             # player_id of the player who is king for this round
+    team: List[int]                   # List of player player_ids
+    approvals: NotRequired[List[int]] # List of player player_ids who approved
+    fails: NotRequired[int]           # Number of fail cards played
+    king: int                         # player_id of the player who is king for this round
 
 class Quest(TypedDict):
     rounds: List[Round]
@@ -25,13 +30,86 @@ class GameState(TypedDict):
     players: List[Player]
     quests: List[Quest]
 
-def validate_game_state(state: GameState, valid_player_ids: List[str]) -> tuple[bool, Optional[str]]:
+# Fields holding player_ids that must reference players.player_id, with the
+# noun validation messages use for each
+_PLAYER_REF_FIELDS = {'player_id': 'player', 'king': 'king', 'team': 'team member', 'approvals': 'approval'}
+
+_TYPE_NAMES = {int: 'an int', str: 'a string'}
+
+# A compiled validator takes (value, where, valid_player_ids) and returns an
+# error message, or None if the value is valid. `where` locates the value in
+# messages, e.g. 'Round 1 in Quest 0'.
+Validator = Callable[[Any, str, Container[int]], Optional[str]]
+
+def _compile_field(field: str, hint: Any) -> Validator:
+    label = field.replace('_', ' ').capitalize()
+    is_ref = field in _PLAYER_REF_FIELDS
+    ref_noun = _PLAYER_REF_FIELDS.get(field)
+
+    if get_origin(hint) is list:
+        (item,) = get_args(hint)
+        if is_typeddict(item):
+            check_item = _compile_schema(item)
+            item_label = item.__name__
+
+            def check_nodes(value, where, valid_player_ids):
+                if not isinstance(value, list):
+                    return f'{label} in {where} must be a list'
+                for idx, node in enumerate(value):
+                    node_where = f'{item_label} {idx}' if where == 'State' else f'{item_label} {idx} in {where}'
+                    error = check_item(node, node_where, valid_player_ids)
+                    if error:
+                        return error
+                return None
+            return check_nodes
+
+        def check_ids(value, where, valid_player_ids):
+            if not isinstance(value, list):
+                return f'{label} in {where} must be a list'
+            for player_id in value:
+                if not isinstance(player_id, item):
+                    return f'{label} player_id in {where} must be {_TYPE_NAMES[item]}'
+                if is_ref and player_id not in valid_player_ids:
+                    return f'Invalid {ref_noun} player_id in {where}: {player_id}'
+            return None
+        return check_ids
+
+    def check_scalar(value, where, valid_player_ids):
+        if not isinstance(value, hint):
+            return f'{label} in {where} must be {_TYPE_NAMES[hint]}'
+        if is_ref and value not in valid_player_ids:
+            return f'Invalid {ref_noun} player_id in {where}: {value}'
+        return None
+    return check_scalar
+
+def _compile_schema(schema: type) -> Validator:
+    """Builds a validator for a TypedDict from its annotations, once"""
+    fields = [
+        (field, field in schema.__required_keys__, _compile_field(field, hint))
+        for field, hint in get_type_hints(schema).items()
+    ]
+
+    def check(value, where, valid_player_ids):
+        if not isinstance(value, dict):
+            return f'{where} must be a dictionary'
+        for field, required, check_field in fields:
+            if field not in value:
+                if required:
+                    return f'{where} missing "{field}" field'
+                continue
+            error = check_field(value[field], where, valid_player_ids)
+            if error:
+                return error
+        return None
+    return check
+
+def validate_game_state(state: GameState, valid_player_ids: Container[int]) -> tuple[bool, Optional[str]]:
     """
     Validates that a game state matches the schema and references valid players
 
     Args:
         state: GameState to validate
-        valid_player_ids: List of valid player player_ids to check against
+        valid_player_ids: Container of valid player player_ids to check against
 
     Returns:
         tuple[bool, Optional[str]]: (True, None) if state is valid, (False, error_message) if invalid
@@ -41,147 +119,94 @@ def validate_game_state(state: GameState, valid_player_ids: List[str]) -> tuple[
         when roles are revealed.
         Rounds may have empty approvals list and no fails recorded until voting/quest is complete.
     """
-    logger.debug(f'Validating game state with {len(valid_player_ids)} valid player_ids')
-    
-    # Basic structure validation
-    if not isinstance(state, dict):
-        logger.error('State validation failed: not a dictionary')
-        return False, 'State must be a dictionary'
-    
-    # Add logging for each validation step
-    logger.debug('Checking basic structure...')
-    if 'players' not in state:
-        logger.error('State validation failed: missing players field')
-        return False, 'State missing "players" field'
-    if 'quests' not in state:
-        return False, 'State missing "quests" field'
-        
-    if not isinstance(state['players'], list):
-        return False, 'Players must be a list'
-    if not isinstance(state['quests'], list):
-        return False, 'Quests must be a list'
-    
-    # Convert list to set for O(1) lookups
-    valid_player_ids_set = set(valid_player_ids)
-    logger.debug(f'Valid player IDs set: {valid_player_ids_set}')
-    
-    # Validate players
-    for player_idx, player in enumerate(state['players']):
-        if not isinstance(player, dict):
-            return False, f'Player {player_idx} must be a dictionary'
-        if 'player_id' not in player:
-            return False, f'Player {player_idx} missing "player_id" field'
-        if 'role' not in player:
-            return False, f'Player {player_idx} missing "role" field'
-        if not isinstance(player['player_id'], int):
-            return False, f'Player {player_idx} player_id must be a string'
-        if not isinstance(player['role'], str):
-            return False, f'Player {player_idx} role must be a string'
-        # Note: role can be an empty string
-        if player['player_id'] not in valid_player_ids_set:
-            return False, f'Invalid player player_id: {player['player_id']}'
-    
-    # Validate quests
-    for quest_idx, quest in enumerate(state['quests']):
-        if not isinstance(quest, dict):
-            logger.error(f'Quest {quest_idx} validation failed: not a dictionary')
-            return False, f'Quest {quest_idx} must be a dictionary'
-            
-        if 'rounds' not in quest:
-            logger.error(f'Quest {quest_idx} validation failed: missing rounds')
-            return False, f'Quest {quest_idx} missing "rounds" field'
-            
-        if not isinstance(quest['rounds'], list):
-            logger.error(f'Quest {quest_idx} validation failed: rounds not a list')
-            return False, f'Quest {quest_idx} rounds must be a list'
-            
-        for round_idx, round in enumerate(quest['rounds']):
-            if not isinstance(round, dict):
-                logger.error(f'Round {round_idx} in Quest {quest_idx} validation failed: not a dictionary')
-                return False, f'Round {round_idx} in Quest {quest_idx} must be a dictionary'
-                
-            # Validate required fields
-            if 'team' not in round:
-                logger.error(f'Round {round_idx} in Quest {quest_idx} validation failed: missing team')
-                return False, f'Round {round_idx} in Quest {quest_idx} missing "team" field'
-                
-            if 'king' not in round:
-                logger.error(f'Round {round_idx} in Quest {quest_idx} validation failed: missing king')
-                return False, f'Round {round_idx} in Quest {quest_idx} missing "king" field'
-            
-            # Validate field types
-            if not isinstance(round['team'], list):
-                logger.error(f'Round {round_idx} in Quest {quest_idx} validation failed: team not a list')
-                return False, f'Team in Quest {quest_idx} Round {round_idx} must be a list'
-                
-            if not isinstance(round['king'], int):
-                logger.error(f'Round {round_idx} in Quest {quest_idx} validation failed: king not a string')
-                return False, f'King in Quest {quest_idx} Round {round_idx} must be a string'
-                
-            if round['king'] not in valid_player_ids_set:
-                logger.error(f'Round {round_idx} in Quest {quest_idx} validation failed: invalid king')
-                return False, f'Invalid king player_id in Quest {quest_idx} Round {round_idx}: {round['king']}'
-            
-            # Validate team members exist
-            for player_id in round['team']:
-                if not isinstance(player_id, int):
-                    logger.error(f'Round {round_idx} in Quest {quest_idx} validation failed: team member not an int')
-                    return False, f'Team member player_id in Quest {quest_idx} Round {round_idx} must be an int'
-                if player_id not in valid_player_ids_set:
-                    logger.error(f'Round {round_idx} in Quest {quest_idx} validation failed: invalid team member')
-                    return False, f'Invalid team member player_id in Quest {quest_idx} Round {round_idx}: {player_id}'
-            
-            # Optional fields validation
-            if 'approvals' in round:
-                if not isinstance(round['approvals'], list):
-                    logger.error(f'Round {round_idx} in Quest {quest_idx} validation failed: approvals not a list')
-                    return False, f'Approvals in Quest {quest_idx} Round {round_idx} must be a list'
-                    
-                # Validate approvals exist if present
-                for player_id in round['approvals']:
-                    if not isinstance(player_id, int):
-                        logger.error(f'Round {round_idx} in Quest {quest_idx} validation failed: approval not a string')
-                        return False, f'Approval player_id in Quest {quest_idx} Round {round_idx} must be a string'
-                    if player_id not in valid_player_ids_set:
-                        logger.error(f'Round {round_idx} in Quest {quest_idx} validation failed: invalid approval')
-                        return False, f'Invalid approval player_id in Quest {quest_idx} Round {round_idx}: {player_id}'
-            
-            if 'fails' in round:
-                if not isinstance(round['fails'], int):
-                    logger.error(f'Round {round_idx} in Quest {quest_idx} validation failed: fails not an integer')
-                    return False, f'Fails in Quest {quest_idx} Round {round_idx} must be an integer'
-    
-    logger.debug('Game state validation successful')
+    error = _validate_state(state, 'State', valid_player_ids)
+    if error:
+        logger.error('State validation failed: %s', error)
+        return False, error
     return True, None
 
+def validate_event(state: GameState, op: str, args: dict, valid_player_ids: Container[int]) -> tuple[bool, Optional[str]]:
+    """
+    Validates only the part of a state that one logged mutation produced
+
+    Args:
+        state: GameState returned by applying the event, assumed valid elsewhere
+        op: Name of the EVENT_OPS mutator that was applied
+        args: Keyword arguments it was applied with
+        valid_player_ids: Container of valid player player_ids to check against
+
+    Returns:
+        tuple[bool, Optional[str]]: Same contract as validate_game_state, at a cost
+        independent of the length of the game
+    """
+    validator, node, where = _event_subtree(state, op, args)
+    error = validator(node, where, valid_player_ids)
+    if error:
+        logger.error('Event %s validation failed: %s', op, error)
+        return False, error
+    return True, None
+
+def _event_subtree(state: GameState, op: str, args: dict) -> tuple[Validator, Any, str]:
+    if op == 'add_player':
+        player_idx = len(state['players']) - 1
+        return _validate_player, state['players'][player_idx], f'Player {player_idx}'
+    if op == 'add_quest':
+        quest_idx = len(state['quests']) - 1
+        return _validate_quest, state['quests'][quest_idx], f'Quest {quest_idx}'
+    quest_idx = args['quest_index']
+    rounds = state['quests'][quest_idx]['rounds']
+    round_idx = len(rounds) - 1 if op == 'add_round' else args['round_index']
+    return _validate_round, rounds[round_idx], f'Round {round_idx} in Quest {quest_idx}'
+
+# Validators compiled once from the TypedDicts
+_validate_player = _compile_schema(Player)
+_validate_round = _compile_schema(Round)
+_validate_quest = _compile_schema(Quest)
+_validate_state = _compile_schema(GameState)
+
+# Game states are never mutated in place. Each mutator below returns a new
+# state that copies only the path from the root to the node it changes and
+# shares every other quest, round and player with the state it was given.
+
+def _with_quest(state: GameState, quest_index: int, quest: Quest) -> GameState:
+    quests = list(state['quests'])
+    quests[quest_index] = quest
+    return {**state, 'quests': quests}
+
+def _with_round(state: GameState, quest_index: int, round_index: int, **changes) -> GameState:
+    quest = state['quests'][quest_index]
+    rounds = list(quest['rounds'])
+    rounds[round_index] = {**rounds[round_index], **changes}
+    return _with_quest(state, quest_index, {**quest, 'rounds': rounds})
+
 def create_initial_game_state() -> GameState:
     logger.debug('Creating initial game state')
     state: GameState = {
         'players': [],
         'quests': []
     }
-    logger.debug(f'Created initial state: {state}')
+    logger.debug('Created initial state: %s', state)
     return state
 
 def add_quest(state: GameState) -> GameState:
     logger.debug('Adding new quest')
-    logger.debug(f'Current state before adding quest: {state}')
-    new_state = deepcopy(state)
-    new_state['quests'].append({'rounds': []})
-    logger.debug(f'New state after adding quest: {new_state}')
+    logger.debug('Current state before adding quest: %s', state)
+    new_state: GameState = {**state, 'quests': [*state['quests'], {'rounds': []}]}
+    logger.debug('New state after adding quest: %s', new_state)
     return new_state
 
 def remove_quest(state: GameState, quest_index: int) -> Optional[GameState]:
-    logger.debug(f'Removing quest {quest_index}')
-    logger.debug(f'Current state before removing quest: {state}')
+    logger.debug('Removing quest %s', quest_index)
+    logger.debug('Current state before removing quest: %s', state)
 
     if quest_index < 0 or quest_index >= len(state['quests']):
-        logger.error(f'Invalid quest index: {quest_index}')
+        logger.error('Invalid quest index: %s', quest_index)
         return None
 
-    new_state = deepcopy(state)
-    new_state['quests'].pop(quest_index)
-    logger.debug(f'State after removing quest: {new_state}')
+    quests = list(state['quests'])
+    quests.pop(quest_index)
+    new_state: GameState = {**state, 'quests': quests}
+    logger.debug('State after removing quest: %s', new_state)
     return new_state
 
 def add_round(state: GameState, quest_index: int, team: List[int], king: int) -> Optional[GameState]:
@@ -197,60 +222,60 @@ def add_round(state: GameState, quest_index: int, team: List[int], king: int) ->
     Returns:
         Optional[GameState]: New game state with added round, or None if quest_index is invalid
     """
-    logger.debug(f'Adding round to quest {quest_index} with team {team} and king {king}')
-    logger.debug(f'Current state before adding round: {state}')
+    logger.debug('Adding round to quest %s with team %s and king %s', quest_index, team, king)
+    logger.debug('Current state before adding round: %s', state)
     
     if quest_index < 0 or quest_index >= len(state['quests']):
-        logger.error(f'Invalid quest index: {quest_index}')
+        logger.error('Invalid quest index: %s', quest_index)
         return None
         
-    new_state = deepcopy(state)
     new_round: Round = {
         'team': team,
         'approvals': [],
         'fails': 0,
         'king': king
     }
-    new_state['quests'][quest_index]['rounds'].append(new_round)
-    logger.debug(f'New state after adding round: {new_state}')
+    quest = state['quests'][quest_index]
+    new_state = _with_quest(state, quest_index, {**quest, 'rounds': [*quest['rounds'], new_round]})
+    logger.debug('New state after adding round: %s', new_state)
     return new_state
 
 def remove_round(state: GameState, quest_index: int, round_index: int) -> Optional[GameState]:
-    logger.debug(f'Attempting to remove round {round_index} from quest {quest_index}')
-    logger.debug(f'Current state before removing round: {state}')
+    logger.debug('Attempting to remove round %s from quest %s', round_index, quest_index)
+    logger.debug('Current state before removing round: %s', state)
 
     if quest_index < 0 or quest_index >= len(state['quests']):
-        logger.error(f'Invalid quest index: {quest_index}')
+        logger.error('Invalid quest index: %s', quest_index)
         return None
 
     if round_index < 0 or round_index >= len(state['quests'][quest_index]['rounds']):
-        logger.error(f'Invalid round index: {round_index}')
+        logger.error('Invalid round index: %s', round_index)
         return None
 
-    new_state = deepcopy(state)
-    new_state['quests'][quest_index]['rounds'].pop(round_index)
-    logger.debug(f'State after removing round: {new_state}')
+    quest = state['quests'][quest_index]
+    rounds = list(quest['rounds'])
+    rounds.pop(round_index)
+    new_state = _with_quest(state, quest_index, {**quest, 'rounds': rounds})
+    logger.debug('State after removing round: %s', new_state)
     return new_state
 
 def add_player(state: GameState, player_id: int, role: str = '') -> GameState:
-    logger.debug(f'Adding player {player_id} with role {role}')
-    logger.debug(f'Current state before adding player: {state}')
-    new_state = deepcopy(state)
-    new_state['players'].append({'player_id': player_id, 'role': role})
-    logger.debug(f'New state after adding player: {new_state}')
+    logger.debug('Adding player %s with role %s', player_id, role)
+    logger.debug('Current state before adding player: %s', state)
+    new_state: GameState = {**state, 'players': [*state['players'], {'player_id': player_id, 'role': role}]}
+    logger.debug('New state after adding player: %s', new_state)
     return new_state
 
 def remove_player(state: GameState, player_id: int) -> Optional[GameState]:
-    logger.debug(f'Removing player {player_id}')
-    logger.debug(f'Current state before adding player: {state}')
+    logger.debug('Removing player %s', player_id)
+    logger.debug('Current state before adding player: %s', state)
 
     if player_id not in (player['player_id'] for player in state['players']):
-        logger.error(f'Player {player_id} not in game')
+        logger.error('Player %s not in game', player_id)
         return None
 
-    new_state = deepcopy(state)
-    new_state['players'] = [player for player in state['players'] if player['player_id'] != player_id]
-    logger.debug(f'State after removing player: {new_state}')
+    new_state: GameState = {**state, 'players': [player for player in state['players'] if player['player_id'] != player_id]}
+    logger.debug('State after removing player: %s', new_state)
     return new_state
 
 def update_team(state: GameState, quest_index: int, round_index: int, team: List[int]) -> Optional[GameState]:
@@ -269,36 +294,32 @@ def update_team(state: GameState, quest_index: int, round_index: int, team: List
     if not _validate_indices(state, quest_index, round_index):
         return None
         
-    new_state = deepcopy(state)
-    new_state['quests'][quest_index]['rounds'][round_index]['team'] = team
-    return new_state
+    return _with_round(state, quest_index, round_index, team=team)
 
 def update_approvals(state: GameState, quest_index: int, round_index: int, approvals: List[str]) -> Optional[GameState]:
-    logger.debug(f'Updating approvals for quest {quest_index}, round {round_index}')
-    logger.debug(f'Approval votes: {approvals}')
-    logger.debug(f'Current state before update: {state}')
+    logger.debug('Updating approvals for quest %s, round %s', quest_index, round_index)
+    logger.debug('Approval votes: %s', approvals)
+    logger.debug('Current state before update: %s', state)
     
     if not _validate_indices(state, quest_index, round_index):
-        logger.error(f'Invalid indices: quest={quest_index}, round={round_index}')
+        logger.error('Invalid indices: quest=%s, round=%s', quest_index, round_index)
         return None
         
-    new_state = deepcopy(state)
-    new_state['quests'][quest_index]['rounds'][round_index]['approvals'] = approvals
-    logger.debug(f'New state after updating approvals: {new_state}')
+    new_state = _with_round(state, quest_index, round_index, approvals=approvals)
+    logger.debug('New state after updating approvals: %s', new_state)
     return new_state
 
 def update_fails(state: GameState, quest_index: int, round_index: int, fails: int) -> Optional[GameState]:
-    logger.debug(f'Updating fails for quest {quest_index}, round {round_index}')
-    logger.debug(f'Number of fails: {fails}')
-    logger.debug(f'Current state before update: {state}')
+    logger.debug('Updating fails for quest %s, round %s', quest_index, round_index)
+    logger.debug('Number of fails: %s', fails)
+    logger.debug('Current state before update: %s', state)
     
     if not _validate_indices(state, quest_index, round_index):
-        logger.error(f'Invalid indices: quest={quest_index}, round={round_index}')
+        logger.error('Invalid indices: quest=%s, round=%s', quest_index, round_index)
         return None
         
-    new_state = deepcopy(state)
-    new_state['quests'][quest_index]['rounds'][round_index]['fails'] = fails
-    logger.debug(f'New state after updating fails: {new_state}')
+    new_state = _with_round(state, quest_index, round_index, fails=fails)
+    logger.debug('New state after updating fails: %s', new_state)
     return new_state
 
 def get_current_quest(state: GameState) -> Optional[Quest]:
@@ -334,42 +355,113 @@ def get_quest_result(state: GameState, quest_index: int) -> Optional[bool]:
     """
     Determines if a quest was successful
 
+    A quest is decided by its last round: earlier rounds were voted down.
+    Every round starts with fails: 0, so the latest quest only counts once
+    that round's team has been approved by a majority, or was the quest's
+    last allowed proposal; earlier quests were over before the next one was
+    added. A round without fails recorded hasn't been played.
+
     Args:
         state: Current game state
         quest_index: 0-based index of the quest
 
     Returns:
         Optional[bool]: True if quest succeeded, False if failed, None if quest doesn't exist
-                       or doesn't have a completed round
+                       or hasn't been played yet
     """
     if quest_index < 0 or quest_index >= len(state['quests']):
         return None
-        
-    quest = state['quests'][quest_index]
-    if not quest['rounds']:
+
+    rounds = state['quests'][quest_index]['rounds']
+    if not rounds or get_failures(rounds[-1]) is None:
         return None
-        
-    # Get the last round that was actually completed (has fails recorded)
-    completed_rounds = [r for r in quest['rounds'] if r['fails'] >= 0]
-    if not completed_rounds:
+
+    last_round = rounds[-1]
+    forced = len(rounds) >= MAX_PROPOSALS
+    if quest_index == len(state['quests']) - 1 and not (forced or round_approved(state, last_round)):
         return None
-        
-    last_round = completed_rounds[-1]
-    return last_round['fails'] == 0
+    return get_failures(last_round) == 0
+
+def get_game_summary(state: GameState) -> dict:
+    """
+    Small figures about a game that listings show without loading its state
+
+    Returns:
+        dict: player_ids in the game, player_count, and how many quests
+              have succeeded and failed so far
+    """
+    results = [get_quest_result(state, quest_index) for quest_index in range(len(state['quests']))]
+    player_ids = get_player_ids(state)
+    return {
+        'player_ids': player_ids,
+        'player_count': len(player_ids),
+        'quests_succeeded': results.count(True),
+        'quests_failed': results.count(False)
+    }
+
+def get_game_winner(summary: dict) -> Optional[str]:
+    """
+    'good' once three quests have succeeded, 'evil' once three have failed
+
+    Args:
+        summary: Anything with quests_succeeded and quests_failed counts, such
+                 as get_game_summary's result or a games row
+
+    Returns:
+        Optional[str]: The winning side, or None while neither has won
+    """
+    if summary['quests_succeeded'] >= QUESTS_TO_WIN:
+        return 'good'
+    if summary['quests_failed'] >= QUESTS_TO_WIN:
+        return 'evil'
+    return None
+
+def get_role_side(role: str) -> Optional[str]:
+    """'good' or 'evil' for a revealed role, None while it is still hidden ('')"""
+    if not role:
+        return None
+    role = role.lower()
+    return 'evil' if any(word in role for word in EVIL_ROLE_WORDS) else 'good'
 
 def _validate_indices(state: GameState, quest_index: int, round_index: int) -> bool:
-    logger.debug(f'Validating indices: quest={quest_index}, round={round_index}')
+    logger.debug('Validating indices: quest=%s, round=%s', quest_index, round_index)
     
     if quest_index < 0 or quest_index >= len(state['quests']):
-        logger.error(f'Invalid quest index: {quest_index}')
+        logger.error('Invalid quest index: %s', quest_index)
         return False
     if round_index < 0 or round_index >= len(state['quests'][quest_index]['rounds']):
-        logger.error(f'Invalid round index: {round_index}')
+        logger.error('Invalid round index: %s', round_index)
         return False
         
     logger.debug('Index validation successful')
     return True
 
+def get_referenced_player_ids(state: GameState, event: Optional[tuple[str, dict]] = None) -> set[int]:
+    """
+    Collects every player_id a game state refers to
+
+    Covers players, kings, team members and approvals. Given an (op, args)
+    event, only the part of the state that event produced is scanned.
+    Malformed entries are skipped rather than raising; the validators report those.
+    """
+    referenced = set()
+    node = _event_subtree(state, *event)[1] if event else state
+    _collect_player_ids(node, referenced)
+    return referenced
+
+def _collect_player_ids(node: Any, referenced: set[int]):
+    if isinstance(node, list):
+        for item in node:
+            _collect_player_ids(item, referenced)
+    elif isinstance(node, dict):
+        for key, value in node.items():
+            if key not in _PLAYER_REF_FIELDS:
+                _collect_player_ids(value, referenced)
+            elif isinstance(value, int):
+                referenced.add(value)
+            elif isinstance(value, list):
+                referenced.update(player_id for player_id in value if isinstance(player_id, int))
+
 # Helper functions for getting readable game state
 def get_player_ids(state: GameState) -> List[int]:
     return [player['player_id'] for player in state['players']]
@@ -387,13 +479,14 @@ def get_team(round: Round) -> List[str]:
     return round['team']
 
 def get_approvals(round: Round) -> List[str]:
-    return round['approvals']
+    return round.get('approvals', [])
 
 def round_approved(state: GameState, round: Round) -> bool:
     return len(get_approvals(round)) > len(get_player_ids(state)) // 2
 
-def get_failures(round: Round) -> int:
-    return round['fails']
+def get_failures(round: Round) -> Optional[int]:
+    """Fail cards played on the round's quest, or None if not recorded"""
+    return round.get('fails')
 
 
 # Helper functions for 1-based quest numbers
@@ -404,3 +497,32 @@ def quest_index_to_number(index: int) -> int:
 def quest_number_to_index(number: int) -> int:
     """Converts 1-based quest number to 0-based index"""
     return number - 1
+
+
+# Mutators that can be recorded in a game's event log, by name. Each event is
+# stored as (op, kwargs) and replayed with apply_events.
+EVENT_OPS = {
+    'add_player': add_player,
+    'add_quest': add_quest,
+    'add_round': add_round,
+    'update_approvals': update_approvals,
+    'update_fails': update_fails,
+}
+
+def apply_events(state: GameState, events: List[tuple[str, dict]]) -> Optional[GameState]:
+    """
+    Applies a sequence of logged mutations to a game state
+
+    Args:
+        state: Game state to start from
+        events: List of (op, kwargs) pairs where op is a key of EVENT_OPS
+
+    Returns:
+        Optional[GameState]: The resulting state, or None if any event was rejected
+    """
+    for op, args in events:
+        state = EVENT_OPS[op](state, **args)
+        if state is None:
+            logger.error('Event %s rejected with arguments %s', op, args)
+            return None
+    return state
@@ -0,0 +1,142 @@
+"""
+Probability that each player is evil, from a game's recorded rounds
+
+Every way of choosing the evil players is an integer bitmask over seats,
+bit i being state['players'][i]. An assignment is consistent when every
+round's team holds at least as many evil players as fail cards were played
+(good players cannot fail a quest) and it agrees with any revealed roles.
+Taking every consistent assignment as equally likely, a player's chance of
+being evil is the share of consistent assignments that include them.
+
+The surviving assignments are memoized by the sequence of fail constraints
+seen so far, so recording another round only filters the previous survivors
+instead of enumerating every assignment again.
+"""
+import threading
+from collections import OrderedDict
+from itertools import combinations
+from typing import Dict, Optional, Tuple
+
+import util.avalon_game_state as ags
+
+# Number of evil players for each supported number of players
+EVIL_COUNTS = {5: 2, 6: 2, 7: 3, 8: 3, 9: 3, 10: 4}
+
+DEFAULT_CACHE_SIZE = 1024
+
+# (number of players, number of evil players, known good mask, known evil mask)
+Setup = Tuple[int, int, int, int]
+# (team mask, fails) of each round where fail cards were played, in order
+Constraints = Tuple[Tuple[int, int], ...]
+# Consistent evil-seat masks, and how many of them include each seat
+Survivors = Tuple[Tuple[int, ...], Tuple[int, ...]]
+
+
+def _survivors(num_players: int, masks: Tuple[int, ...]) -> Survivors:
+    return masks, tuple(sum(mask >> seat & 1 for mask in masks) for seat in range(num_players))
+
+
+def _enumerate(setup: Setup) -> Tuple[int, ...]:
+    """Every assignment of the evil seats that agrees with the revealed roles"""
+    num_players, num_evil, good_mask, evil_mask = setup
+    masks = []
+    for seats in combinations(range(num_players), num_evil):
+        mask = sum(1 << seat for seat in seats)
+        if not mask & good_mask and mask & evil_mask == evil_mask:
+            masks.append(mask)
+    return tuple(masks)
+
+
+def get_constraints(state: ags.GameState) -> Tuple[Setup, Constraints]:
+    """
+    Reduce a game state to the bitmasks inference works on
+
+    Raises:
+        ValueError: If the game doesn't have a supported number of players
+    """
+    players = state['players']
+    num_evil = EVIL_COUNTS.get(len(players))
+    if num_evil is None:
+        raise ValueError(f'Role inference needs 5 to 10 players, not {len(players)}')
+
+    seats = {player['player_id']: seat for seat, player in enumerate(players)}
+    good_mask = evil_mask = 0
+    for seat, player in enumerate(players):
+        side = ags.get_role_side(player['role'])
+        if side == 'good':
+            good_mask |= 1 << seat
+        elif side == 'evil':
+            evil_mask |= 1 << seat
+
+    constraints = tuple(
+        (sum(1 << seats[player_id] for player_id in set(round['team']) if player_id in seats), round['fails'])
+        for quest in state['quests']
+        for round in quest['rounds']
+        if round.get('fails', 0) > 0
+    )
+    return (len(players), num_evil, good_mask, evil_mask), constraints
+
+
+class RoleInference:
+    """
+    Memoizing evil-probability calculator shared by every game
+
+    Keeps the surviving assignments of the most recently used constraint
+    prefixes, up to `cache_size` of them.
+    """
+
+    def __init__(self, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[Tuple[Setup, Constraints], Survivors] = OrderedDict()
+
+    def _lookup(self, setup: Setup, constraints: Constraints) -> Tuple[int, Optional[Survivors]]:
+        """Longest cached prefix of the constraints, as (its length, its survivors)"""
+        with self._lock:
+            for known in range(len(constraints), -1, -1):
+                key = (setup, constraints[:known])
+                survivors = self._cache.get(key)
+                if survivors is not None:
+                    self._cache.move_to_end(key)
+                    return known, survivors
+        return 0, None
+
+    def _store(self, key: Tuple[Setup, Constraints], survivors: Survivors):
+        with self._lock:
+            self._cache[key] = survivors
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def consistent_assignments(self, setup: Setup, constraints: Constraints) -> Survivors:
+        """Evil-seat bitmasks satisfying every constraint, with per-seat counts"""
+        known, survivors = self._lookup(setup, constraints)
+        if survivors is None:
+            survivors = _survivors(setup[0], _enumerate(setup))
+            self._store((setup, ()), survivors)
+        for end in range(known + 1, len(constraints) + 1):
+            team, fails = constraints[end - 1]
+            masks = tuple(mask for mask in survivors[0] if (mask & team).bit_count() >= fails)
+            survivors = _survivors(setup[0], masks)
+            self._store((setup, constraints[:end]), survivors)
+        return survivors
+
+    def infer(self, state: ags.GameState) -> Dict:
+        """
+        Posterior probability that each player in a game is evil
+
+        Returns:
+            Dict: evil_count, the number of consistent assignments, and for
+                  each player their player_id and evil_probability (None for
+                  everyone if no assignment fits the recorded rounds)
+
+        Raises:
+            ValueError: If the game doesn't have a supported number of players
+        """
+        setup, constraints = get_constraints(state)
+        masks, evil_counts = self.consistent_assignments(setup, constraints)
+        players = [
+            {'player_id': player['player_id'], 'evil_probability': evil / len(masks) if masks else None}
+            for player, evil in zip(state['players'], evil_counts)
+        ]
+        return {'evil_count': setup[1], 'assignments': len(masks), 'players': players}
@@ -0,0 +1,252 @@
+"""
+Prometheus metrics of the app and its database
+
+Counters and histograms are recorded without taking a lock: an observation
+is appended to the metric's pending queue (deque appends are atomic), and
+pending observations are folded into the totals under the metric's lock only
+every FOLD_EVERY observations, by whichever thread finds the lock free, and
+when the metrics are scraped. Gauges and the counters that other objects
+already keep (connections, cache hits) are read at scrape time.
+
+Served in the Prometheus text format (version 0.0.4) at /metrics. Each
+worker process keeps and serves its own metrics.
+"""
+import abc
+import bisect
+import inspect
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Request and operation latencies, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Pending observations a metric takes before they are folded into its totals
+FOLD_EVERY = 256
+
+# AvalonDB methods left untimed: get_connection only opens a context, close
+# runs at shutdown, and export_records is a generator paced by its consumer
+UNTIMED_DB_METHODS = {'get_connection', 'close', 'export_records'}
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(names: Sequence[str], values: Iterable[str]) -> str:
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return f'{{{pairs}}}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(abc.ABC):
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._pending: deque[Tuple[Labels, float]] = deque()
+        self._series: Dict[Labels, object] = {}
+
+    def _record(self, labels: Labels, value: float):
+        self._pending.append((labels, value))
+        if len(self._pending) >= FOLD_EVERY and self._lock.acquire(blocking=False):
+            try:
+                self._fold()
+            finally:
+                self._lock.release()
+
+    def _fold(self):
+        """Move the pending observations into the totals; the caller holds the lock"""
+        pending = self._pending
+        for _ in range(len(pending)):
+            labels, value = pending.popleft()
+            self._add(labels, value)
+
+    @abc.abstractmethod
+    def _add(self, labels: Labels, value: float):
+        """Fold one observation into the series of its labels"""
+
+    @abc.abstractmethod
+    def _samples(self) -> List[str]:
+        """Exposition lines of every series; the caller holds the lock"""
+
+    def render(self) -> List[str]:
+        with self._lock:
+            self._fold()
+            samples = self._samples()
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}', *samples]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._record(labels, amount)
+
+    def _add(self, labels: Labels, value: float):
+        self._series[labels] = self._series.get(labels, 0) + value
+
+    def _samples(self) -> List[str]:
+        return [f'{self.name}{_label_text(self.labelnames, labels)} {_number(value)}'
+                for labels, value in sorted(self._series.items())]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str):
+        self._record(labels, value)
+
+    def _add(self, labels: Labels, value: float):
+        # [count in each bucket, then above the last, sum of the values]
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def _samples(self) -> List[str]:
+        lines = []
+        bounds = [*map(_number, self.buckets), '+Inf']
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                label_text = _label_text((*self.labelnames, 'le'), (*labels, bound))
+                lines.append(f'{self.name}_bucket{label_text} {cumulative}')
+            label_text = _label_text(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {_number(series[-1])}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+class Collected(Metric):
+    """A metric read from elsewhere when scraped: `collect()` returns {label values: value}"""
+
+    def __init__(self, name: str, help: str, kind: str, labelnames: Sequence[str],
+                 collect: Callable[[], Dict[Labels, float]]):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.collect = collect
+
+    def _add(self, labels: Labels, value: float):
+        raise TypeError(f'{self.name} is read when scraped, not recorded')
+
+    def _samples(self) -> List[str]:
+        return [f'{self.name}{_label_text(self.labelnames, labels)} {_number(value)}'
+                for labels, value in self.collect().items()]
+
+
+class AvalonMetrics:
+    """The metrics of one app and its AvalonDB"""
+
+    def __init__(self):
+        self.requests = Counter(
+            'avalon_http_requests_total', 'HTTP responses by route and status', ('method', 'route', 'status'))
+        self.errors = Counter(
+            'avalon_http_request_errors_total', 'HTTP responses with a 5xx status', ('method', 'route'))
+        self.latency = Histogram(
+            'avalon_http_request_duration_seconds', 'Time to produce an HTTP response', ('method', 'route'))
+        self.db_latency = Histogram(
+            'avalon_db_operation_duration_seconds', 'Time spent in AvalonDB methods', ('operation',))
+        self.db_errors = Counter(
+            'avalon_db_operation_errors_total', 'AvalonDB method calls that raised', ('operation',))
+        self.validation = Histogram(
+            'avalon_game_state_validation_seconds',
+            'Time validating game writes: whole states (update_game_state) or single events (append_game_events)',
+            ('kind',))
+        self.metrics: List[Metric] = [self.requests, self.errors, self.latency, self.db_latency, self.db_errors,
+                                      self.validation]
+
+    def render(self) -> str:
+        return '\n'.join(line for metric in self.metrics for line in metric.render()) + '\n'
+
+    def install(self, app):
+        """Count and time every request of a Flask app"""
+        from flask import g, request
+
+        def start_timer():
+            g.metrics_start = time.perf_counter()
+
+        def record(response):
+            start = g.pop('metrics_start', None)
+            if start is not None:
+                route = request.url_rule.rule if request.url_rule is not None else '(unmatched)'
+                self.latency.observe(time.perf_counter() - start, request.method, route)
+                self.requests.inc(request.method, route, str(response.status_code))
+                if response.status_code >= 500:
+                    self.errors.inc(request.method, route)
+            return response
+
+        # First, so the time includes any before_request hooks registered earlier
+        app.before_request_funcs.setdefault(None, []).insert(0, start_timer)
+        app.after_request(record)
+
+    def instrument(self, db):
+        """Time the public methods and state validation of an AvalonDB, and export its pool and cache counters"""
+        for name, method in inspect.getmembers(db, inspect.ismethod):
+            if not name.startswith('_') and name not in UNTIMED_DB_METHODS:
+                setattr(db, name, self._timed(name, method))
+
+        validate_state = db._validate_state
+
+        def timed_validation(state, event=None):
+            start = time.perf_counter()
+            try:
+                return validate_state(state, event)
+            finally:
+                self.validation.observe(time.perf_counter() - start, 'state' if event is None else 'event')
+
+        db._validate_state = timed_validation
+
+        def connections():
+            counts = db.pool.counts()
+            return {('idle',): counts['idle'], ('in_use',): counts['in_use']}
+
+        def cache_lookups():
+            lookups = {}
+            for cache_name, cache in (('responses', db.responses), ('player_stats', db.player_stats),
+                                      ('player_ids', db.player_registry)):
+                lookups[cache_name, 'hit'] = cache.hits
+                lookups[cache_name, 'miss'] = cache.misses
+            return lookups
+
+        self.metrics += [
+            Collected('avalon_db_connections', 'Pooled SQLite connections by state', 'gauge', ('state',),
+                      connections),
+            Collected('avalon_db_connections_opened_total', 'SQLite connections opened by the pool', 'counter', (),
+                      lambda: {(): db.pool.counts()['opened']}),
+            Collected('avalon_cache_lookups_total', 'In-process cache lookups by result', 'counter',
+                      ('cache', 'result'), cache_lookups),
+        ]
+
+    def _timed(self, name: str, method):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            except BaseException:
+                self.db_errors.inc(name)
+                raise
+            finally:
+                self.db_latency.observe(time.perf_counter() - start, name)
+
+        timed.__name__ = timed.__qualname__ = name
+        timed.__doc__ = method.__doc__
+        return timed
@@ -0,0 +1,290 @@
+"""
+Versioned schema migrations for the Avalon database
+
+The schema version is kept in PRAGMA user_version. MIGRATIONS[n - 1] moves a
+database from version n - 1 to n, and each one runs in its own transaction
+together with the version bump. Migrations must be idempotent: databases
+created before this runner existed already have some of their changes.
+
+To change the schema, append a migration; never edit one that has shipped.
+"""
+import json
+import logging
+import sqlite3
+from typing import Callable, Iterator, List, Tuple
+
+import util.avalon_game_state as ags
+import util.avalon_normalized as normalized
+from util.avalon_codec import decode_state
+
+logger = logging.getLogger(__name__)
+
+# Games whose normalized rows are inserted together while backfilling
+BACKFILL_BATCH_SIZE = 500
+
+
+def _columns(cursor: sqlite3.Cursor, table: str) -> set[str]:
+    return {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+
+
+def _add_column(cursor: sqlite3.Cursor, table: str, column: str, declaration: str):
+    if column not in _columns(cursor, table):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
+def _create_base_tables(cursor: sqlite3.Cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS players (
+            player_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            active INTEGER NOT NULL DEFAULT 1
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS games (
+            gameId TEXT PRIMARY KEY,
+            state TEXT NOT NULL,  -- JSON snapshot as of snapshot_version
+            start_time TEXT NOT NULL,
+            active INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS notes (
+            noteId TEXT PRIMARY KEY,
+            gameId TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            content TEXT NOT NULL,
+            FOREIGN KEY (gameId) REFERENCES games(gameId) ON DELETE CASCADE
+        )
+    """)
+
+
+def _add_event_log(cursor: sqlite3.Cursor):
+    _add_column(cursor, 'games', 'version', "INTEGER NOT NULL DEFAULT 0")
+    _add_column(cursor, 'games', 'snapshot_version', "INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS game_events (
+            gameId TEXT NOT NULL,
+            version INTEGER NOT NULL,  -- games.version after this event
+            op TEXT NOT NULL,          -- Name of an ags.EVENT_OPS mutator
+            args TEXT NOT NULL,        -- JSON keyword arguments
+            timestamp TEXT NOT NULL,
+            PRIMARY KEY (gameId, version),
+            FOREIGN KEY (gameId) REFERENCES games(gameId) ON DELETE CASCADE
+        )
+    """)
+
+
+def _add_game_summaries(cursor: sqlite3.Cursor):
+    # Summary of the current state for listings (see ags.get_game_summary)
+    backfill = 'player_count' not in _columns(cursor, 'games')
+    _add_column(cursor, 'games', 'player_ids', "TEXT NOT NULL DEFAULT '[]'")
+    _add_column(cursor, 'games', 'player_count', "INTEGER NOT NULL DEFAULT 0")
+    _add_column(cursor, 'games', 'quests_succeeded', "INTEGER NOT NULL DEFAULT 0")
+    _add_column(cursor, 'games', 'quests_failed', "INTEGER NOT NULL DEFAULT 0")
+    # Keyset pagination of game listings, optionally by active status
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_games_start_time ON games (start_time DESC, gameId DESC)")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_games_active_start_time ON games (active, start_time DESC, gameId DESC)"
+    )
+    if not backfill:
+        return
+
+    summaries = []
+    for game_id, state, snapshot_version in cursor.execute(
+            "SELECT gameId, state, snapshot_version FROM games").fetchall():
+        events = cursor.execute(
+            "SELECT op, args FROM game_events WHERE gameId = ? AND version > ? ORDER BY version",
+            (game_id, snapshot_version)
+        ).fetchall()
+        state = ags.apply_events(json.loads(state), [(op, json.loads(args)) for op, args in events])
+        summary = ags.get_game_summary(state)
+        summaries.append((json.dumps(summary['player_ids']), summary['player_count'],
+                          summary['quests_succeeded'], summary['quests_failed'], game_id))
+    cursor.executemany(
+        "UPDATE games SET player_ids = ?, player_count = ?, quests_succeeded = ?, quests_failed = ? "
+        "WHERE gameId = ?",
+        summaries
+    )
+
+
+def _add_lookup_indexes(cursor: sqlite3.Cursor):
+    # get_game_notes: WHERE gameId = ? ORDER BY timestamp
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notes_game_timestamp ON notes (gameId, timestamp)")
+    # get_active_players: WHERE active = 1
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_players_active ON players (active)")
+    cursor.execute("ANALYZE")
+
+
+def _add_normalized_tables(cursor: sqlite3.Cursor):
+    # Filled by AvalonDB writes from now on; _backfill_normalized_tables covers older games
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS game_players (
+            gameId TEXT NOT NULL,
+            position INTEGER NOT NULL,  -- Index in state['players']
+            player_id INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            PRIMARY KEY (gameId, position),
+            FOREIGN KEY (gameId) REFERENCES games(gameId) ON DELETE CASCADE
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS quests (
+            gameId TEXT NOT NULL,
+            quest_index INTEGER NOT NULL,
+            PRIMARY KEY (gameId, quest_index),
+            FOREIGN KEY (gameId) REFERENCES games(gameId) ON DELETE CASCADE
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS rounds (
+            gameId TEXT NOT NULL,
+            quest_index INTEGER NOT NULL,
+            round_index INTEGER NOT NULL,
+            king INTEGER NOT NULL,
+            fails INTEGER,  -- NULL if not recorded
+            PRIMARY KEY (gameId, quest_index, round_index),
+            FOREIGN KEY (gameId) REFERENCES games(gameId) ON DELETE CASCADE
+        )
+    """)
+    for table in ('round_team', 'round_approvals'):
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                gameId TEXT NOT NULL,
+                quest_index INTEGER NOT NULL,
+                round_index INTEGER NOT NULL,
+                player_id INTEGER NOT NULL,
+                FOREIGN KEY (gameId) REFERENCES games(gameId) ON DELETE CASCADE
+            )
+        """)
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_round ON {table} (gameId, quest_index, round_index)")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_player ON {table} (player_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_game_players_player ON game_players (player_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_rounds_king ON rounds (king)")
+
+
+# Bulk imports drop this trigger and index the new notes in one statement instead
+NOTES_FTS_INSERT_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+        INSERT INTO notes_fts (rowid, content) VALUES (new.rowid, new.content);
+    END
+"""
+
+
+def _add_notes_search(cursor: sqlite3.Cursor):
+    # External-content index: note text is stored once, in notes, and the
+    # triggers keep the index in step with every insert, update and delete.
+    # The prefix indexes keep 'word*' searches from merging every matching term.
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+            content, content='notes', content_rowid='rowid', tokenize='porter unicode61', prefix='2 3'
+        )
+    """)
+    cursor.execute(NOTES_FTS_INSERT_TRIGGER)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE OF content ON notes BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+            INSERT INTO notes_fts (rowid, content) VALUES (new.rowid, new.content);
+        END
+    """)
+    # Index the notes written before this migration
+    cursor.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+
+
+def _add_state_blob(cursor: sqlite3.Cursor):
+    # Binary-encoded snapshot (util.avalon_codec); games.state is '' when it is set
+    _add_column(cursor, 'games', 'state_blob', "BLOB")
+
+
+def _current_states(cursor: sqlite3.Cursor) -> Iterator[Tuple[str, ags.GameState]]:
+    """Each game's id and its state, from its snapshot and the events logged after it"""
+    events = cursor.connection.cursor()
+    for game_id, state, blob, snapshot_version in cursor.execute(
+            "SELECT gameId, state, state_blob, snapshot_version FROM games ORDER BY gameId"):
+        state = decode_state(blob) if blob is not None else json.loads(state)
+        yield game_id, ags.apply_events(state, [(op, json.loads(args)) for op, args in events.execute(
+            "SELECT op, args FROM game_events WHERE gameId = ? AND version > ? ORDER BY version",
+            (game_id, snapshot_version)
+        )])
+
+
+def _recount_game_summaries(cursor: sqlite3.Cursor):
+    # Quests used to count as decided as soon as a team was proposed for them
+    # (see ags.get_quest_result), so summaries are recounted from each game's
+    # current state
+    summaries = []
+    for game_id, state in _current_states(cursor):
+        summary = ags.get_game_summary(state)
+        summaries.append((summary['quests_succeeded'], summary['quests_failed'], game_id))
+    cursor.executemany("UPDATE games SET quests_succeeded = ?, quests_failed = ? WHERE gameId = ?", summaries)
+
+
+def _backfill_normalized_tables(cursor: sqlite3.Cursor):
+    # Games written before _add_normalized_tables have no rows there, and the
+    # events logged on them since only touched the rows they changed, so the
+    # rows of every game are rebuilt from its current state
+    writes = cursor.connection.cursor()
+    for table in normalized.TABLES:
+        writes.execute(f"DELETE FROM {table}")
+    batch = []
+    for game in _current_states(cursor):
+        batch.append(game)
+        if len(batch) == BACKFILL_BATCH_SIZE:
+            normalized.write_states(writes, batch)
+            batch = []
+    normalized.write_states(writes, batch)
+
+
+MIGRATIONS: List[Callable[[sqlite3.Cursor], None]] = [
+    _create_base_tables,
+    _add_event_log,
+    _add_game_summaries,
+    _add_lookup_indexes,
+    _add_normalized_tables,
+    _add_notes_search,
+    _add_state_blob,
+    _recount_game_summaries,
+    _backfill_normalized_tables,
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Apply every pending migration
+
+    Safe to call from several processes at once: each step takes the write
+    lock and re-reads the version before applying anything.
+
+    Returns:
+        int: The schema version the database is now at
+    """
+    target = len(MIGRATIONS)
+    if get_schema_version(conn) >= target:
+        return get_schema_version(conn)
+
+    cursor = conn.cursor()
+    while True:
+        cursor.execute("BEGIN IMMEDIATE")
+        version = get_schema_version(conn)
+        if version >= target:
+            conn.rollback()
+            return version
+        migration = MIGRATIONS[version]
+        logger.info('Migrating database to schema version %d (%s)', version + 1, migration.__name__)
+        try:
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
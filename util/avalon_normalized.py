@@ -0,0 +1,96 @@
+"""
+Normalized copies of game states for analytics
+
+Each game's state is mirrored into the game_players, quests, rounds,
+round_team and round_approvals tables so questions that span games can be
+answered with indexed SQL instead of decoding every state. AvalonDB writes
+these rows in the same transaction as the state itself: whole states are
+rewritten, logged events only touch the rows they changed.
+"""
+import sqlite3
+
+import util.avalon_game_state as ags
+
+TABLES = ('round_approvals', 'round_team', 'rounds', 'quests', 'game_players')
+
+
+def delete_game(cursor: sqlite3.Cursor, game_id: str):
+    for table in TABLES:
+        cursor.execute(f"DELETE FROM {table} WHERE gameId = ?", (game_id,))
+
+
+def write_state(cursor: sqlite3.Cursor, game_id: str, state: ags.GameState):
+    """Replace every normalized row of a game with the given state"""
+    delete_game(cursor, game_id)
+    write_states(cursor, [(game_id, state)])
+
+
+def write_states(cursor: sqlite3.Cursor, games: list[tuple[str, ags.GameState]]):
+    """Insert the normalized rows of games that have none yet, in bulk"""
+    players, quests, rounds, teams, approvals = [], [], [], [], []
+    for game_id, state in games:
+        players.extend((game_id, position, player['player_id'], player['role'])
+                       for position, player in enumerate(state['players']))
+        for quest_index, quest in enumerate(state['quests']):
+            quests.append((game_id, quest_index))
+            for round_index, round in enumerate(quest['rounds']):
+                key = (game_id, quest_index, round_index)
+                rounds.append((*key, round['king'], round.get('fails')))
+                teams.extend((*key, player_id) for player_id in round['team'])
+                approvals.extend((*key, player_id) for player_id in round.get('approvals', ()))
+    cursor.executemany(
+        "INSERT INTO game_players (gameId, position, player_id, role) VALUES (?, ?, ?, ?)", players)
+    cursor.executemany("INSERT INTO quests (gameId, quest_index) VALUES (?, ?)", quests)
+    cursor.executemany(
+        "INSERT INTO rounds (gameId, quest_index, round_index, king, fails) VALUES (?, ?, ?, ?, ?)", rounds)
+    cursor.executemany(
+        "INSERT INTO round_team (gameId, quest_index, round_index, player_id) VALUES (?, ?, ?, ?)", teams)
+    cursor.executemany(
+        "INSERT INTO round_approvals (gameId, quest_index, round_index, player_id) VALUES (?, ?, ?, ?)", approvals)
+
+
+def write_event(cursor: sqlite3.Cursor, game_id: str, state: ags.GameState, op: str, args: dict):
+    """
+    Update only the rows one logged event changed
+
+    Args:
+        state: The game state right after the event was applied
+        op, args: The event, as stored in game_events
+    """
+    if op == 'add_player':
+        position = len(state['players']) - 1
+        cursor.execute(
+            "INSERT INTO game_players (gameId, position, player_id, role) VALUES (?, ?, ?, ?)",
+            (game_id, position, args['player_id'], args.get('role', ''))
+        )
+    elif op == 'add_quest':
+        cursor.execute(
+            "INSERT INTO quests (gameId, quest_index) VALUES (?, ?)",
+            (game_id, len(state['quests']) - 1)
+        )
+    elif op == 'add_round':
+        quest_index = args['quest_index']
+        key = (game_id, quest_index, len(state['quests'][quest_index]['rounds']) - 1)
+        cursor.execute(
+            "INSERT INTO rounds (gameId, quest_index, round_index, king, fails) VALUES (?, ?, ?, ?, 0)",
+            (*key, args['king'])
+        )
+        cursor.executemany(
+            "INSERT INTO round_team (gameId, quest_index, round_index, player_id) VALUES (?, ?, ?, ?)",
+            [(*key, player_id) for player_id in args['team']]
+        )
+    elif op == 'update_approvals':
+        key = (game_id, args['quest_index'], args['round_index'])
+        cursor.execute(
+            "DELETE FROM round_approvals WHERE gameId = ? AND quest_index = ? AND round_index = ?", key)
+        cursor.executemany(
+            "INSERT INTO round_approvals (gameId, quest_index, round_index, player_id) VALUES (?, ?, ?, ?)",
+            [(*key, player_id) for player_id in args['approvals']]
+        )
+    elif op == 'update_fails':
+        cursor.execute(
+            "UPDATE rounds SET fails = ? WHERE gameId = ? AND quest_index = ? AND round_index = ?",
+            (args['fails'], game_id, args['quest_index'], args['round_index'])
+        )
+    else:
+        raise ValueError(f"No normalized form for event {op}")
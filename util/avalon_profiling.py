@@ -0,0 +1,232 @@
+"""
+Opt-in sampling profiler for individual requests
+
+A request is profiled when it sends the profile header (with the configured
+token) or is picked at random by the sample rate. While it runs, a
+background thread periodically records the Python stack of the request's
+thread. When the request finishes, those samples become its hot functions
+and a flamegraph stack dump. Only the request's own thread is sampled, so
+concurrent requests can be profiled side by side, and a request that is not
+profiled pays for a header lookup and nothing else. cProfile can't do either:
+since Python 3.12 it instruments every thread in the process and only one
+instance can run at a time.
+"""
+import datetime
+import hmac
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+from flask import Flask, request
+
+PROFILE_HEADER = 'X-Avalon-Profile'
+PROFILE_ID_HEADER = 'X-Avalon-Profile-Id'
+# A busy request thread only gives up the GIL every sys.getswitchinterval()
+# (5ms), so sampling more often would not see more stacks
+DEFAULT_SAMPLE_INTERVAL = 0.005
+DEFAULT_TOP_FUNCTIONS = 20
+DEFAULT_MAX_PROFILES = 100
+
+
+class ProfilerConfig:
+    def __init__(self, sample_rate: float = 0.0, header_token: Optional[str] = None,
+                 interval: float = DEFAULT_SAMPLE_INTERVAL, top_functions: int = DEFAULT_TOP_FUNCTIONS,
+                 max_profiles: int = DEFAULT_MAX_PROFILES):
+        # Share of requests profiled at random
+        self.sample_rate = sample_rate
+        # Requests sending PROFILE_HEADER with this value are profiled; None
+        # ignores the header
+        self.header_token = header_token
+        # Seconds between stack samples of a profiled request
+        self.interval = interval
+        # Hot functions kept per profile
+        self.top_functions = top_functions
+        # Finished profiles kept, oldest dropped first
+        self.max_profiles = max_profiles
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or bool(self.header_token)
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Profile:
+    """Stack samples of one request"""
+
+    def __init__(self, profile_id: int, trigger: str, depth: int):
+        self.profile_id = profile_id
+        self.trigger = trigger
+        self.method = request.method
+        self.path = request.full_path.rstrip('?')
+        self.endpoint = request.endpoint
+        self.started = datetime.datetime.now(datetime.UTC).isoformat()
+        self.status = None
+        self.duration_ms = None
+        # Frames above the request's dispatch (server, WSGI plumbing) are left out
+        self.depth = depth
+        # Root-first tuples of code objects -> number of samples
+        self.samples: Counter = Counter()
+        self._start = time.perf_counter()
+
+    def finish(self, status: int):
+        self.duration_ms = (time.perf_counter() - self._start) * 1e3
+        self.status = status
+
+    def summary(self) -> Dict:
+        return {
+            'profile_id': self.profile_id,
+            'trigger': self.trigger,
+            'method': self.method,
+            'path': self.path,
+            'endpoint': self.endpoint,
+            'started': self.started,
+            'status': self.status,
+            'duration_ms': round(self.duration_ms, 3),
+            'samples': sum(self.samples.values()),
+        }
+
+    def hot_functions(self, limit: int) -> List[Dict]:
+        """
+        The `limit` functions most often on the stack
+
+        `self` counts samples taken in the function itself, `total` samples
+        taken in it or anything it called (a recursive function counts once).
+        """
+        own, total = Counter(), Counter()
+        for stack, count in self.samples.items():
+            if stack:
+                own[stack[-1]] += count
+            for code in set(stack):
+                total[code] += count
+        samples = sum(self.samples.values()) or 1
+        return [{
+            'function': _frame_label(code),
+            'self': own[code],
+            'total': count,
+            'self_percent': round(100 * own[code] / samples, 1),
+            'total_percent': round(100 * count / samples, 1),
+        } for code, count in sorted(total.items(), key=lambda item: (-own[item[0]], -item[1]))[:limit]]
+
+    def collapsed_stacks(self) -> str:
+        """The samples in the folded format of flamegraph.pl, speedscope and inferno"""
+        lines = Counter()
+        for stack, count in self.samples.items():
+            lines[';'.join(_frame_label(code) for code in stack) or '(idle)'] += count
+        return ''.join(f"{line} {count}\n" for line, count in sorted(lines.items()))
+
+
+class RequestProfiler:
+    """
+    Profiles requests of a Flask app as its ProfilerConfig asks
+
+    Finished profiles are kept in memory, newest last; a profiled response
+    carries its id in PROFILE_ID_HEADER.
+    """
+
+    def __init__(self, config: Optional[ProfilerConfig] = None):
+        self.config = config or ProfilerConfig()
+        self._profiles: deque[Profile] = deque(maxlen=self.config.max_profiles)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # Thread id -> its request's profile, while the request runs
+        self._active: Dict[int, Profile] = {}
+        self._wake = threading.Event()
+        self._sampler = None
+
+    def install(self, app: Flask):
+        """Register the profiling hooks; a disabled profiler adds none"""
+        if not self.config.enabled:
+            return
+        # Flask runs before_request hooks in registration order, so put this one
+        # first to take in any the app already has
+        app.before_request_funcs.setdefault(None, []).insert(0, self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._abandon)
+
+    def _trigger(self) -> Optional[str]:
+        token = self.config.header_token
+        if token:
+            value = request.headers.get(PROFILE_HEADER)
+            if value is not None and hmac.compare_digest(value, token):
+                return 'header'
+        if self.config.sample_rate and random.random() < self.config.sample_rate:
+            return 'sample'
+        return None
+
+    def _start(self):
+        trigger = self._trigger()
+        if trigger is None:
+            return
+        # Stacks are cut at Flask.full_dispatch_request, which is what calls this
+        frame = sys._getframe(1)
+        while frame is not None and frame.f_code is not Flask.full_dispatch_request.__code__:
+            frame = frame.f_back
+        depth = 0
+        while frame is not None and frame.f_back is not None:
+            depth += 1
+            frame = frame.f_back
+        profile = Profile(next(self._ids), trigger, depth)
+        with self._lock:
+            self._active[threading.get_ident()] = profile
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name='request-profiler', daemon=True)
+                self._sampler.start()
+            self._wake.set()
+
+    def _stop(self, status: int) -> Optional[Profile]:
+        with self._lock:
+            profile = self._active.pop(threading.get_ident(), None)
+        if profile is not None:
+            profile.finish(status)
+            self._profiles.append(profile)
+        return profile
+
+    def _finish(self, response):
+        profile = self._stop(response.status_code)
+        if profile is not None:
+            response.headers[PROFILE_ID_HEADER] = str(profile.profile_id)
+        return response
+
+    def _abandon(self, exc):
+        # Only still active if the request failed before its after_request hooks ran
+        self._stop(500)
+
+    def _sample(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.config.interval)
+            with self._lock:
+                if not self._active:
+                    self._wake.clear()
+                    continue
+                active = list(self._active.items())
+            frames = sys._current_frames()
+            for thread_id, profile in active:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                stack.reverse()
+                with self._lock:
+                    # Skip requests that finished while their stack was being read
+                    if self._active.get(thread_id) is profile:
+                        profile.samples[tuple(stack[profile.depth:])] += 1
+
+    def list_profiles(self) -> List[Dict]:
+        """Summaries of the kept profiles, newest first"""
+        return [profile.summary() for profile in reversed(list(self._profiles))]
+
+    def get_profile(self, profile_id: int) -> Optional[Profile]:
+        for profile in list(self._profiles):
+            if profile.profile_id == profile_id:
+                return profile
+        return None
@@ -0,0 +1,74 @@
+import json
+import queue
+import threading
+from typing import Dict, Optional
+
+
+class GameBroker:
+    """
+    In-process fan-out of committed game changes to live subscribers
+
+    Each subscriber gets its own bounded queue of ready-to-send Server-Sent
+    Events frames, so a change is serialized once however many browsers are
+    watching. A subscriber that falls too far behind has its backlog replaced
+    by a single `resync` event telling it to refetch the game.
+
+    Only subscribers in the same process see a change; with several worker
+    processes each one fans out the writes it handled itself.
+    """
+
+    def __init__(self, max_queue: int = 100):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, set[queue.Queue]] = {}
+
+    def subscribe(self, game_id: str, subscription: Optional[queue.Queue] = None) -> queue.Queue:
+        """
+        Start receiving frames for a game
+
+        A caller that needs to be woken differently (e.g. on an event loop) can
+        pass its own queue; it should be bounded by `max_queue` like the default.
+        """
+        if subscription is None:
+            subscription = queue.Queue(self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(game_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, game_id: str, subscription: queue.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(game_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[game_id]
+
+    def subscriber_count(self, game_id: str) -> int:
+        with self._lock:
+            return len(self._subscribers.get(game_id, ()))
+
+    def publish(self, game_id: str, event: str, data: dict):
+        """Send an event to every subscriber of a game"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(game_id, ()))
+        if not subscribers:
+            return
+        frame = format_sse(event, data)
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(frame)
+            except queue.Full:
+                self._resync(subscription)
+
+    def _resync(self, subscription: queue.Queue):
+        try:
+            while True:
+                subscription.get_nowait()
+        except queue.Empty:
+            pass
+        subscription.put_nowait(format_sse('resync', {}))
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
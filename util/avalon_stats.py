@@ -0,0 +1,280 @@
+"""
+Per-player statistics over every ended game
+
+Counts are computed from the normalized quest/round tables with NumPy: a
+batch of games becomes arrays of (player, game) and (player, round) index
+pairs (seats, kings, team members, approvals) and each statistic is a
+weighted np.bincount over them, so memory grows with the rows read rather
+than with players × rounds. PlayerStats keeps the running totals, so ending
+a game only adds that game's counts instead of recounting the whole history.
+"""
+import sqlite3
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+import util.avalon_game_state as ags
+
+# games.active status of a game that has ended
+GAME_ENDED = 2
+
+# Per-player counters, in the row order of Tally.counts
+COUNTERS = (
+    'games',             # Ended games played
+    'decided_games',     # ... that a side won, with the player's role revealed
+    'wins',              # ... won by the player's side
+    'votes',             # Team votes cast, in rounds whose vote was recorded
+    'approvals',
+    'rejections',
+    'proposals',         # Rounds as king
+    'failed_proposals',  # ... whose team went on the quest and failed it
+    'quests',            # Quests the player went on
+    'failed_quests',     # ... that failed
+)
+
+# Rates reported alongside the counters, as (name, numerator, denominator)
+RATES = (
+    ('win_rate', 'wins', 'decided_games'),
+    ('approval_rate', 'approvals', 'votes'),
+    ('rejection_rate', 'rejections', 'votes'),
+    ('failed_proposal_rate', 'failed_proposals', 'proposals'),
+    ('failed_quest_rate', 'failed_quests', 'quests'),
+)
+
+_SIDES = {'good': 1, 'evil': -1, None: 0}
+
+
+class Tally(NamedTuple):
+    game_ids: List[str]
+    player_ids: np.ndarray   # (players,)
+    counts: np.ndarray       # (len(COUNTERS), players)
+    roles: List[str]
+    role_counts: np.ndarray  # (2, players, roles): decided games, then wins
+
+
+def _columns(cursor: sqlite3.Cursor, sql: str, params: list, count: int) -> np.ndarray:
+    """Integer query results as one array per column"""
+    rows = cursor.execute(sql, params).fetchall()
+    return np.array(rows, dtype=np.int64).reshape(-1, count).T
+
+
+def _unique_pairs(rows: np.ndarray, columns: np.ndarray, n_columns: int) -> tuple[np.ndarray, np.ndarray]:
+    """(row, column) index pairs without duplicates"""
+    keys = np.unique(rows * n_columns + columns)
+    return keys // n_columns, keys % n_columns
+
+
+def tally(cursor: sqlite3.Cursor, game_id: Optional[str] = None) -> Tally:
+    """
+    Count every COUNTERS statistic over ended games
+
+    Reads in a transaction of its own so all queries see the same games.
+
+    Args:
+        cursor: Cursor on a connection with no open transaction
+        game_id: Only count this game (if it has ended)
+
+    Returns:
+        Tally: Counts for each player seen in those games
+    """
+    where, params = "g.active = ?", [GAME_ENDED]
+    if game_id is not None:
+        where += " AND g.gameId = ?"
+        params.append(game_id)
+
+    # Plain tuples, which are much cheaper to fetch in bulk than sqlite3.Row
+    cursor = cursor.connection.cursor()
+    cursor.row_factory = None
+    cursor.execute("BEGIN")
+    try:
+        game_rows = cursor.execute(f"""
+            SELECT g.rowid, g.gameId, g.quests_succeeded, g.quests_failed FROM games g
+            WHERE {where} ORDER BY g.rowid
+        """, params).fetchall()
+        seats = cursor.execute(f"""
+            SELECT g.rowid, p.player_id, p.role FROM game_players p JOIN games g USING (gameId) WHERE {where}
+        """, params).fetchall()
+        # Sorted so a quest's rounds are adjacent and in order
+        round_rowids, round_games, round_quests, round_indices, kings, fails, played, latest = _columns(cursor, f"""
+            SELECT r.rowid, g.rowid, r.quest_index, r.round_index, r.king, COALESCE(r.fails, 0), r.fails IS NOT NULL,
+                   r.quest_index = (SELECT MAX(q.quest_index) FROM quests q WHERE q.gameId = r.gameId)
+            FROM rounds r JOIN games g USING (gameId) WHERE {where}
+            ORDER BY g.rowid, r.quest_index, r.round_index
+        """, params, 8)
+        team_rounds, team_players, approval_rounds, approval_players = (
+            column
+            for table in ('round_team', 'round_approvals')
+            for column in _columns(cursor, f"""
+                SELECT r.rowid, t.player_id FROM {table} t
+                JOIN rounds r USING (gameId, quest_index, round_index) JOIN games g USING (gameId)
+                WHERE {where}
+            """, params, 2)
+        )
+    finally:
+        cursor.connection.rollback()
+
+    # Dense indices: players by id, games and rounds by position in the queries above
+    game_rowids = np.array([row[0] for row in game_rows], dtype=np.int64)
+    seat_games, seat_players = np.array([seat[:2] for seat in seats], dtype=np.int64).reshape(-1, 2).T
+    ids = [seat_players, kings, team_players, approval_players]
+    player_ids, inverse = np.unique(np.concatenate(ids), return_inverse=True)
+    seat_p, king_p, team_p, approval_p = np.split(inverse, np.cumsum([len(a) for a in ids])[:-1])
+    seat_g = np.searchsorted(game_rowids, seat_games)
+    round_g = np.searchsorted(game_rowids, round_games)
+    round_order = np.argsort(round_rowids)
+    team_r = round_order[np.searchsorted(round_rowids, team_rounds, sorter=round_order)]
+    approval_r = round_order[np.searchsorted(round_rowids, approval_rounds, sorter=round_order)]
+
+    n_players, n_games, n_rounds = len(player_ids), len(game_rowids), len(round_rowids)
+    # Each player once per round, and approvals only from players seated in the round's game
+    team_p, team_r = _unique_pairs(team_p, team_r, n_rounds)
+    approval_p, approval_r = _unique_pairs(approval_p, approval_r, n_rounds)
+    seated = np.isin(approval_p * n_games + round_g[approval_r], seat_p * n_games + seat_g)
+    approval_p, approval_r = approval_p[seated], approval_r[seated]
+
+    # As in ags.get_quest_result, the last round of each quest is the team
+    # that went; earlier ones were voted down. In a game's latest quest it
+    # only went once approved by a majority or on the last allowed proposal
+    last_of_quest = np.ones(n_rounds, dtype=bool)
+    last_of_quest[:-1] = (round_g[1:] != round_g[:-1]) | (round_quests[1:] != round_quests[:-1])
+    approved = np.bincount(approval_r, minlength=n_rounds) > np.bincount(seat_g, minlength=n_games)[round_g] // 2
+    forced = round_indices >= ags.MAX_PROPOSALS - 1
+    went = last_of_quest & (played == 1) & ((latest == 0) | approved | forced)
+    failed = went & (fails > 0)
+    # A round's vote is recorded once anyone approved, its quest was played, or
+    # the game moved on to another round; a round still awaiting its vote
+    # counts as neither an approval nor a rejection
+    voted = went | (np.bincount(approval_r, minlength=n_rounds) > 0)
+    voted[:-1] |= round_g[1:] == round_g[:-1]
+    votes_per_game = np.bincount(round_g, weights=voted, minlength=n_games)
+
+    # Outcomes per seat, by the side of the role each player held
+    roles, seat_role = np.unique(np.array([seat[2] for seat in seats], dtype=str), return_inverse=True)
+    role_sides = np.array([_SIDES[ags.get_role_side(role)] for role in roles], dtype=np.int64)
+    winners = np.array([
+        _SIDES[ags.get_game_winner({'quests_succeeded': succeeded, 'quests_failed': failed})]
+        for _, _, succeeded, failed in game_rows
+    ], dtype=np.int64)
+    seat_side = role_sides[seat_role]
+    seat_winner = winners[seat_g]
+    decided = (seat_side != 0) & (seat_winner != 0)
+    won = decided & (seat_side == seat_winner)
+
+    votes = np.bincount(seat_p, weights=votes_per_game[seat_g], minlength=n_players)
+    approvals = np.bincount(approval_p, minlength=n_players)
+    counts = np.stack([
+        np.bincount(seat_p, minlength=n_players),
+        np.bincount(seat_p, weights=decided, minlength=n_players),
+        np.bincount(seat_p, weights=won, minlength=n_players),
+        votes,
+        approvals,
+        votes - approvals,
+        np.bincount(king_p, minlength=n_players),
+        np.bincount(king_p, weights=failed, minlength=n_players),
+        np.bincount(team_p, weights=went[team_r], minlength=n_players),
+        np.bincount(team_p, weights=failed[team_r], minlength=n_players),
+    ]).astype(np.int64)
+
+    role_counts = np.zeros((2, n_players, len(roles)), dtype=np.int64)
+    np.add.at(role_counts[0], (seat_p, seat_role), decided)
+    np.add.at(role_counts[1], (seat_p, seat_role), won)
+    return Tally([row[1] for row in game_rows], player_ids, counts, roles.tolist(), role_counts)
+
+
+def _rate(numerator: int, denominator: int) -> Optional[float]:
+    return numerator / denominator if denominator else None
+
+
+class PlayerStats:
+    """
+    Running per-player totals over ended games
+
+    Starts stale and is rebuilt from the database on first use. Games ending
+    afterwards are added one at a time; a counted game that changes or is
+    reopened makes the totals stale again, to be rebuilt on the next read.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Reads served by the running totals, and reads that had to rebuild them
+        self.hits = 0
+        self.misses = 0
+        self._clear()
+
+    def _clear(self):
+        self._stale = True
+        self._games: set[str] = set()
+        # Indexed by player_id
+        self._counts = np.zeros((len(COUNTERS), 0), dtype=np.int64)
+        self._roles: List[str] = []
+        self._role_counts = np.zeros((2, 0, 0), dtype=np.int64)
+
+    def _add(self, counted: Tally):
+        """Merge a tally into the totals; the caller holds the lock"""
+        size = max(self._counts.shape[1], int(counted.player_ids.max(initial=-1)) + 1)
+        self._roles.extend(role for role in counted.roles if role not in self._roles)
+        if size > self._counts.shape[1] or len(self._roles) > self._role_counts.shape[2]:
+            counts = np.zeros((len(COUNTERS), size), dtype=np.int64)
+            counts[:, :self._counts.shape[1]] = self._counts
+            role_counts = np.zeros((2, size, len(self._roles)), dtype=np.int64)
+            role_counts[:, :self._role_counts.shape[1], :self._role_counts.shape[2]] = self._role_counts
+            self._counts, self._role_counts = counts, role_counts
+
+        self._counts[:, counted.player_ids] += counted.counts
+        columns = [self._roles.index(role) for role in counted.roles]
+        self._role_counts[np.ix_([0, 1], counted.player_ids, columns)] += counted.role_counts
+        self._games.update(counted.game_ids)
+
+    def refresh(self, cursor: sqlite3.Cursor):
+        """Recount every ended game if the totals are stale"""
+        with self._lock:
+            if self._stale:
+                self.misses += 1
+                self._clear()
+                self._add(tally(cursor))
+                self._stale = False
+            else:
+                self.hits += 1
+
+    def add_game(self, cursor: sqlite3.Cursor, game_id: str):
+        """Count a game that just ended"""
+        with self._lock:
+            if not self._stale and game_id not in self._games:
+                self._add(tally(cursor, game_id))
+
+    def discard(self, game_id: str):
+        """Forget a counted game's totals because it changed or was reopened"""
+        with self._lock:
+            if game_id in self._games:
+                self._stale = True
+
+    def invalidate(self):
+        with self._lock:
+            self._stale = True
+
+    def get(self, player_id: int) -> Dict:
+        """Counters, rates and per-role results of one player"""
+        with self._lock:
+            if player_id < self._counts.shape[1]:
+                counts = self._counts[:, player_id].tolist()
+                role_counts = self._role_counts[:, player_id].tolist()
+            else:
+                counts, role_counts = [0] * len(COUNTERS), [[], []]
+            roles = list(self._roles)
+
+        stats = {'player_id': player_id, **dict(zip(COUNTERS, counts))}
+        for name, numerator, denominator in RATES:
+            stats[name] = _rate(stats[numerator], stats[denominator])
+        stats['roles'] = {
+            role: {'games': games, 'wins': wins, 'win_rate': _rate(wins, games)}
+            for role, games, wins in zip(roles, *role_counts)
+            if games
+        }
+        return stats
+
+    def all(self) -> List[Dict]:
+        """Statistics of every player with at least one ended game"""
+        with self._lock:
+            player_ids = np.flatnonzero(self._counts[COUNTERS.index('games')]).tolist()
+        return [self.get(player_id) for player_id in player_ids]
@@ -0,0 +1,282 @@
+"""
+SQL statement tracing for AvalonDB connections
+
+Traced connections report every statement SQLite starts through
+set_trace_callback, with its bound values, and time the calls that run them
+(execute, the fetches that step through its rows, commit). Statements are
+collected per request. A request's summary has its query count and total
+database time, plus the statement shapes it ran repeatedly (N+1 patterns).
+Statements slower than a threshold are logged whether or not a request is
+running.
+
+Bound values can be player names and note text, so statements only leave
+the tracer as their shape (statement_shape): in logs and in reports.
+"""
+import contextvars
+import datetime
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOW_QUERY_MS = 50.0
+# Statement shapes run this many times in one request are reported as repeated
+DEFAULT_REPEAT_THRESHOLD = 3
+DEFAULT_RECENT_REQUESTS = 100
+
+# Quoted strings, numbers and lists of them, so that queries differing only
+# in their values have the same shape
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|\bNULL\b")
+_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+def statement_shape(sql: str) -> str:
+    """A statement with its values replaced by ?"""
+    return _LIST.sub('?', _LITERAL.sub('?', ' '.join(sql.split())))
+
+
+class Statement:
+    __slots__ = ('sql', 'duration', 'label', 'slow')
+
+    def __init__(self, sql: str, label: Optional[str]):
+        self.sql = sql
+        self.duration = 0.0
+        self.label = label
+        self.slow = False
+
+    def to_dict(self) -> Dict:
+        return {'sql': statement_shape(self.sql), 'duration_ms': round(self.duration * 1e3, 3),
+                'request': self.label}
+
+
+class RequestQueries:
+    """Statements run while handling one request"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.statements: List[Statement] = []
+
+
+_current_request: contextvars.ContextVar[Optional[RequestQueries]] = contextvars.ContextVar(
+    'avalon_request_queries', default=None)
+
+
+class QueryTracer:
+    """
+    Collects the statements of traced connections
+
+    Per-request collection is started and finished around each request (see
+    install); statements outside a request only go to the slow statement log.
+    """
+
+    def __init__(self, slow_query_ms: float = DEFAULT_SLOW_QUERY_MS,
+                 repeat_threshold: int = DEFAULT_REPEAT_THRESHOLD, recent: int = DEFAULT_RECENT_REQUESTS):
+        self.slow_query_seconds = slow_query_ms / 1e3
+        self.repeat_threshold = repeat_threshold
+        self._lock = threading.Lock()
+        # Request label -> [requests, statements, seconds, most statements in one request]
+        self._totals: Dict[str, list] = {}
+        self.recent: deque[Dict] = deque(maxlen=recent)
+        self.slow: deque[Statement] = deque(maxlen=recent)
+        self.repeated: deque[Dict] = deque(maxlen=recent)
+
+    def connect(self, db_path: str) -> sqlite3.Connection:
+        """Open a connection whose statements are traced"""
+        conn = sqlite3.connect(db_path, check_same_thread=False, factory=TracedConnection)
+        conn.tracer = self
+        conn.set_trace_callback(conn.started.append)
+        return conn
+
+    def _run(self, conn: 'TracedConnection', call, *args, batch: bool = False) -> Optional[Statement]:
+        """
+        Time a call that starts statements; the time goes to the statement it ran
+
+        Several statements can start in one call: the BEGIN sqlite3 issues
+        before the first write of a transaction, and the statements of any
+        triggers (reported as "-- TRIGGER" comments, and left out here since
+        they are part of the statement that fired them). A `batch` call
+        (executemany) counts as one statement however many rows it ran.
+        """
+        started = conn.started
+        started.clear()
+        start = time.perf_counter()
+        try:
+            call(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            sqls = [sql for sql in started if not sql.startswith('--')]
+            started.clear()
+        if batch:
+            first_of_shape = {}
+            for sql in sqls:
+                first_of_shape.setdefault(statement_shape(sql), sql)
+            sqls = list(first_of_shape.values())
+        if not sqls:
+            return None
+        request_queries = _current_request.get()
+        label = request_queries.label if request_queries is not None else None
+        statements = [Statement(sql, label) for sql in sqls]
+        if request_queries is not None:
+            request_queries.statements.extend(statements)
+        self._add_time(statements[-1], elapsed)
+        return statements[-1]
+
+    def _add_time(self, statement: Statement, seconds: float):
+        statement.duration += seconds
+        if not statement.slow and statement.duration >= self.slow_query_seconds:
+            statement.slow = True
+            self.slow.append(statement)
+            logger.warning('Slow statement (%.1fms) in %s: %s', statement.duration * 1e3,
+                           statement.label or 'no request', statement_shape(statement.sql))
+
+    def start_request(self, label: str) -> contextvars.Token:
+        return _current_request.set(RequestQueries(label))
+
+    def finish_request(self, token: contextvars.Token, path: str, status: int) -> Dict:
+        """Stop collecting a request's statements; returns its summary"""
+        request_queries = _current_request.get()
+        _current_request.reset(token)
+        statements = request_queries.statements
+        seconds = sum(statement.duration for statement in statements)
+        shapes = Counter(statement_shape(statement.sql) for statement in statements)
+        repeated = [{'sql': shape, 'count': count} for shape, count in shapes.items()
+                    if count >= self.repeat_threshold]
+        summary = {
+            'request': request_queries.label,
+            'path': path,
+            'status': status,
+            'time': datetime.datetime.now(datetime.UTC).isoformat(),
+            'queries': len(statements),
+            'db_ms': round(seconds * 1e3, 3),
+            'repeated': repeated,
+        }
+        with self._lock:
+            totals = self._totals.setdefault(request_queries.label, [0, 0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += len(statements)
+            totals[2] += seconds
+            totals[3] = max(totals[3], len(statements))
+        self.recent.append(summary)
+        if repeated:
+            self.repeated.append(summary)
+        return summary
+
+    def install(self, app):
+        """Collect the statements of each request of a Flask app, and report them in a Server-Timing header"""
+        from flask import g, request
+
+        @app.before_request
+        def _start_queries():
+            rule = request.url_rule.rule if request.url_rule is not None else '(unmatched)'
+            g.queries_token = self.start_request(f'{request.method} {rule}')
+
+        @app.after_request
+        def _finish_queries(response):
+            token = g.pop('queries_token', None)
+            if token is not None:
+                summary = self.finish_request(token, request.full_path.rstrip('?'), response.status_code)
+                response.headers.add('Server-Timing', f'db;dur={summary["db_ms"]};desc="{summary["queries"]} queries"')
+            return response
+
+        @app.teardown_request
+        def _drop_queries(exc):
+            # Only left if the request failed before its after_request hooks ran
+            token = g.pop('queries_token', None)
+            if token is not None:
+                _current_request.reset(token)
+
+    def report(self) -> Dict:
+        """Per-request-route totals, slowest first, with the recent slow statements and repeated queries"""
+        with self._lock:
+            totals = {label: list(values) for label, values in self._totals.items()}
+        routes = [{
+            'request': label,
+            'requests': requests,
+            'queries': queries,
+            'queries_per_request': round(queries / requests, 2),
+            'max_queries': max_queries,
+            'db_ms': round(seconds * 1e3, 3),
+            'db_ms_per_request': round(seconds * 1e3 / requests, 3),
+        } for label, (requests, queries, seconds, max_queries) in totals.items()]
+        routes.sort(key=lambda route: -route['db_ms'])
+        return {
+            'slow_query_ms': self.slow_query_seconds * 1e3,
+            'repeat_threshold': self.repeat_threshold,
+            'routes': routes,
+            'slow': [statement.to_dict() for statement in reversed(list(self.slow))],
+            'repeated': list(reversed(list(self.repeated))),
+            'recent': list(reversed(list(self.recent))),
+        }
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor charging the time of its fetches to the statement it ran last"""
+
+    _statement: Optional[Statement] = None
+
+    def execute(self, sql, parameters=()):
+        self._statement = self.connection.tracer._run(self.connection, super().execute, sql, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._statement = self.connection.tracer._run(self.connection, super().executemany, sql, seq_of_parameters,
+                                                         batch=True)
+        return self
+
+    def executescript(self, sql_script):
+        self._statement = self.connection.tracer._run(self.connection, super().executescript, sql_script)
+        return self
+
+    def _fetch(self, call, *args):
+        start = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            if self._statement is not None:
+                self.connection.tracer._add_time(self._statement, time.perf_counter() - start)
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+    def __next__(self):
+        return self._fetch(super().__next__)
+
+
+class TracedConnection(sqlite3.Connection):
+    """Connection whose statements, commits and rollbacks are timed by its QueryTracer"""
+
+    tracer: QueryTracer
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Statements SQLite started during the current call, from the trace callback
+        self.started: List[str] = []
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def commit(self):
+        self.tracer._run(self, super().commit)
+
+    def rollback(self):
+        self.tracer._run(self, super().rollback)